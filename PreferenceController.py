@@ -9,8 +9,24 @@
 import os
 import objc
 from objc import YES, NO
-from Foundation import *  # noqa
-from AppKit import *  # noqa
+from Foundation import (
+    NSHeight,
+    NSMaxY,
+    NSMinX,
+    NSMutableArray,
+    NSMutableDictionary,
+    NSSortDescriptor,
+    NSUserDefaults,
+    NSWidth,
+)
+from AppKit import (
+    NSImage,
+    NSMenuItem,
+    NSOpenPanel,
+    NSToolbar,
+    NSToolbarItem,
+    NSWindowController,
+)
 
 
 def comparable_version(version_string):
@@ -127,6 +143,8 @@ class PreferenceController(NSWindowController):
             }
         self.sud.setObject_forKey_(self._helper_apps, "helper_apps")
 
+        # Setting them posted NSUserDefaultsDidChangeNotification, on
+        # which the app delegate swaps in a new settings snapshot
         self.sud.synchronize()
 
     @objc.IBAction
@@ -6,14 +6,33 @@
 #  Copyright (c) 2004 Zope Foundation and Contributors.
 #
 
+import objc
 from objc import YES, NO
 from PyObjCTools import AppHelper
-from Foundation import *  # noqa
-from AppKit import *  # noqa
-from ZopeDocument import ZopeDocument, __version__
-from PreferenceController import PreferenceController
-
-import os
+from Foundation import (
+    NSBundle,
+    NSDefaultRunLoopMode,
+    NSDictionary,
+    NSLog,
+    NSNotFound,
+    NSNotificationCenter,
+    NSObject,
+    NSRunLoop,
+    NSTimer,
+    NSUserDefaults,
+    NSUserDefaultsDidChangeNotification,
+)
+from AppKit import (
+    NSApplication,
+    NSApplicationDelegateReplySuccess,
+    NSRunAlertPanel,
+    NSWorkspace,
+)
+from ZopeDocument import CocoaUI, UserDefaultsSettings, __version__
+from zem.metrics import metrics
+from zem.manager import EditManager
+from zem.profiling import profiler
+from zem.settings import LiveSettings
 
 
 def iterNSIndexSet(s):
@@ -36,25 +55,41 @@ class ZemAppDelegate(NSObject):
     window = objc.IBOutlet()
 
     def updateIfModified_(self, timer):
-        timerUser = timer.userInfo()
-        for doc in timerUser.current_edits_data:
-            mtime = os.path.getmtime(doc.getContentFile())
-
-            if mtime != doc.last_mtime:
-                # File was modified
-                self.sync_spinner.startAnimation_(self)
-                doc.putChanges()
-                self.sync_spinner.stopAnimation_(self)
-                self.sync_message.setStringValue_(
-                    "Last synched: %s"
-                    % NSDate.date().descriptionWithCalendarFormat_timeZone_locale_(
-                        "%a, %d %b %Y at %H:%M:%S %p", None, None
-                    )
-                )
-                doc.last_mtime = mtime
-
+        with profiler.section("updateIfModified:"):
+            timer.userInfo().manager.tick()
         return 1
 
+    def defaultsChanged_(self, notification):
+        """Take one new settings snapshot for a burst of changed defaults"""
+        NSObject.cancelPreviousPerformRequestsWithTarget_selector_object_(
+            self, "reloadSettings:", None
+        )
+        self.performSelector_withObject_afterDelay_("reloadSettings:", None, 0.0)
+
+    def reloadSettings_(self, sender):
+        self.settings.reload()
+        self.manager.settingsChanged()
+        self.scheduleTick()
+
+    def scheduleTick(self):
+        """Call manager.tick() every save_interval, restarting on a change"""
+        interval = self.manager.saveInterval()
+        if self.timer is not None:
+            if self.timer.timeInterval() == interval:
+                return
+            self.timer.invalidate()
+        self.timer = (
+            NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(
+                interval, self, "updateIfModified:", self, YES
+            )
+        )
+        NSRunLoop.currentRunLoop().addTimer_forMode_(self.timer, NSDefaultRunLoopMode)
+
+    def runOnMainThread_(self, call):
+        """Run a call posted by the sync manager from another thread"""
+        fn, args = call
+        fn(*args)
+
     @objc.IBAction
     def performClose_(self, sender):
         keyWindow = NSApplication.sharedApplication().keyWindow()
@@ -65,6 +100,8 @@ class ZemAppDelegate(NSObject):
     @objc.IBAction
     def showPreferencePanel_(self, sender):
         if self.preferenceController is None:
+            from PreferenceController import PreferenceController
+
             self.preferenceController = PreferenceController.alloc().init()
         self.preferenceController.showWindow_(self)
 
@@ -74,11 +111,23 @@ class ZemAppDelegate(NSObject):
         """
         NSLog("Opening Application")
 
-        zopeDoc = ZopeDocument(filename)
-        zopeDoc.removeFileIfNecessary(filename)
-        self.current_edits_data.append(zopeDoc)
-        self.current_edits.reloadData()
-        return self.openDocument_(zopeDoc)
+        with profiler.section("application:openFile:"):
+            zopeDoc = self.manager.openDocument(filename)
+            return self.openDocument_(zopeDoc)
+
+    def application_openFiles_(self, app, filenames):
+        """
+        Invoked by NSApplication with every file opened at once, e.g. a
+        batch of objects from the ZMI.  They are locked in parallel
+        before the editors are launched.
+        """
+        NSLog("Opening %d files" % len(filenames))
+
+        with profiler.section("application:openFiles:"):
+            docs = self.manager.openDocuments(list(filenames))
+            for zopeDoc in docs:
+                self.startEditing_(zopeDoc)
+        app.replyToOpenOrPrint_(NSApplicationDelegateReplySuccess)
 
     @objc.IBAction
     def gotoEdit_(self, sender):
@@ -89,30 +138,23 @@ class ZemAppDelegate(NSObject):
 
     @objc.IBAction
     def openDocument_(self, zopeDoc):
-        if self.sud.boolForKey_("use_locks"):
-            if zopeDoc.metadata.get("lock-token"):
-                if (
-                    self.sud.boolForKey_("always_borrow_locks")
-                    or zopeDoc.metadata.get("borrow_lock")
-                    or NSRunAlertPanel(
-                        "Borrow Lock?",
-                        "This object is already locked by"
-                        " you in another session. Do you want"
-                        " to borrow this lock and continue?",
-                        "Yes",
-                        "Cancel",
-                        None,
-                    )
-                ):
-                    zopeDoc.lock_token = (
-                        "opaquelocktoken:%s" % zopeDoc.metadata["lock-token"]
-                    )
-            else:
-                self.finishEdits_()
+        if not self.manager.lockDocument(zopeDoc):
+            # Declined to borrow somebody's lock, so we're done with it
+            self.manager.closeDocument(zopeDoc)
+            return NO
+        return self.startEditing_(zopeDoc)
 
-        if self.sud.boolForKey_("use_locks"):
-            zopeDoc.lock()
+    def startEditing_(self, zopeDoc):
+        """
+        Launch the editor, once the body has been downloaded for .zem
+        files that came without one
+        """
+        if zopeDoc.bodyPending():
+            self.manager.fetchBody(zopeDoc)  # CocoaUI.bodyFetched launches it
+            return YES
+        return self.launchEditor_(zopeDoc)
 
+    def launchEditor_(self, zopeDoc):
         editor = zopeDoc.getEditor()
         content_file = zopeDoc.getContentFile()
         return self.ws.openFile_withApplication_andDeactivate_(
@@ -128,7 +170,7 @@ class ZemAppDelegate(NSObject):
         selected = self.current_edits.numberOfSelectedRows()
         if selected:
             perform = True
-            if self.sud.boolForKey_("confirm_on_finish"):
+            if self.settings.getBool("confirm_on_finish"):
                 if selected == 1:
                     msg = "Are you sure you're finished with this object?"
                 else:
@@ -136,16 +178,18 @@ class ZemAppDelegate(NSObject):
                         selected
                     )
                 perform = NSRunAlertPanel("Deleting Entry", msg, "Yes", "Cancel", None)
-            for row in iterNSIndexSet(self.current_edits.selectedRowIndexes()):
-                del self.current_edits_data[row]
-                self.current_edits.reloadData()
+            if perform:
+                rows = iterNSIndexSet(self.current_edits.selectedRowIndexes())
+                docs = [self.current_edits_data[row] for row in rows]
+                # One pass through the registry and one table update,
+                # then the locks are released all at once
+                self.manager.releaseDocuments(docs)
 
     def numberOfRowsInTableView_(self, tableView):
         return len(self.current_edits_data)
 
     def tableView_objectValueForTableColumn_row_(self, tableView, aColumn, aRow):
-        ident = aColumn.identifier()
-        return getattr(self.current_edits_data[aRow], "get" + ident)()
+        return self.current_edits_data.value(aRow, aColumn.identifier())
 
     def tableViewSelectionDidChange_(self, aNotification):
         if self.current_edits.selectedRow() == -1:
@@ -153,6 +197,24 @@ class ZemAppDelegate(NSObject):
         else:
             self.finish.setEnabled_(YES)
 
+    def checkPrefsVersion(self):
+        version_check = self.sud.stringForKey_("version_check")
+        if version_check != __version__:
+            response = NSRunAlertPanel(
+                "Preferences Differ",
+                "Your Preferences were set with "
+                "an older version of "
+                "Zem. Would you "
+                "like to upgrade your Preferences?",
+                "Upgrade",
+                "Start Fresh",
+                None,
+            )
+            if response == 1:
+                self.upgradePrefs()
+            if response == 0:
+                self.resetPrefs()
+
     def upgradePrefs(self):
         new_prefs = {}
         keep_keys = [
@@ -160,6 +222,12 @@ class ZemAppDelegate(NSObject):
             "cleanup_files",
             "confirm_on_finish",
             "helper_apps",
+            "lock_timeout",
+            "metrics_port",
+            "poll_interval",
+            "profile",
+            "quiet_window",
+            "record_trace",
             "save_interval",
             "use_locks",
             "version_check",
@@ -186,6 +254,19 @@ class ZemAppDelegate(NSObject):
         if not new_prefs.has_key("confirm_on_finish"):
             new_prefs["confirm_on_finish"] = YES
 
+        if new_prefs["lock_timeout"] is None:
+            new_prefs["lock_timeout"] = 600
+        if new_prefs["quiet_window"] is None:
+            new_prefs["quiet_window"] = 1.0
+        if new_prefs["metrics_port"] is None:
+            new_prefs["metrics_port"] = 0
+        if new_prefs["poll_interval"] is None:
+            new_prefs["poll_interval"] = 0.0
+        if new_prefs["record_trace"] is None:
+            new_prefs["record_trace"] = NO
+        if new_prefs["profile"] is None:
+            new_prefs["profile"] = ""
+
         # Update this pref always
         new_prefs["version_check"] = __version__
 
@@ -226,9 +307,7 @@ class ZemAppDelegate(NSObject):
     def init(self):
         self.bundleIdent = NSBundle.mainBundle().bundleIdentifier()
         self.preferenceController = None
-        self.current_edits_data = []
         self.ws = NSWorkspace.sharedWorkspace()
-        NSUserDefaults.resetStandardUserDefaults()
         self.sud = NSUserDefaults.standardUserDefaults()
         pdomain = self.sud.persistentDomainForName_(self.bundleIdent)
         if pdomain is None:
@@ -242,37 +321,50 @@ class ZemAppDelegate(NSObject):
             )
             self.sud.synchronize()
 
-        version_check = self.sud.stringForKey_("version_check")
-        if version_check != __version__:
-            response = NSRunAlertPanel(
-                "Preferences Differ",
-                "Your Preferences were set with "
-                "an older version of "
-                "Zem. Would you "
-                "like to upgrade your Preferences?",
-                "Upgrade",
-                "Start Fresh",
-                None,
-            )
-            if response == 1:
-                self.upgradePrefs()
-            if response == 0:
-                self.resetPrefs()
-
-        interval = (self.sud.floatForKey_("save_interval")) or 20.0
-
-        timer = (
-            NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(
-                interval, self, "updateIfModified:", self, YES
-            )
+        # Documents and the sync loop read a snapshot of the defaults,
+        # taken again whenever they change
+        self.settings = LiveSettings(UserDefaultsSettings(self.sud))
+        NSNotificationCenter.defaultCenter().addObserver_selector_name_object_(
+            self, "defaultsChanged:", NSUserDefaultsDidChangeNotification, None
         )
-        NSRunLoop.currentRunLoop().addTimer_forMode_(timer, NSDefaultRunLoopMode)
+        self.manager = EditManager(
+            self.settings,
+            CocoaUI(self),
+            post=lambda fn, *args: (
+                self.performSelectorOnMainThread_withObject_waitUntilDone_(
+                    "runOnMainThread:", (fn, args), NO
+                )
+            ),
+        )
+        self.current_edits_data = self.manager.documents
+        # Pick up where a crash or forced quit left us
+        self.manager.restoreSession()
+
+        metrics_port = self.settings.getInt("metrics_port")
+        if metrics_port:
+            try:
+                metrics.serve(metrics_port)
+            except OSError as e:
+                NSLog("Could not serve metrics on port %d: %s" % (metrics_port, e))
+
+        # Saves are pushed to us by the file watcher; every save_interval
+        # seconds we check the files it could not watch, or all of them
+        # when there is no watcher for this platform
+        self.manager.startWatching()
+        self.timer = None
+        self.scheduleTick()
 
         return self
 
+    def applicationDidFinishLaunching_(self, notification):
+        # Only once the documents the app was launched to edit are open:
+        # double-clicking an edit link should not wait on this.  The
+        # upgraded defaults reach the sync loop through defaultsChanged:
+        self.checkPrefsVersion()
+
     def applicationWillTerminate_(self, notification):
-        for x in range(len(self.current_edits_data)):
-            del self.current_edits_data[x]
+        self.manager.shutdown()
 
 
-AppHelper.runEventLoop(argv=[])
+if __name__ == "__main__":
+    AppHelper.runEventLoop(argv=[])
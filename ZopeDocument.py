@@ -6,18 +6,22 @@
 #  Copyright (c) 2004 Zope Foundation and Contributors.
 #
 
-from AppKit import *  # noqa
-from Foundation import *  # noqa
-from http.client import HTTPConnection, HTTPSConnection
+"""
+Cocoa glue for the zem core: settings from NSUserDefaults, questions as
+alert panels and log messages through NSLog.
+"""
+
+from AppKit import NSRunAlertPanel, NSTableViewAnimationEffectNone
+from Foundation import NSDate, NSLog, NSMutableIndexSet, NSUserDefaults
 from tempfile import mktemp
-from urllib.parse import urlparse
 
-import hashlib
-import os
-import re
-import sys
+from zem import __version__  # noqa: F401
+from zem.document import ZopeDocument  # noqa: F401
+from zem.settings import Settings
+from zem.ui import UI
 
-__version__ = "0.9"
+import sys
+import traceback
 
 
 def fatalError(message):
@@ -32,286 +36,88 @@ def fatalError(message):
         sys.exit(0)
 
 
-class ZopeDocument:
-    def __init__(self, filename):
-        self.filename = filename
-        self.lock_token = None
-        (self.metadata, self.contents) = self.getMetadataAndContents(filename)
-        meta_type = self.metadata.get("meta_type", None)
-        content_type = self.metadata.get("content_type", "text/plain")
-
-        self.sud = NSUserDefaults.standardUserDefaults()
-
-        options_group = self.sud.dictionaryForKey_("helper_apps")
-
-        self.options = options_group.get(
-            meta_type, options_group.get(content_type, None)
-        )
-        if not self.options:
-            content_type, content_subtype = re.split(r"[/_]", content_type, 1)
-            self.options = options_group.get("%s/*" % content_type)
-
-        scheme, self.host, self.path = urlparse(self.metadata["url"])[:3]
-        self.ssl = scheme == "https"
-
-        self.content_file = self.generateContentFile()
-
-        self.last_mtime = os.path.getmtime(self.content_file)
-
-        if self.ssl:
-            # See if ssl is available
-            try:
-                import ssl
-            except ImportError:
-                fatalError(
-                    "SSL support is not available on this system. "
-                    "Make sure openssl is installed "
-                    "and reinstall Python."
-                )
-
-        self.saved = 1
-        self.did_lock = 0
-
-    def getEditor(self):
-        return self.options["editor"]
-
-    def getContentFile(self):
-        return self.content_file
-
-    def getContentFileName(self):
-        return os.path.split(self.content_file)[-1].split(",")[-1]
-
-    def getFilename(self):
-        return self.filename
-
-    def generateContentFile(self):
-        content_file = self.metadata.get("title", self.path.split("/")[-1])
-        md5 = hashlib.md5()
-        md5.update(self.host.encode("utf8"))
-        md5.update(self.path.encode("utf8"))
-        dir_name = md5.hexdigest()
-
-        extension = self.options.get("extension", None)
-
-        if extension and not content_file.endswith(extension):
-            content_file = content_file + extension
-
-        if self.sud.stringForKey_("temp_dir"):
-            temp_dir = os.path.expanduser(self.sud.stringForKey_("temp_dir"))
-        else:
-            temp_dir = tempfile.gettempdir()
-
-        path = os.path.join(temp_dir, dir_name)
-        if not os.path.exists(path):
-            os.mkdir(path, 0o700)
-
-        content_file = os.path.join(path, content_file)
+def indexSet(rows):
+    indexes = NSMutableIndexSet.indexSet()
+    for row in rows:
+        indexes.addIndex_(row)
+    return indexes
 
-        out_f = open(content_file, "wb")
-        out_f.write(self.contents)
-        out_f.close()
 
-        return content_file
+class UserDefaultsSettings(Settings):
+    def __init__(self, sud=None):
+        self.sud = sud or NSUserDefaults.standardUserDefaults()
 
-    def getMetadataAndContents(self, filename):
-        metadata = {}
+    def getObject(self, key):
+        return self.sud.objectForKey_(key)
 
-        in_f = open(filename, "rb")
+    def getBool(self, key):
+        return self.sud.boolForKey_(key)
 
-        # grab the metadata and build a dictionary
-        while 1:
-            line = in_f.readline()[:-1]
-            if not line:
-                break
-            line = line.decode("utf8")
-            key, val = line.split(":", 1)
-            metadata[key] = val
+    def getString(self, key):
+        return self.sud.stringForKey_(key)
 
-        # grab the rest and stick it in contents
-        contents = in_f.read()
+    def getFloat(self, key):
+        return self.sud.floatForKey_(key)
 
-        in_f.close()
+    def getInt(self, key):
+        return self.sud.integerForKey_(key)
 
-        return (metadata, contents)
+    def getDict(self, key):
+        return self.sud.dictionaryForKey_(key) or {}
 
-    def removeFileIfNecessary(self, filename):
-        if self.sud.boolForKey_("cleanup_files"):
-            try:
-                os.remove(filename)
-            except OSError:
-                pass  # Sometimes we aren't allowed to delete it
 
-    def putChanges(self):
-        """Save changes to the file back to Zope"""
-        if self.sud.boolForKey_("use_locks") and self.lock_token is None:
-            # We failed to get a lock initially, so try again before saving
-            if not self.lock():
-                # Confirm save without lock
-                if not NSRunAlertPanel(
-                    "Lock Error",
-                    "Could not acquire lock. " "Attempt to save to Zope anyway?",
-                    "Yes",
-                    "No",
-                    None,
-                ):
-                    return 0
+class CocoaUI(UI):
+    """Alert panels for questions, and the main window for sync progress"""
 
-        f = open(self.content_file, "rb")
-        body = f.read()
-        f.close()
-        headers = {"Content-Type": self.metadata.get("content_type", "text/plain")}
+    def __init__(self, delegate=None):
+        self.delegate = delegate
 
-        if self.lock_token is not None:
-            headers["If"] = "<%s> (<%s>)" % (self.path, self.lock_token.decode("utf8"))
+    def log(self, message):
+        NSLog(message)
 
-        response = self.zopeRequest("PUT", headers, body)
-        del body  # Don't keep the body around longer then we need to
+    def ask(self, title, message, default="OK", alternate=None):
+        return NSRunAlertPanel(title, message, default, alternate, None)
 
-        if int(response.status / 100) != 2:
-            # Something went wrong
-            message = response.read().decode("utf8")
-            NSLog(message)
-            if NSRunAlertPanel(
-                message,
-                "Could not save to Zope.\n" "Error occurred during HTTP put",
-                "Retry",
-                "Cancel",
-                None,
-            ):
-                return self.putChanges()
-            else:
-                return 0
-        return 1
+    def fatal(self, message):
+        fatalError(message)
 
-    def lock(self):
-        """Apply a webdav lock to the object in Zope"""
-        if self.lock_token is not None:
-            return 0  # Already have a lock token
+    def uploadsStarted(self):
+        if self.delegate is not None:
+            self.delegate.sync_spinner.startAnimation_(self.delegate)
 
-        headers = {
-            "Content-Type": 'text/xml; charset="utf-8"',
-            "Timeout": "infinite",
-            "Depth": "infinity",
-        }
-        body = (
-            '<?xml version="1.0" encoding="utf-8"?>\n'
-            '<d:lockinfo xmlns:d="DAV:">\n'
-            "  <d:lockscope><d:exclusive/></d:lockscope>\n"
-            "  <d:locktype><d:write/></d:locktype>\n"
-            "  <d:depth>infinity</d:depth>\n"
-            "  <d:owner>\n"
-            "  <d:href>Zope External Editor</d:href>\n"
-            "  </d:owner>\n"
-            "</d:lockinfo>"
-        )
+    def uploadsFinished(self):
+        if self.delegate is not None:
+            self.delegate.sync_spinner.stopAnimation_(self.delegate)
 
-        response = self.zopeRequest("LOCK", headers, body)
-
-        if response.status / 100 == 2:
-            # We got our lock, extract the lock token and return it
-            reply = response.read()
-            token_start = reply.find(b">opaquelocktoken:")
-            token_end = reply.find(b"<", token_start)
-            if token_start > 0 and token_end > 0:
-                self.lock_token = reply[token_start + 1 : token_end]
-                self.did_lock = 1
-        else:
-            # We can't lock her sir!
-            if response.status == 423:
-                message = "(object already locked)"
-            else:
-                message = ""
-
-            if NSRunAlertPanel(
-                response.read(),
-                "Lock request failed %s" % message,
-                "Retry",
-                "Cancel",
-                None,
-            ):
-                self.lock()
-            else:
-                self.did_lock = 0
-        return self.did_lock
-
-    def unlock(self, interactive=1):
-        """Remove webdav lock from edited zope object"""
-        if not self.did_lock or self.lock_token is None:
-            return 0  # nothing to do
-
-        headers = {"Lock-Token": self.lock_token}
-        response = self.zopeRequest("UNLOCK", headers)
-
-        if interactive and response.status / 100 != 2:
-            # Captain, she's still locked!
-            if NSRunAlertPanel(
-                response.read(), "Unlock request failed", "Retry", "Cancel", None
-            ):
-                self.unlock()
-            else:
-                self.did_lock = 0
-        else:
-            self.did_lock = 1
-            self.lock_token = None
-        return self.did_lock
-
-    def zopeRequest(self, method, headers={}, body=""):
-        """Send a request back to Zope"""
-        try:
-            if self.ssl:
-                h = HTTPSConnection(self.host)
-            else:
-                h = HTTPConnection(self.host)
-
-            h.putrequest(method, self.path)
-            h.putheader("User-Agent", "Zope External Editor/%s" % __version__)
-            h.putheader("Connection", "close")
-
-            for header, value in headers.items():
-                h.putheader(header, value)
-
-            h.putheader("Content-Length", str(len(body)))
-
-            if self.metadata.get("auth", "").startswith("Basic"):
-                h.putheader("Authorization", self.metadata["auth"])
-
-            if self.metadata.get("cookie"):
-                h.putheader("Cookie", self.metadata["cookie"])
-
-            h.endheaders()
-            if isinstance(body, str):
-                body = body.encode("utf8")
-            h.send(body)
-            return h.getresponse()
-        except:
-            # On error return a null response with error info
-            class NullResponse:
-                def getheader(self, n, d=None):
-                    return d
-
-                def read(self):
-                    return "(No Response From Server)"
-
-            response = NullResponse()
-            response.reason = sys.exc_info()[1]
-
-            try:
-                response.status, response.reason = response.reason
-            except ValueError:
-                response.status = 0
-
-            if response.reason == "EOF occurred in violation of protocol":
-                # Ignore this protocol error as a workaround for
-                # broken ssl server implementations
-                response.status = 200
-
-            return response
-
-    def __del__(self):
-        """Let's clean up after ourselves, shall we?"""
-        if self.lock_token is not None:
-            if self.lock_token:
-                self.unlock(interactive=0)
-
-            os.remove(self.getContentFile())
-            os.rmdir(os.path.dirname(self.getContentFile()))
+    def documentSynced(self, doc, result):
+        if self.delegate is not None and result in ("uploaded", "refreshed"):
+            self.delegate.sync_message.setStringValue_(
+                "Last synched: %s"
+                % NSDate.date().descriptionWithCalendarFormat_timeZone_locale_(
+                    "%a, %d %b %Y at %H:%M:%S %p", None, None
+                )
+            )
+
+    def bodyFetched(self, doc):
+        if self.delegate is not None:
+            self.delegate.launchEditor_(doc)
+
+    def editsTable(self):
+        """The table of current edits, once the nib has been loaded"""
+        if self.delegate is not None:
+            return self.delegate.current_edits
+        return None
+
+    def documentsAdded(self, rows):
+        table = self.editsTable()
+        if table is not None:
+            table.insertRowsAtIndexes_withAnimation_(
+                indexSet(rows), NSTableViewAnimationEffectNone
+            )
+
+    def documentsRemoved(self, rows):
+        table = self.editsTable()
+        if table is not None:
+            table.removeRowsAtIndexes_withAnimation_(
+                indexSet(rows), NSTableViewAnimationEffectNone
+            )
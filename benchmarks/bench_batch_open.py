@@ -0,0 +1,76 @@
+#
+#  bench_batch_open.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Time to get a batch of .zem files locked and ready to edit.
+
+Opens --documents .zem files against the local stand-in server with
+--latency seconds per request, first one at a time the way
+application:openFile: does, then all at once through
+EditManager.openDocuments.  The batch should finish in roughly
+documents / (per-host cap) lock round-trips instead of one per file.
+
+    python benchmarks/bench_batch_open.py --documents 50 --latency 0.05
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import support
+from bench_pipeline import writeZem
+from davserver import DAVServer
+from zem.manager import EditManager
+
+
+def writeBatch(server, directory, documents, prefix="doc"):
+    filenames = []
+    for number in range(documents):
+        name = "%s%d" % (prefix, number)
+        filename = os.path.join(directory, name + ".zem")
+        writeZem(filename, "http://%s/%s" % (server.host, name), 1024)
+        filenames.append(filename)
+    return filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    options = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, cleanup_files=False)
+    server = DAVServer(latency=options.latency).start()
+    try:
+        manager = EditManager(settings)
+        filenames = writeBatch(server, temp_dir, options.documents, "serial")
+        start = time.perf_counter()
+        for filename in filenames:
+            manager.lockDocument(manager.openDocument(filename))
+        serial = time.perf_counter() - start
+
+        manager = EditManager(settings)
+        filenames = writeBatch(server, temp_dir, options.documents, "batch")
+        start = time.perf_counter()
+        docs = manager.openDocuments(filenames)
+        batch = time.perf_counter() - start
+        assert len(docs) == options.documents
+        assert all(doc.lock_token for doc in docs)
+
+        print("one at a time: %.3fs" % serial)
+        print("batch:         %.3fs (%.1fx)" % (batch, serial / batch))
+        del manager, docs  # unlock and remove content files while we can
+    finally:
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#
+#  bench_coalescing.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Count the PUTs a burst of saves costs, with and without coalescing.
+
+Opens --documents documents in the headless daemon against the local
+stand-in server (with --latency seconds per request, so uploads are
+still in flight when the next save lands) and writes each content file
+--saves times, --gap seconds apart.  With the quiet window every burst
+should end in exactly one PUT per document carrying the last save;
+without it, intermediate versions are uploaded too, except those
+superseded while still waiting for a worker.
+
+    python benchmarks/bench_coalescing.py --documents 20 --saves 10
+"""
+
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+
+import support
+from bench_batch_open import writeBatch
+from davserver import DAVServer
+from zem.daemon import Daemon
+from zem.ui import UI
+
+
+def burst(options, quiet_window):
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(
+        temp_dir=temp_dir,
+        cleanup_files=False,
+        use_locks=False,
+        quiet_window=quiet_window,
+    )
+    server = DAVServer(latency=options.latency).start()
+    daemon = Daemon(settings, ui=UI())
+    loop = threading.Thread(target=daemon.run, kwargs={"poll_interval": 0.05})
+    try:
+        docs = daemon.manager.openDocuments(
+            writeBatch(server, temp_dir, options.documents)
+        )
+        loop.start()
+        time.sleep(0.2)  # Let the watcher start
+
+        sizes = {}
+        for save in range(options.saves):
+            for doc in docs:
+                with open(doc.getContentFile(), "a") as f:
+                    f.write("save %d\n" % save)
+                    sizes[doc.path] = f.tell()
+            time.sleep(options.gap)
+
+        # Wait for the last uploads to land
+        deadline = time.monotonic() + quiet_window + 10
+        while server.sizes != sizes and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert server.sizes == sizes, "last saves were not uploaded"
+        return server.requests.get("PUT", 0), daemon.manager.upload_counts
+    finally:
+        daemon.stop()
+        if loop.is_alive():
+            loop.join()
+        daemon.shutdown()
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--saves", type=int, default=10)
+    parser.add_argument("--gap", type=float, default=0.02)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--quiet-window", type=float, default=0.3)
+    options = parser.parse_args()
+
+    for label, quiet_window in (
+        ("no window", 0.0),
+        ("coalesced", options.quiet_window),
+    ):
+        puts, counts = burst(options, quiet_window)
+        print(
+            "%-10s %4d saves -> %4d PUTs (%d superseded while queued)"
+            % (label, options.documents * options.saves, puts, counts["superseded"])
+        )
+        if quiet_window:
+            assert puts == options.documents, "bursts were not collapsed"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#
+#  bench_connection_pool.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Compare one-connection-per-request against the shared keep-alive pool.
+
+Each simulated document LOCKs once, PUTs its body on every autosave tick
+and UNLOCKs at the end, all against the local stand-in server.  The
+report shows how many TCP handshakes the server saw and the latency of
+each save.
+
+    python benchmarks/bench_connection_pool.py --documents 50 --saves 20
+"""
+
+from http.client import HTTPConnection
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zem.pool import ConnectionPool  # noqa: E402
+from davserver import DAVServer  # noqa: E402
+
+
+def closeRequest(host, method, path, headers, body):
+    """What zopeRequest used to do: a new connection for every request"""
+    h = HTTPConnection(host)
+    h.putrequest(method, path)
+    h.putheader("Connection", "close")
+    for header, value in headers:
+        h.putheader(header, value)
+    h.endheaders()
+    h.send(body)
+    response = h.getresponse()
+    response.read()
+    h.close()
+    return response
+
+
+def run(server, send, documents, saves, body):
+    headers = [("Content-Length", str(len(body)))]
+    save_times = []
+    before = server.connections
+    tokens = []
+    for doc in range(documents):
+        response = send(
+            server.host, "LOCK", "/doc%d" % doc, [("Content-Length", "0")], b""
+        )
+        tokens.append(response.getheader("Lock-Token"))
+    for tick in range(saves):
+        for doc in range(documents):
+            start = time.perf_counter()
+            send(server.host, "PUT", "/doc%d" % doc, headers, body)
+            save_times.append(time.perf_counter() - start)
+    for doc in range(documents):
+        unlock_headers = [("Content-Length", "0"), ("Lock-Token", tokens[doc])]
+        send(server.host, "UNLOCK", "/doc%d" % doc, unlock_headers, b"")
+    return server.connections - before, save_times
+
+
+def report(label, handshakes, save_times):
+    save_times = sorted(save_times)
+    print(
+        "%-10s handshakes=%-6d saves=%-6d mean=%.3fms p50=%.3fms p95=%.3fms"
+        % (
+            label,
+            handshakes,
+            len(save_times),
+            statistics.mean(save_times) * 1000,
+            save_times[len(save_times) // 2] * 1000,
+            save_times[int(len(save_times) * 0.95)] * 1000,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--saves", type=int, default=20)
+    parser.add_argument("--size", type=int, default=16 * 1024)
+    parser.add_argument("--latency", type=float, default=0.0)
+    options = parser.parse_args()
+
+    body = b"x" * options.size
+    server = DAVServer(latency=options.latency).start()
+    try:
+        handshakes, save_times = run(
+            server, closeRequest, options.documents, options.saves, body
+        )
+        report("close", handshakes, save_times)
+
+        pool = ConnectionPool()
+
+        def pooledRequest(host, method, path, headers, body):
+            return pool.request(host, 0, method, path, headers, body)
+
+        handshakes, save_times = run(
+            server, pooledRequest, options.documents, options.saves, body
+        )
+        report("keep-alive", handshakes, save_times)
+        pool.closeAll()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
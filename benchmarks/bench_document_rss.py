@@ -0,0 +1,88 @@
+#
+#  bench_document_rss.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Resident memory with many large documents open.
+
+Writes --documents .zem files of --size MB each, opens them all as
+ZopeDocuments through the AppKit-free core and reports resident
+memory before and after, next to the body bytes the documents used to
+keep in ZopeDocument.contents.
+
+    python benchmarks/bench_document_rss.py --documents 500 --size 2
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import support
+
+
+def rss():
+    """Current resident set size in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Peak rather than current, but all that macOS gives us cheaply
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def writeZem(directory, number, body):
+    filename = os.path.join(directory, "doc%d.zem" % number)
+    with open(filename, "wb") as f:
+        f.write(b"url:http://localhost:8080/folder/doc%d\n" % number)
+        f.write(b"meta_type:File\n")
+        f.write(b"content_type:application/pdf\n")
+        f.write(b"auth:Basic YWRtaW46YWRtaW4=\n")
+        f.write(b"\n")
+        f.write(body)
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--size", type=float, default=2, help="megabytes")
+    options = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, cleanup_files=True)
+    from zem.document import ZopeDocument
+
+    body = os.urandom(int(options.size * 1024 * 1024))
+    docs = []
+    try:
+        before = rss()
+        start = time.perf_counter()
+        for number in range(options.documents):
+            filename = writeZem(temp_dir, number, body)
+            docs.append(ZopeDocument(filename, settings))
+            docs[-1].removeFileIfNecessary(filename)
+        elapsed = time.perf_counter() - start
+        after = rss()
+
+        mb = 1024.0 * 1024.0
+        print("documents opened:        %d in %.2fs" % (len(docs), elapsed))
+        print("body bytes on disk:      %.1f MB" % (len(docs) * len(body) / mb))
+        print("RSS before:              %.1f MB" % (before / mb))
+        print("RSS after:               %.1f MB" % (after / mb))
+        print(
+            "RSS per document:        %.1f KB" % ((after - before) / len(docs) / 1024)
+        )
+    finally:
+        del docs[:]
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#
+#  bench_journal.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Restore a session from the journal, and replay saves made offline.
+
+Opens --documents documents against the local stand-in server, then
+builds a second EditManager over the same temporary directory, as a
+restarted app would, and times restoreSession.  Then it saves one
+document a few times while the server refuses every request, checks
+that nothing is lost across a restart, and that once the server is
+back only the newest version is sent, in a single PUT.
+
+    python benchmarks/bench_journal.py --documents 1000
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+
+import support
+from bench_batch_open import writeBatch
+from bench_shutdown import QuietUI
+from davserver import DAVServer
+from zem.manager import EditManager
+from zem.retry import breakers, policy
+from zem.ui import UI
+
+
+def save(doc, text):
+    with open(doc.getContentFile(), "a") as f:
+        f.write(text)
+        return f.tell()
+
+
+def settle(manager, seconds):
+    """Run posted calls for a while, like the app's main loop"""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for doc in list(manager.documents):
+            manager.syncDocument(doc)
+        time.sleep(0.02)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=1000)
+    options = parser.parse_args()
+
+    policy.base_delay = 0.01
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, cleanup_files=True, quiet_window=0)
+    server = DAVServer().start()
+    try:
+        first = EditManager(settings, UI())
+        first.openDocuments(writeBatch(server, temp_dir, options.documents))
+
+        # Crash: the first manager never shuts down or unlocks
+        first.finishUploads()
+        start = time.perf_counter()
+        second = EditManager(settings, QuietUI())
+        docs = second.restoreSession()
+        elapsed = time.perf_counter() - start
+        print(
+            "restored %d documents in %.1f ms, %d holding locks"
+            % (len(docs), elapsed * 1000, sum(1 for doc in docs if doc.lock_token))
+        )
+        assert len(docs) == options.documents
+
+        doc = docs[0]
+        server.faults[doc.path] = [503] * 100
+        for number in range(3):
+            size = save(doc, "offline save %d\n" % number)
+            settle(second, 0.3)
+        assert doc in second.offline, "save was not queued offline"
+
+        # Quit while the server is still refusing: the unsent save stays
+        content_file = doc.getContentFile()
+        second.shutdown()
+        assert "Keeping %s for later" % content_file in second.ui.messages
+        del first, second, docs, doc
+        gc.collect()
+        assert os.path.exists(content_file), "quitting deleted an unsent save"
+
+        # Restart once the server is back, with fresh circuit breakers
+        server.faults.clear()
+        breakers.reset()
+        puts = server.requests.get("PUT", 0)
+        third = EditManager(settings, UI())
+        restored = third.restoreSession()
+        assert [d.getContentFile() for d in restored] == [content_file]
+        doc = restored[0]
+        settle(third, 1.0)
+        print(
+            "after a restart and the server coming back: %d PUT, %d bytes in Zope"
+            % (server.requests.get("PUT", 0) - puts, server.sizes.get(doc.path, 0))
+        )
+        assert server.sizes.get(doc.path) == size
+        assert server.requests["PUT"] - puts == 1
+        assert doc not in third.offline
+        third.shutdown()
+        assert not os.path.exists(content_file)
+    finally:
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
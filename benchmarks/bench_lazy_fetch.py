@@ -0,0 +1,188 @@
+#
+#  bench_lazy_fetch.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Opening a large object from a metadata-only .zem file.
+
+Compares a .zem file carrying a --size MB body, which the browser has to
+write and ZopeEditManager then copies into the content file, with one
+carrying only a fetch_body header, whose body is streamed from the
+local stand-in server straight into the content file.  Then checks that
+downloads cut off part way through resume where they stopped: within
+one fetch, after the object changed in Zope, and after a restart.
+
+    python benchmarks/bench_lazy_fetch.py --size 64
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import support
+from bench_pipeline import writeZem
+from davserver import DAVServer
+from zem.manager import EditManager
+from zem.retry import breakers, policy
+from zem.ui import UI
+
+
+class WaitingUI(UI):
+    def __init__(self):
+        self.fetched = threading.Event()
+
+    def log(self, message):
+        pass
+
+    def bodyFetched(self, doc):
+        self.fetched.set()
+
+
+def writeLazyZem(filename, url):
+    with open(filename, "wb") as f:
+        f.write(b"url:%s\n" % url.encode("utf8"))
+        f.write(b"meta_type:File\n")
+        f.write(b"content_type:application/pdf\n")
+        f.write(b"fetch_body:1\n")
+        f.write(b"\n")
+
+
+def fetch(manager, filename, timeout=60):
+    """Open a metadata-only .zem file and wait for its body"""
+    manager.ui.fetched.clear()
+    doc = manager.openDocument(filename)
+    manager.fetchBody(doc)
+    if not manager.ui.fetched.wait(timeout):
+        raise AssertionError("no body after %ds: %s" % (timeout, doc.sync_error))
+    return doc
+
+
+def check(doc, body):
+    with open(doc.getContentFile(), "rb") as f:
+        assert f.read() == body, "content file differs from the object"
+    assert not os.path.exists(doc.partialFile())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=64, help="MB")
+    options = parser.parse_args()
+    size = options.size * 1024**2
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, cleanup_files=False, use_locks=False)
+    server = DAVServer().start()
+    manager = EditManager(settings, WaitingUI())
+    try:
+        # What the browser downloads and we copy, versus a GET straight
+        # into the content file
+        start = time.perf_counter()
+        filename = os.path.join(temp_dir, "full.zem")
+        writeZem(filename, "http://%s/full" % server.host, size)
+        manager.openDocument(filename)
+        full = time.perf_counter() - start
+        full_zem = os.path.getsize(filename)
+
+        server.bodies["/lazy"] = os.urandom(size)
+        start = time.perf_counter()
+        filename = os.path.join(temp_dir, "lazy.zem")
+        writeLazyZem(filename, "http://%s/lazy" % server.host)
+        doc = fetch(manager, filename)
+        lazy = time.perf_counter() - start
+        check(doc, server.bodies["/lazy"])
+        print(
+            "full .zem: %.3fs, %d bytes through the browser, %d written"
+            % (full, full_zem, full_zem + size)
+        )
+        print(
+            "lazy .zem: %.3fs, %d bytes through the browser, %d written"
+            % (lazy, os.path.getsize(filename), size)
+        )
+
+        # Dropped twice part way through, resumed with Range each time
+        body = server.bodies["/resume"] = os.urandom(size)
+        server.cutoffs["/resume"] = [size // 3, size // 3]
+        served = server.served
+        filename = os.path.join(temp_dir, "resume.zem")
+        writeLazyZem(filename, "http://%s/resume" % server.host)
+        check(fetch(manager, filename), body)
+        print(
+            "cut off twice:       %d bytes served for a %d byte body"
+            % (server.served - served, size)
+        )
+        assert server.served - served == size
+
+        # Changed in Zope between being cut off and the retry: If-Range
+        # gets the new version in full rather than the tail of it
+        server.bodies["/changed"] = os.urandom(size)
+        server.cutoffs["/changed"] = [size // 2]
+        filename = os.path.join(temp_dir, "changed.zem")
+        writeLazyZem(filename, "http://%s/changed" % server.host)
+        changed = []
+        sleep = policy.sleep
+
+        def changeWhileWaiting(seconds):
+            if not changed:
+                server.versions["/changed"] = 1
+                changed.append(os.urandom(size))
+                server.bodies["/changed"] = changed[0]
+            sleep(seconds)
+
+        served = server.served
+        policy.sleep = changeWhileWaiting
+        try:
+            doc = fetch(manager, filename)
+        finally:
+            policy.sleep = sleep
+        check(doc, changed[0])
+        assert doc.etag == '"1"', doc.etag
+        print(
+            "changed in Zope:     %d bytes served, the new version in full"
+            % (server.served - served)
+        )
+        assert server.served - served == size // 2 + size
+
+        # Cut off on every attempt, then picked up after a restart
+        body = server.bodies["/restart"] = os.urandom(size)
+        server.cutoffs["/restart"] = [size // 8] * policy.attempts
+        filename = os.path.join(temp_dir, "restart.zem")
+        writeLazyZem(filename, "http://%s/restart" % server.host)
+        doc = manager.openDocument(filename)
+        manager.fetchBody(doc)
+        manager.sync_engine.shutdown()
+        assert doc.bodyPending() and doc in manager.offline
+        partial = os.path.getsize(doc.partialFile())
+        manager.replayer.stop()
+        manager.lock_refresher.stop()
+        del manager, doc
+        breakers.reset()
+
+        served = server.served
+        manager = EditManager(settings, WaitingUI())
+        manager.ui.fetched.clear()
+        restored = manager.restoreSession()
+        if not manager.ui.fetched.wait(60):
+            raise AssertionError("restored download did not finish")
+        doc = [doc for doc in restored if doc.path == "/restart"][0]
+        check(doc, body)
+        print(
+            "after a restart:     %d of %d bytes already there, %d served"
+            % (partial, size, server.served - served)
+        )
+        assert server.served - served == size - partial
+        del doc, restored
+    finally:
+        manager.shutdown()
+        del manager
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#
+#  bench_load.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Hundreds to thousands of editors saving at once.
+
+For each number of editors in --editors, opens that many synthetic .zem
+documents in the daemon's real sync loop (file watcher, quiet window,
+sync workers, connection pool) and has their content files saved for
+--duration seconds in one of these patterns:
+
+  typing  a line appended every --typing-interval seconds, like an
+          editor autosaving while someone types
+  burst   --burst-saves saves a tenth of a second apart every
+          --burst-interval seconds (format-on-save, swap files)
+  binary  the whole file replaced by --binary-size KB of new random
+          bytes every --binary-interval seconds, written to a new file
+          and renamed over the old one as image editors do
+
+--mix says how the editors are split between the patterns.  The
+stand-in server runs in a process of its own, adding --latency to
+every request and answering a fraction --error-rate of them with a 503.
+
+Each step reports the sync lag (from the first save Zope does not have
+yet to the end of the upload that carries it) at the 50th, 90th and
+99th percentile, saves and requests per second, failed syncs, saves
+still not in Zope once the editors stopped and --drain seconds passed,
+the CPU time and resident memory of this process (editors included),
+and how long opening and shutting down took.  The step where the lag
+percentiles jump is the scaling knee of the sync loop.
+
+    python benchmarks/bench_load.py --editors 10,100,1000,5000 --duration 30
+"""
+
+import argparse
+import heapq
+import os
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+
+import support
+from bench_document_rss import rss
+from bench_pipeline import writeZem
+from zem.daemon import Daemon
+from zem.metrics import metrics
+from zem.retry import breakers
+from zem.ui import UI
+
+PATTERNS = ("typing", "burst", "binary")
+
+
+class LoadUI(UI):
+    """Times how long saves take to reach Zope"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}  # doc -> when Zope fell behind its content file
+        self.lags = []
+        self.failed = 0
+
+    def log(self, message):
+        pass
+
+    def saved(self, doc):
+        with self.lock:
+            self.pending.setdefault(doc, time.monotonic())
+
+    def documentSynced(self, doc, result):
+        with self.lock:
+            if result in ("uploaded", "skipped"):
+                since = self.pending.pop(doc, None)
+                if since is not None:
+                    self.lags.append(time.monotonic() - since)
+            elif result == "failed":
+                self.failed += 1
+
+
+class Editor:
+    """Someone saving one document in one of PATTERNS"""
+
+    def __init__(self, doc, pattern, options, rng):
+        self.doc = doc
+        self.pattern = pattern
+        self.options = options
+        self.rng = rng
+        self.saves = 0
+        self.burst_left = 0
+
+    def firstDelay(self):
+        return self.rng.uniform(0, self.interval())
+
+    def interval(self):
+        return getattr(self.options, self.pattern + "_interval")
+
+    def save(self):
+        """Save once, and return the seconds until the next save"""
+        content_file = self.doc.getContentFile()
+        if self.pattern == "binary":
+            saving = content_file + ".saving"
+            with open(saving, "wb") as f:
+                f.write(os.urandom(self.options.binary_size * 1024))
+            os.replace(saving, content_file)
+        else:
+            with open(content_file, "ab") as f:
+                f.write(b"<p>save %d</p>\n" % self.saves)
+        self.saves += 1
+        self.doc.ui.saved(self.doc)
+
+        if self.pattern == "burst":
+            if self.burst_left:
+                self.burst_left -= 1
+                return 0.1
+            self.burst_left = self.options.burst_saves - 1
+        # Not everybody in step
+        return self.interval() * self.rng.uniform(0.5, 1.5)
+
+
+def edit(editors, until):
+    """Run editors' saves on this thread until the monotonic time until"""
+    heap = [
+        (editor.firstDelay() + time.monotonic(), n) for n, editor in enumerate(editors)
+    ]
+    heapq.heapify(heap)
+    while heap:
+        due, n = heap[0]
+        now = time.monotonic()
+        if due > until:
+            return
+        if due > now:
+            time.sleep(min(due, until) - now)
+            continue
+        heapq.heapreplace(heap, (now + editors[n].save(), n))
+
+
+def patterns(mix, count):
+    """count pattern names, split as the weights in mix say"""
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        if name not in PATTERNS:
+            raise ValueError("unknown write pattern %r" % name)
+        weights[name] = float(weight)
+    total = sum(weights.values())
+    names = []
+    for name, weight in weights.items():
+        names.extend([name] * int(round(count * weight / total)))
+    names = (names + [name] * count)[:count]  # Rounding may leave a few short
+    random.Random(count).shuffle(names)
+    return names
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def cpuTime():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def requestCounts():
+    """Responses per method since metrics were last reset"""
+    counts = {}
+    for key, stats in metrics.snapshot()["requests"].items():
+        method = key.split(" ")[0]
+        counts[method] = counts.get(method, 0) + sum(stats["statuses"].values())
+    return counts
+
+
+def runStep(count, host, options):
+    temp_dir = tempfile.mkdtemp("-zem-load")
+    overrides = dict(temp_dir=temp_dir, cleanup_files=True, use_locks=options.locks)
+    if options.quiet_window is not None:
+        overrides["quiet_window"] = options.quiet_window
+    ui = LoadUI()
+    daemon = Daemon(support.settings(**overrides), ui=ui)
+    breakers.reset()
+    try:
+        filenames = []
+        for number in range(count):
+            filename = os.path.join(temp_dir, "doc%d.zem" % number)
+            url = "http://%s/load%d/doc%d" % (host, count, number)
+            writeZem(filename, url, options.size * 1024)
+            filenames.append(filename)
+        start = time.monotonic()
+        docs = daemon.open(filenames)
+        opened = time.monotonic() - start
+
+        loop = threading.Thread(target=daemon.run, name="Daemon", daemon=True)
+        loop.start()
+        rng = random.Random(count)
+        editors = [
+            Editor(doc, pattern, options, rng)
+            for doc, pattern in zip(docs, patterns(options.mix, len(docs)))
+        ]
+        metrics.reset()
+        cpu = cpuTime()
+        start = time.monotonic()
+        until = start + options.duration
+        writers = [
+            threading.Thread(target=edit, args=(editors[n :: options.writers], until))
+            for n in range(options.writers)
+        ]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        deadline = time.monotonic() + options.drain
+        while ui.pending and time.monotonic() < deadline:
+            time.sleep(0.1)
+        wall = time.monotonic() - start
+        cpu = cpuTime() - cpu
+        requests = requestCounts()
+        memory = rss()
+
+        daemon.stop()
+        loop.join()
+        start = time.monotonic()
+        daemon.shutdown()
+        shutdown = time.monotonic() - start
+        saves = sum(editor.saves for editor in editors)
+        del docs, editors
+        return {
+            "editors": count,
+            "saves": saves / options.duration,
+            "PUT": requests.pop("PUT", 0) / wall,
+            "other": sum(requests.values()) / wall,
+            "p50": percentile(ui.lags, 0.5),
+            "p90": percentile(ui.lags, 0.9),
+            "p99": percentile(ui.lags, 0.99),
+            "max": max(ui.lags or [0.0]),
+            "failed": ui.failed,
+            "behind": len(ui.pending),
+            "cpu": 100 * cpu / wall,
+            "rss": memory / 1024**2,
+            "open": opened,
+            "shutdown": shutdown,
+        }
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+HEADER = "%7s %8s %7s %7s %7s %7s %7s %7s %6s %6s %5s %7s %6s %8s" % (
+    "editors",
+    "saves/s",
+    "PUT/s",
+    "other/s",
+    "p50 s",
+    "p90 s",
+    "p99 s",
+    "max s",
+    "failed",
+    "behind",
+    "cpu%",
+    "rss MB",
+    "open s",
+    "shutdown",
+)
+ROW = (
+    "%(editors)7d %(saves)8.1f %(PUT)7.1f %(other)7.1f %(p50)7.3f %(p90)7.3f"
+    " %(p99)7.3f %(max)7.3f %(failed)6d %(behind)6d %(cpu)5.0f %(rss)7.1f"
+    " %(open)6.2f %(shutdown)8.2f"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--editors", default="10,100,1000,5000")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--drain", type=float, default=30.0)
+    parser.add_argument("--mix", default="typing=70,burst=20,binary=10")
+    parser.add_argument("--size", type=int, default=8, help="KB per document")
+    parser.add_argument("--typing-interval", type=float, default=5.0)
+    parser.add_argument("--burst-interval", type=float, default=20.0)
+    parser.add_argument("--burst-saves", type=int, default=5)
+    parser.add_argument("--binary-interval", type=float, default=30.0)
+    parser.add_argument("--binary-size", type=int, default=512, help="KB")
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--quiet-window", type=float)
+    parser.add_argument("--writers", type=int, default=4, help="editor threads")
+    parser.add_argument("--no-locks", dest="locks", action="store_false")
+    options = parser.parse_args()
+
+    server, host = support.startServer(options.latency, options.error_rate)
+    try:
+        print(HEADER)
+        for count in [int(n) for n in options.editors.split(",")]:
+            print(ROW % runStep(count, host, options), flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#
+#  bench_lock_refresh.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Keep many short-lived locks alive with the batched lock refresher.
+
+Locks --documents objects on the local stand-in server with a
+--timeout second lock timeout and leaves them open for --duration
+seconds.  The server expires locks that are not refreshed in time, so
+the run fails if any lock is lost.  Reports how many refresher wakeups
+and refresh requests that took, then stops refreshing and checks that
+the server does expire the locks on its own.
+
+    python benchmarks/bench_lock_refresh.py --documents 500 --timeout 4
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import support
+from bench_batch_open import writeBatch
+from davserver import DAVServer
+from zem.manager import EditManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--timeout", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--window", type=float, default=0.5)
+    options = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(
+        temp_dir=temp_dir, cleanup_files=False, lock_timeout=options.timeout
+    )
+    server = DAVServer().start()
+    try:
+        manager = EditManager(settings)
+        manager.lock_refresher.window = options.window
+        docs = manager.openDocuments(writeBatch(server, temp_dir, options.documents))
+        assert len(server.locks) == options.documents
+
+        time.sleep(options.duration)
+        refresher = manager.lock_refresher
+        print(
+            "%d locks held for %.1fs with a %ds timeout: "
+            "%d wakeups, %d refreshes, %d expired on the server"
+            % (
+                refresher.held(),
+                options.duration,
+                options.timeout,
+                refresher.wakeups,
+                refresher.refreshes,
+                server.expired,
+            )
+        )
+        assert server.expired == 0 and refresher.held() == options.documents
+
+        refresher.stop()
+        time.sleep(options.timeout + 0.5)
+        now = time.monotonic()
+        assert all(expires <= now for token, expires in server.locks.values())
+        print("without refreshes the server expired them, as it should")
+        del manager, docs
+    finally:
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
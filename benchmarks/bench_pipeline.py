@@ -0,0 +1,296 @@
+#
+#  bench_pipeline.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Micro-benchmarks for the document pipeline hot paths.
+
+Runs on any platform through the AppKit-free zem core and times:
+
+  - parsing .zem headers (getMetadata) for several header counts
+  - opening a document, which streams the body to the content file
+    (generateContentFile), for .zem sizes from 1 KB to 500 MB
+  - helper-app resolution (initOptions) for each kind of match, with
+    the bundled mappings and with hundreds more
+  - LOCK, PUT and UNLOCK round trips through zopeRequest against the
+    local stand-in server
+  - lock token extraction from a LOCK reply
+
+Results are written as JSON; pass --compare with an earlier results file
+to print the ratio of each median against it.
+
+    python benchmarks/bench_pipeline.py --output results.json
+    python benchmarks/bench_pipeline.py --max-size 1 --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import support
+
+SIZES = [1024, 64 * 1024, 1024**2, 16 * 1024**2, 100 * 1024**2, 500 * 1024**2]
+HEADER_COUNTS = [5, 50, 500]
+
+
+class Bench:
+    def __init__(self, min_time=0.2):
+        self.min_time = min_time
+        self.results = []
+
+    def time(self, name, fn, setup=None, **params):
+        """Run fn until min_time has passed (at least 3 times)"""
+        timings = []
+        total = 0.0
+        while len(timings) < 3 or total < self.min_time:
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            timings.append(elapsed)
+            total += elapsed
+        result = {
+            "name": name,
+            "params": params,
+            "runs": len(timings),
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.mean(timings),
+        }
+        self.results.append(result)
+        print(
+            "%-28s %-24s median %10.3f ms  (%d runs)"
+            % (
+                name,
+                " ".join("%s=%s" % item for item in sorted(params.items())),
+                result["median"] * 1000,
+                result["runs"],
+            )
+        )
+        return result
+
+
+def writeZem(
+    filename,
+    url,
+    size,
+    headers=0,
+    content_type="text/html",
+):
+    with open(filename, "wb") as f:
+        f.write(b"url:%s\n" % url.encode("utf8"))
+        f.write(b"meta_type:Page Template\n")
+        f.write(b"content_type:%s\n" % content_type.encode("utf8"))
+        f.write(b"auth:Basic YWRtaW46YWRtaW4=\n")
+        for number in range(headers):
+            f.write(b"x-extra-%d:value %d\n" % (number, number))
+        f.write(b"\n")
+        chunk = b"<p>Hello Zope</p>\n" * 4096
+        remaining = size
+        while remaining > 0:
+            f.write(chunk[:remaining])
+            remaining -= len(chunk)
+
+
+def benchParsing(bench, temp_dir):
+    from zem.document import ZopeDocument
+
+    for headers in HEADER_COUNTS:
+        filename = os.path.join(temp_dir, "headers.zem")
+        writeZem(filename, "http://localhost/doc", 1024, headers)
+
+        def parse():
+            with open(filename, "rb") as in_f:
+                ZopeDocument.getMetadata(in_f)
+
+        bench.time("getMetadata", parse, headers=headers + 4)
+
+
+def benchOpening(bench, settings, temp_dir, max_size):
+    from zem.document import ZopeDocument
+
+    for size in SIZES:
+        if size > max_size:
+            break
+        filename = os.path.join(temp_dir, "open.zem")
+        writeZem(filename, "http://localhost/folder/doc", size)
+        docs = []
+        bench.time(
+            "generateContentFile",
+            lambda: docs.append(ZopeDocument(filename, settings)),
+            setup=lambda: docs.clear(),
+            size=size,
+        )
+        docs.clear()
+
+
+def sharedHelperApps(settings, mappings):
+    """The bundled helper_apps padded out like a large shared preference file"""
+    helper_apps = dict(settings.getDict("helper_apps"))
+    options = {"editor": "TextEdit", "extension": ".txt"}
+    for number in range(mappings // 4):
+        helper_apps["Custom Type %d" % number] = options
+        helper_apps["application/x-custom-%d" % number] = options
+        helper_apps["application/vnd.custom%d.*" % number] = options
+        helper_apps["/sites/site%d/skins" % number] = options
+    return helper_apps
+
+
+def benchHelperApps(bench, settings, temp_dir):
+    from zem.document import ZopeDocument
+    from zem.settings import DictSettings
+
+    filename = os.path.join(temp_dir, "helper.zem")
+    writeZem(filename, "http://localhost/doc", 1024)
+    doc = ZopeDocument(filename, settings)
+    cases = [
+        ("meta_type", "/doc", "Page Template", "text/html"),
+        ("mime", "/doc", "File", "text/css"),
+        ("glob", "/doc", "File", "application/vnd.custom7.sheet"),
+        ("major", "/doc", "File", "image/x-icon"),
+        ("prefix", "/sites/site3/skins/main/logo", "File", "image/png"),
+        ("none", "/doc", "File", "application/octet-stream"),
+    ]
+    for mappings in (0, 400):
+        values = dict(settings.values)
+        values["helper_apps"] = sharedHelperApps(settings, mappings)
+        doc.settings = DictSettings(values)
+        for kind, path, meta_type, content_type in cases:
+            doc.metadata.update(
+                url="http://localhost%s" % path,
+                meta_type=meta_type,
+                content_type=content_type,
+            )
+            bench.time(
+                "initOptions",
+                lambda: [doc.initOptions() for i in range(1000)],
+                mappings=mappings,
+                match=kind,
+                calls=1000,
+            )
+
+
+def benchRequests(bench, settings, temp_dir):
+    from zem.document import ZopeDocument, extractLockToken
+    from zem.pool import pool
+    from davserver import DAVServer
+
+    server = DAVServer().start()
+    try:
+        filename = os.path.join(temp_dir, "request.zem")
+        for size in (1024, 1024**2):
+            writeZem(filename, "http://%s/doc" % server.host, size)
+            doc = ZopeDocument(filename, settings)
+            bench.time(
+                "zopeRequest LOCK",
+                lambda: doc.zopeRequest("LOCK"),
+                setup=server.locks.clear,  # each run takes a fresh lock
+                size=0,
+            )
+            with open(doc.content_file, "a") as f:
+                f.write("changed")
+            bench.time("putChanges", lambda: doc.putChanges(interactive=0), size=size)
+            tokens = []
+
+            def lock():
+                server.locks.clear()  # or the LOCK is refused, and retried
+                tokens.append(extractLockToken(doc.zopeRequest("LOCK").read()))
+
+            bench.time(
+                "zopeRequest UNLOCK",
+                lambda: doc.zopeRequest("UNLOCK", {"Lock-Token": tokens.pop()}),
+                setup=lock,
+                size=0,
+            )
+    finally:
+        pool.closeAll()
+        server.stop()
+
+
+def benchLockToken(bench):
+    from zem.document import extractLockToken
+    from davserver import LOCK_REPLY
+
+    reply = LOCK_REPLY % {
+        "token": "0f4ac1d2-5a6b-4c3d-8e9f-0a1b2c3d4e5f",
+        "timeout": "Second-600",
+    }
+    reply = reply.encode("utf8")
+    bench.time(
+        "extractLockToken",
+        lambda: [extractLockToken(reply) for i in range(10000)],
+        calls=10000,
+    )
+
+
+def compare(results, filename):
+    with open(filename) as f:
+        previous = json.load(f)["results"]
+    index = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in previous}
+    print("\nmedian relative to %s:" % filename)
+    for result in results:
+        key = (result["name"], json.dumps(result["params"], sort_keys=True))
+        if key in index:
+            print(
+                "%-28s %-24s %6.2fx"
+                % (
+                    result["name"],
+                    " ".join(
+                        "%s=%s" % item for item in sorted(result["params"].items())
+                    ),
+                    result["median"] / index[key]["median"],
+                )
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file")
+    parser.add_argument(
+        "--max-size", type=float, default=500, help="largest .zem body in MB"
+    )
+    parser.add_argument("--min-time", type=float, default=0.2)
+    options = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, use_locks=False, cleanup_files=False)
+
+    bench = Bench(options.min_time)
+    try:
+        benchParsing(bench, temp_dir)
+        benchOpening(bench, settings, temp_dir, options.max_size * 1024**2)
+        benchHelperApps(bench, settings, temp_dir)
+        benchRequests(bench, settings, temp_dir)
+        benchLockToken(bench)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    with open(options.output, "w") as f:
+        json.dump(
+            {
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": bench.results,
+            },
+            f,
+            indent=2,
+        )
+    print("\nwrote %s" % options.output)
+    if options.compare:
+        compare(bench.results, options.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#
+#  bench_profiling.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+What profiling the sync loop costs, switched on and off at runtime.
+
+Opens --documents objects from the local stand-in server (--latency
+seconds per request) and times sync rounds in which every content file
+is saved, the loop ticks and the uploads go out: with profiling off,
+then switched to "stacks" and "calls" on the same EditManager, then off
+again.  Prints the cost of a profiled call while profiling is off, the
+round times in each mode, where the sampled time went by leaf function,
+and how many per-call profiles were dumped.
+
+    python benchmarks/bench_profiling.py --documents 40 --rounds 5
+"""
+
+import argparse
+import os
+import queue
+import shutil
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+import support
+from bench_pipeline import writeZem
+from bench_remote_poll import pump
+from davserver import DAVServer
+from zem.manager import EditManager
+from zem.profiling import profiled, profiler
+
+
+def offCost(runs=200000):
+    """Seconds a profiled call costs over a plain one, profiling off"""
+
+    def plain():
+        pass
+
+    wrapped = profiled(plain)
+    timings = []
+    for fn in (plain, wrapped):
+        start = time.perf_counter()
+        for _ in range(runs):
+            fn()
+        timings.append((time.perf_counter() - start) / runs)
+    return timings[1] - timings[0]
+
+
+def leaves(filename, top=8):
+    """The functions the sampled stacks ended in, most samples first"""
+    counts = Counter()
+    with open(filename, encoding="utf8") as f:
+        for line in f:
+            stack, count = line.rsplit(" ", 1)
+            counts[stack.rsplit(";", 1)[-1]] += int(count)
+    return counts.most_common(top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=40)
+    parser.add_argument("--size", type=int, default=1024**2)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005)
+    options = parser.parse_args()
+
+    print("profiled call, profiling off: %.0f ns extra" % (offCost() * 1e9))
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(
+        temp_dir=temp_dir, cleanup_files=True, use_locks=False, quiet_window=0
+    )
+    server = DAVServer(latency=options.latency).start()
+    calls = queue.Queue()
+    manager = EditManager(settings, post=lambda fn, *args: calls.put((fn, args)))
+    saves = 0
+    try:
+        docs = []
+        for number in range(options.documents):
+            filename = os.path.join(temp_dir, "doc%d.zem" % number)
+            url = "http://%s/doc%d" % (server.host, number)
+            writeZem(filename, url, options.size)
+            docs.append(manager.openDocument(filename))
+
+        def syncRound():
+            nonlocal saves
+            saves += 1
+            body = b"<p>save %d</p>\n" % saves
+            for doc in docs:
+                with open(doc.getContentFile(), "wb") as f:
+                    f.write(body * (options.size // len(body)))
+                os.utime(doc.getContentFile(), (saves, saves))
+            start = time.perf_counter()
+            manager.tick()
+            pump(
+                calls,
+                lambda: manager.upload_counts["performed"] == saves * len(docs),
+            )
+            return time.perf_counter() - start
+
+        print(
+            "%d documents of %d bytes, %d rounds each"
+            % (options.documents, options.size, options.rounds)
+        )
+        for mode in (None, "stacks", "calls", None):
+            manager.configureProfiler(mode)
+            timings = [syncRound() for _ in range(options.rounds)]
+            print(
+                "  %-7s median round %7.1f ms"
+                % (mode or "off", statistics.median(timings) * 1000)
+            )
+            if mode == "stacks":
+                stacks = profiler.stacksFile()
+
+        print("sampled time by leaf function:")
+        for leaf, count in leaves(stacks):
+            print("  %6d  %s" % (count, leaf))
+        print(
+            "per-call profiles dumped: %d, in %s"
+            % (len(os.listdir(profiler.profilesDirectory())), temp_dir)
+        )
+        del docs
+    finally:
+        profiler.stop()
+        manager.coalescer.stop()
+        manager.sync_engine.shutdown()
+        del manager
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#
+#  bench_registry.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+The document registry with thousands of tracked objects.
+
+Opens --documents .zem files against the local stand-in server, then
+opens some of them again, which should hand back the documents already
+being edited without another LOCK.  Watcher lookups, drawing every
+table cell and finishing a quarter of the documents at once are timed
+against the way it was done with the plain list of documents.
+
+    python benchmarks/bench_registry.py --documents 2000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import support
+from bench_batch_open import writeBatch
+from davserver import DAVServer
+from zem.manager import EditManager
+
+COLUMNS = ("ContentFileName", "Editor")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def report(label, before, after):
+    print(
+        "%-28s before %8.2f ms   now %8.2f ms (%.0fx)"
+        % (label, before * 1000, after * 1000, before / after)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--reopen", type=int, default=100)
+    options = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, cleanup_files=False)
+    server = DAVServer().start()
+    try:
+        manager = EditManager(settings)
+        filenames = writeBatch(server, temp_dir, options.documents)
+        docs = manager.openDocuments(filenames)
+        assert len(manager.documents) == options.documents
+
+        locks = server.requests["LOCK"]
+        again = manager.openDocuments(filenames[: options.reopen])
+        assert again == docs[: options.reopen], "reopening made new documents"
+        assert server.requests["LOCK"] == locks, "reopening locked again"
+        assert len(manager.documents) == options.documents
+        print(
+            "reopened %d of %d objects: 0 new documents, 0 LOCKs"
+            % (options.reopen, options.documents)
+        )
+
+        # What contentFileChanged and the table used to do
+        paths = [doc.getContentFile() for doc in docs]
+        step = max(len(paths) // 200, 1)
+        report(
+            "watcher lookups",
+            timed(
+                lambda: [
+                    [doc for doc in list(docs) if doc.getContentFile() == path]
+                    for path in paths[::step]
+                ]
+            )
+            * step,
+            timed(lambda: [manager.documents.byContentFile(path) for path in paths]),
+        )
+
+        def drawTable():
+            for row in range(len(docs)):
+                for column in COLUMNS:
+                    manager.documents.value(row, column)
+
+        drawTable()  # the first draw fills the cache
+        report(
+            "redraw every cell",
+            timed(
+                lambda: [
+                    getattr(doc, "get" + column)() for doc in docs for column in COLUMNS
+                ]
+            ),
+            timed(drawTable),
+        )
+
+        # finishEdits: used to close the selected documents one by one
+        quarter = len(docs) // 4
+        one_by_one, at_once = docs[0::4][:quarter], docs[1::4][:quarter]
+        report(
+            "finish %d of %d" % (quarter, len(docs)),
+            timed(lambda: [manager.closeDocument(doc) for doc in one_by_one]),
+            timed(lambda: manager.closeDocuments(at_once)),
+        )
+        assert len(manager.documents) == options.documents - 2 * quarter
+        assert manager.documents.byContentFile(at_once[0].getContentFile()) is None
+
+        del manager, docs, again, one_by_one, at_once
+    finally:
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
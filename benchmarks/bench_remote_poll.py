@@ -0,0 +1,144 @@
+#
+#  bench_remote_poll.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Polling hundreds of documents for changes made in Zope.
+
+Opens --documents objects from the local stand-in server with
+poll_interval set to --interval seconds and leaves them alone: every
+poll should be answered with a 304 and no body, and the polls should
+thin out as the documents stay idle.  Then some objects are changed in
+Zope, which should refresh their content files without uploading them
+back, and one is changed on both sides, which should be flagged as a
+conflict and leave the local edits alone.
+
+    python benchmarks/bench_remote_poll.py --documents 300 --interval 0.2
+"""
+
+import argparse
+import os
+import queue
+import shutil
+import tempfile
+import time
+
+import support
+from davserver import DAVServer
+from zem.manager import EditManager
+
+BODY = b"<p>Hello Zope</p>\n"
+
+
+def writePolledZem(filename, url):
+    with open(filename, "wb") as f:
+        f.write(b"url:%s\n" % url.encode("utf8"))
+        f.write(b"meta_type:Page Template\n")
+        f.write(b"content_type:text/html\n")
+        f.write(b'etag:"0"\n')
+        f.write(b"\n")
+        f.write(BODY)
+
+
+def pump(calls, until, timeout=30):
+    """Run what the manager posts until until() is true"""
+    deadline = time.monotonic() + timeout
+    while not until():
+        if time.monotonic() > deadline:
+            raise AssertionError("gave up waiting")
+        try:
+            fn, args = calls.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        fn(*args)
+
+
+def content(doc):
+    with open(doc.getContentFile(), "rb") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=300)
+    parser.add_argument("--interval", type=float, default=0.2)
+    parser.add_argument("--changed", type=int, default=10)
+    options = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(
+        temp_dir=temp_dir,
+        cleanup_files=False,
+        use_locks=False,
+        poll_interval=options.interval,
+        quiet_window=3600.0,  # Local saves wait, so the poller sees them
+    )
+    server = DAVServer().start()
+    calls = queue.Queue()
+    manager = EditManager(settings, post=lambda fn, *args: calls.put((fn, args)))
+    try:
+        docs = []
+        for number in range(options.documents):
+            path = "/doc%d" % number
+            server.bodies[path] = BODY
+            filename = os.path.join(temp_dir, "doc%d.zem" % number)
+            writePolledZem(filename, "http://%s%s" % (server.host, path))
+            docs.append(manager.openDocument(filename))
+
+        # Idle: only 304s, fewer and fewer of them
+        start = time.monotonic()
+        counts = []
+        for second in range(4):
+            before = manager.poller.polls
+            pump(calls, lambda: time.monotonic() - start >= second + 1)
+            counts.append(manager.poller.polls - before)
+        gets = server.requests.get("GET", 0)
+        print(
+            "idle for 4s:  %d GETs, %d answered 304, %d body bytes, "
+            "%d wakeups"
+            % (gets, server.not_modified, server.served, manager.poller.wakeups)
+        )
+        print("polls per second as documents stay idle: %s" % counts)
+        assert gets == server.not_modified and server.served == 0
+        assert counts[-1] < counts[0], "idle documents are not backing off"
+
+        # Changed in Zope: refreshed here, not sent back
+        changed = docs[: options.changed]
+        for doc in changed:
+            server.versions[doc.path] = 1
+            server.bodies[doc.path] = b"<p>Changed in Zope</p>\n"
+        pump(
+            calls,
+            lambda: all(content(doc) == server.bodies[doc.path] for doc in changed),
+        )
+        manager.tick()  # A watcher would see the new files
+        assert all(doc.etag == '"1"' for doc in changed)
+        assert not any(manager.sync_engine.busy(doc) for doc in changed)
+        assert "PUT" not in server.requests
+        print("changed in Zope: %d content files refreshed, 0 PUTs" % len(changed))
+
+        # Changed on both sides: a conflict, local edits kept
+        doc = docs[-1]
+        with open(doc.getContentFile(), "wb") as f:
+            f.write(b"<p>Changed here</p>\n")
+        manager.tick()
+        server.versions[doc.path] = 1
+        server.bodies[doc.path] = b"<p>Changed in Zope too</p>\n"
+        pump(calls, lambda: doc.conflict)
+        assert content(doc) == b"<p>Changed here</p>\n"
+        assert not os.path.exists(doc.remoteFile())
+        print("changed on both sides: conflict flagged, local edits kept")
+        del doc, docs, changed
+    finally:
+        manager.poller.stop()
+        manager.coalescer.stop()
+        del manager
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#
+#  bench_retry.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Check the retry policy and circuit breaker against a misbehaving server.
+
+First a PUT meets two 503s and a 423 before getting through, and
+should succeed on its own without anybody being asked, with each PUT
+after the first counted as a retry.  Then the
+server answers every request with 503 while --documents documents try
+to save: the circuit breaker should open after a few failures, and
+the rest of the saves should fail without reaching the server at all
+until it lets a probe through.
+
+    python benchmarks/bench_retry.py --documents 50
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import support
+from bench_batch_open import writeBatch
+from davserver import DAVServer
+from zem.document import ZopeDocument
+from zem.metrics import metrics
+from zem.retry import breakers, policy
+
+
+def save(doc):
+    with open(doc.getContentFile(), "a") as f:
+        f.write("changed")
+    return doc.putChanges(interactive=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=50)
+    options = parser.parse_args()
+
+    policy.base_delay = 0.01  # Keep the backoff short, but do back off
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, cleanup_files=False, use_locks=False)
+    server = DAVServer().start()
+    try:
+        filenames = writeBatch(server, temp_dir, options.documents)
+        docs = [ZopeDocument(filename, settings) for filename in filenames]
+
+        server.faults["/doc0"] = [503, 503, 423]
+        start = time.perf_counter()
+        assert save(docs[0]), docs[0].sync_error
+        retries = metrics.retries[("PUT", server.host)]
+        print(
+            "transient failures: saved after %d PUTs in %.3fs, %d retries counted"
+            % (server.requests["PUT"], time.perf_counter() - start, retries)
+        )
+        assert retries == server.requests["PUT"] - 1
+
+        breaker = breakers.get(server.host)
+        before = server.requests["PUT"]
+        for doc in docs:
+            server.faults[doc.path] = [503] * policy.attempts
+        failed = sum(not save(doc) for doc in docs)
+        reached = server.requests["PUT"] - before
+        print(
+            "server down: %d of %d saves failed, %d PUTs reached the server "
+            "(%d without the breaker), breaker %s"
+            % (
+                failed,
+                options.documents,
+                reached,
+                options.documents * policy.attempts,
+                breaker.state,
+            )
+        )
+        assert failed == options.documents
+        assert reached <= breaker.threshold and breaker.state == "open"
+
+        server.faults.clear()
+        breaker.opened_at -= breaker.reset_timeout  # Pretend time has passed
+        assert save(docs[1]) and breaker.state == "closed"
+        print("after reset_timeout a probe got through and closed the breaker")
+        del docs
+    finally:
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#
+#  bench_shutdown.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Quitting with many locked documents.
+
+Opens and locks --documents objects on the local stand-in server (with
+--latency seconds per request), then lets go of them the way quitting
+used to, one UNLOCK after another, and the way it does now, through
+releaseDocuments: all at once under a deadline, with the local copies
+removed.  Then some objects stop answering UNLOCK altogether, which
+should cost no more than the deadline and leave those locks reported.
+Last it quits with saves to objects that stopped answering PUT still
+settling, which should take no longer either and keep those saves.
+
+    python benchmarks/bench_shutdown.py --documents 100 --latency 0.05
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import support
+from bench_pipeline import writeZem
+from davserver import DAVServer
+from zem.manager import EditManager
+from zem.ui import UI
+
+
+class QuietUI(UI):
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message):
+        self.messages.append(message)
+
+
+def openLocked(manager, server, temp_dir, count, prefix):
+    filenames = []
+    for number in range(count):
+        filename = os.path.join(temp_dir, "%s%d.zem" % (prefix, number))
+        writeZem(filename, "http://%s/%s%d" % (server.host, prefix, number), 1024)
+        filenames.append(filename)
+    docs = manager.openDocuments(filenames)
+    assert all(doc.lock_token for doc in docs)
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--hung", type=int, default=10)
+    parser.add_argument("--deadline", type=float, default=2.0)
+    options = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp("-zem-bench")
+    settings = support.settings(temp_dir=temp_dir, cleanup_files=True, use_locks=True)
+    server = DAVServer(latency=options.latency).start()
+    ui = QuietUI()
+    manager = EditManager(settings, ui)
+    try:
+        docs = openLocked(manager, server, temp_dir, options.documents, "serial")
+        start = time.monotonic()
+        for doc in docs:
+            doc.unlock(interactive=0)
+        manager.closeDocuments(docs)
+        serial = time.monotonic() - start
+        del docs
+
+        docs = openLocked(manager, server, temp_dir, options.documents, "bulk")
+        before = server.requests.get("UNLOCK", 0)
+        start = time.monotonic()
+        failed = manager.releaseDocuments(docs, options.deadline)
+        bulk = time.monotonic() - start
+        assert not failed
+        assert server.requests["UNLOCK"] - before == len(docs)
+        assert not any(os.path.exists(doc.getContentFile()) for doc in docs)
+        print(
+            "%d locks, %.0f ms a request: one by one %.2fs, releaseDocuments "
+            "%.2fs (%.1fx)"
+            % (len(docs), options.latency * 1000, serial, bulk, serial / bulk)
+        )
+        del docs
+
+        docs = openLocked(manager, server, temp_dir, options.documents, "hung")
+        hung = docs[: options.hung]
+        for doc in hung:
+            server.delays[doc.path] = 3600.0
+        start = time.monotonic()
+        failed = manager.releaseDocuments(docs, options.deadline)
+        took = time.monotonic() - start
+        assert set(failed) == set(hung), (len(failed), len(hung))
+        assert took < options.deadline + 1.0
+        assert not any(os.path.exists(doc.getContentFile()) for doc in docs)
+        print(
+            "%d of them never answered: released the rest in %.2fs "
+            "(deadline %.1fs), %d reported:"
+            % (len(hung), took, options.deadline, len(failed))
+        )
+        for message in ui.messages[-3:]:
+            print("  " + message)
+
+        docs = openLocked(manager, server, temp_dir, options.documents, "stuck")
+        stuck = docs[: options.hung]
+        for doc in stuck:
+            server.delays[doc.path] = 3600.0
+            with open(doc.getContentFile(), "a") as f:
+                f.write("unsent")
+            os.utime(doc.getContentFile(), (time.time() + 5, time.time() + 5))
+            manager.syncDocument(doc)
+        start = time.monotonic()
+        manager.shutdown(options.deadline)
+        took = time.monotonic() - start
+        assert took < options.deadline + 1.0
+        assert all(os.path.exists(doc.getContentFile()) for doc in stuck)
+        assert not any(os.path.exists(d.getContentFile()) for d in docs[options.hung :])
+        print(
+            "quit with %d uploads that never finish: %.2fs (deadline %.1fs), "
+            "their saves kept for next time" % (len(stuck), took, options.deadline)
+        )
+    finally:
+        manager.finishUploads(0)
+        del manager
+        server.stop()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#
+#  bench_startup.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Startup time against a budget: how long a cold launch takes to edit
+its first document.
+
+Double-clicking an edit link in the ZMI launches the app cold, so what
+it imports and does before opening that first .zem is time someone
+waits for their editor.  In fresh interpreters this times
+
+  - importing zem.manager, from python -X importtime
+  - a cold start up to the first document: interpreter start, imports,
+    EditManager, restoreSession, the file watcher, then opening and locking one .zem from
+    the local stand-in server
+
+and prints the modules that cost the most to import.  Exits with status
+1 when a median goes over its budget, --import-budget or --open-budget
+milliseconds.  AppKit is not measured; on a Mac the same cold start
+goes through ZemAppDelegate.init and application:openFile:.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import support
+from bench_pipeline import writeZem
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+
+def importTimes(module):
+    """(module, self microseconds, cumulative microseconds) as imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        cwd=support.ROOT,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            own, cumulative, name = line[len("import time:") :].split("|")
+            if own.strip().isdigit():
+                times.append((name.strip(), int(own), int(cumulative)))
+    return times
+
+
+def firstDocument(temp_dir, zem_file):
+    """Run as the child: start cold and open zem_file"""
+    from zem.manager import EditManager
+
+    imported = time.perf_counter()
+    manager = EditManager(support.settings(temp_dir=temp_dir, use_locks=True))
+    manager.restoreSession()
+    manager.startWatching()
+    doc = manager.openDocument(zem_file)
+    manager.lockDocument(doc)
+    opened = time.perf_counter()
+    print("%f %f" % (imported, opened))
+    doc.unlock(interactive=0)
+    manager.closeDocument(doc)
+    manager.finishUploads()
+
+
+def coldStart(host, temp_dir):
+    """Seconds from launching an interpreter to having edited a document"""
+    zem_file = os.path.join(temp_dir, "first.zem")
+    writeZem(zem_file, "http://%s/first" % host, 4096)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", temp_dir, zem_file],
+        cwd=BENCHMARKS,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    imported, opened = map(float, result.stdout.split())
+    return opened - start, imported - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--import-budget", type=float, default=75.0)
+    parser.add_argument("--open-budget", type=float, default=125.0)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    if options.child:
+        return firstDocument(*options.child)
+
+    imports = [importTimes("zem.manager") for _ in range(options.runs)]
+    import_ms = statistics.median(times[-1][2] for times in imports) / 1000
+    print(
+        "import zem.manager: median %.1f ms (budget %.0f)"
+        % (import_ms, options.import_budget)
+    )
+    print("slowest imports, own time:")
+    for name, own, _ in sorted(imports[-1], key=lambda item: -item[1])[:8]:
+        print("  %7.1f ms  %s" % (own / 1000, name))
+
+    server, host = support.startServer()
+    temp_dir = tempfile.mkdtemp("-zem-startup")
+    try:
+        starts = [coldStart(host, temp_dir) for _ in range(options.runs)]
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(temp_dir)
+    open_ms = statistics.median(opened for opened, _ in starts) * 1000
+    print(
+        "cold start to first document: median %.1f ms, of which %.1f ms "
+        "until imported (budget %.0f)"
+        % (
+            open_ms,
+            statistics.median(imported for _, imported in starts) * 1000,
+            options.open_budget,
+        )
+    )
+    over = []
+    if import_ms > options.import_budget:
+        over.append("imports")
+    if open_ms > options.open_budget:
+        over.append("first document")
+    if over:
+        print("over budget: %s" % ", ".join(over))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#
+#  bench_streaming_put.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Measure peak memory of a PUT read into memory against a streamed PUT.
+
+A content file of --size MB is uploaded to the local stand-in server
+twice: once read into a bytes body, the way putChanges used to, and
+once handed to the pool as an open file.  tracemalloc reports the peak
+Python allocation of each upload; the streamed one should stay at a
+few chunks no matter how large the file is.
+
+    python benchmarks/bench_streaming_put.py --size 300
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zem.pool import ConnectionPool  # noqa: E402
+from davserver import DAVServer  # noqa: E402
+
+
+def upload(pool, server, filename, streamed, ssl=0):
+    size = os.path.getsize(filename)
+    headers = [("Content-Length", str(size))]
+    tracemalloc.start()
+    start = time.perf_counter()
+    f = open(filename, "rb")
+    try:
+        if streamed:
+            body = f
+        else:
+            body = f.read()
+        status = pool.request(server.host, ssl, "PUT", "/big", headers, body).status
+        del body
+    finally:
+        f.close()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert status == 204 and server.sizes["/big"] == size
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=300, help="megabytes")
+    options = parser.parse_args()
+
+    fd, filename = tempfile.mkstemp("-zem-bench")
+    chunk = os.urandom(1024 * 1024)
+    with os.fdopen(fd, "wb") as f:
+        for i in range(options.size):
+            f.write(chunk)
+
+    server = DAVServer().start()
+    pool = ConnectionPool()
+    try:
+        for label, streamed in (("read()", 0), ("streamed", 1)):
+            elapsed, peak = upload(pool, server, filename, streamed)
+            print(
+                "%-9s %d MB in %.2fs, peak traced memory %.1f MB"
+                % (label, options.size, elapsed, peak / 1024.0 / 1024.0)
+            )
+    finally:
+        pool.closeAll()
+        server.stop()
+        os.remove(filename)
+
+
+if __name__ == "__main__":
+    main()
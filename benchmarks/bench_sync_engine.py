@@ -0,0 +1,94 @@
+#
+#  bench_sync_engine.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Show that SyncEngine uploads take as long as the slowest document.
+
+Every document gets its own server-side delay, from --fastest up to
+--slowest seconds.  The documents are uploaded once in series, the way
+updateIfModified_ used to, and once through SyncEngine.  A second pass
+queues several saves per document and checks that each document's PUTs
+reached the server in the order they were queued.
+
+    python benchmarks/bench_sync_engine.py --documents 8 --slowest 0.5
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zem.pool import ConnectionPool  # noqa: E402
+from zem.sync import SyncEngine  # noqa: E402
+from davserver import DAVServer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--fastest", type=float, default=0.05)
+    parser.add_argument("--slowest", type=float, default=0.5)
+    parser.add_argument("--saves", type=int, default=5)
+    options = parser.parse_args()
+
+    server = DAVServer().start()
+    pool = ConnectionPool(max_per_host=options.documents)
+    engine = SyncEngine(workers=options.documents)
+    paths = ["/doc%d" % doc for doc in range(options.documents)]
+    step = (options.slowest - options.fastest) / max(options.documents - 1, 1)
+    for doc, path in enumerate(paths):
+        server.delays[path] = options.fastest + doc * step
+
+    def put(path, body=b"x" * 1024):
+        headers = [("Content-Length", str(len(body)))]
+        return pool.request(server.host, 0, "PUT", path, headers, body).status
+
+    try:
+        start = time.perf_counter()
+        for path in paths:
+            put(path)
+        serial = time.perf_counter() - start
+
+        finished = threading.Semaphore(0)
+        start = time.perf_counter()
+        for path in paths:
+            engine.submit(
+                path, lambda path=path: put(path), lambda *a: finished.release()
+            )
+        for path in paths:
+            finished.acquire()
+        concurrent = time.perf_counter() - start
+
+        print("sum of delays:     %.3fs" % sum(server.delays.values()))
+        print("slowest document:  %.3fs" % max(server.delays.values()))
+        print("serial uploads:    %.3fs" % serial)
+        print("SyncEngine:        %.3fs" % concurrent)
+        assert concurrent < options.slowest * 1.5, "uploads did not overlap"
+
+        order = {path: [] for path in paths}
+        for save in range(options.saves):
+            for path in paths:
+                body = b"%d" % save
+                engine.submit(
+                    path,
+                    lambda path=path, body=body: put(path, body),
+                    lambda key, result, error, save=save: order[key].append(save),
+                )
+        engine.shutdown()
+        for path in paths:
+            assert order[path] == list(range(options.saves)), order[path]
+        print("per-document order preserved for %d saves each" % options.saves)
+    finally:
+        pool.closeAll()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#
+#  davserver.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+A local stand-in for a Zope WebDAV server, used by the benchmarks.
+
+It understands just enough LOCK, UNLOCK, PUT, GET and HEAD to look like
+Zope to ZopeEditManager.  It remembers the size and an ETag for each
+object, refuses PUTs whose If-Match does not match, and counts the TCP
+connections it accepts, so callers can see how many handshakes a
+workload cost.
+
+Locks honour the Timeout header: a lock that was not refreshed (a LOCK
+with an If header naming its token) in time expires, after which its
+token is refused and anybody may lock the object again.  PUTs are not
+checked against locks.  Failures can be injected per path through
+faults, or at random into a fraction error_rate of all requests, and
+latency through delays.
+
+GET serves the bytes in bodies, or as many x's as the last PUT sent,
+and honours "Range: bytes=N-" with If-Range, and If-None-Match with a
+304.  Downloads can be cut off
+part way through with cutoffs: the connection is dropped after that
+many bytes of the body.
+
+Run on its own, so that it does not share a process (and a GIL) with
+what is being measured:
+
+    python benchmarks/davserver.py --port 8080 --latency 0.01 --error-rate 0.01
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import argparse
+import random
+import re
+import threading
+import time
+import uuid
+
+LOCK_REPLY = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<d:prop xmlns:d="DAV:">\n'
+    "  <d:lockdiscovery><d:activelock>\n"
+    "    <d:timeout>%(timeout)s</d:timeout>\n"
+    "    <d:locktoken><d:href>opaquelocktoken:%(token)s</d:href></d:locktoken>\n"
+    "  </d:activelock></d:lockdiscovery>\n"
+    "</d:prop>\n"
+)
+
+
+class DAVHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.stats_lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def readBody(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        size = remaining
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return size
+
+    def reply(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for header, value in headers:
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def count(self):
+        """Count the request and apply latency; True if a fault was sent"""
+        with self.server.stats_lock:
+            self.server.requests[self.command] = (
+                self.server.requests.get(self.command, 0) + 1
+            )
+            faults = self.server.faults.get(self.path)
+            status = faults and faults.pop(0)
+            if not status and random.random() < self.server.error_rate:
+                status = 503
+        latency = self.server.delays.get(self.path, self.server.latency)
+        if latency:
+            time.sleep(latency)
+        if status:
+            self.reply(status)
+            return 1
+        return 0
+
+    def liveLock(self):
+        """The (token, expires) of the lock on this path, unless expired"""
+        lock = self.server.locks.get(self.path)
+        if lock is not None and lock[1] is not None and lock[1] <= time.monotonic():
+            del self.server.locks[self.path]
+            self.server.expired += 1
+            lock = None
+        return lock
+
+    def do_LOCK(self):
+        self.readBody()
+        if self.count():
+            return
+        timeout = self.headers.get("Timeout", "Infinite")
+        match = re.match(r"Second-(\d+)", timeout, re.I)
+        if match:
+            timeout = "Second-%d" % min(int(match.group(1)), self.server.max_timeout)
+            expires = time.monotonic() + int(timeout[7:])
+        else:
+            timeout = "Infinite"
+            expires = None
+        with self.server.stats_lock:
+            lock = self.liveLock()
+            if_header = self.headers.get("If")
+            if if_header:
+                # Refreshing a lock we hold
+                if lock is None or lock[0] not in if_header:
+                    self.reply(412)
+                    return
+                token = lock[0]
+            elif lock is not None:
+                self.reply(423)
+                return
+            else:
+                token = str(uuid.uuid4())
+            self.server.locks[self.path] = (token, expires)
+        self.reply(
+            200,
+            (LOCK_REPLY % {"token": token, "timeout": timeout}).encode("utf8"),
+            [
+                ("Content-Type", 'text/xml; charset="utf-8"'),
+                ("Lock-Token", "<opaquelocktoken:%s>" % token),
+                ("Timeout", timeout),
+            ],
+        )
+
+    def do_UNLOCK(self):
+        self.readBody()
+        if self.count():
+            return
+        with self.server.stats_lock:
+            lock = self.liveLock()
+            if lock is None or lock[0] not in self.headers.get("Lock-Token", ""):
+                self.reply(409)
+                return
+            del self.server.locks[self.path]
+        self.reply(204)
+
+    def etag(self):
+        return '"%d"' % self.server.versions.get(self.path, 0)
+
+    def do_PUT(self):
+        size = self.readBody()
+        if self.count():
+            return
+        if_match = self.headers.get("If-Match")
+        if if_match and if_match != self.etag():
+            self.reply(412)
+            return
+        self.server.sizes[self.path] = size
+        self.server.bodies.pop(self.path, None)
+        self.server.versions[self.path] = self.server.versions.get(self.path, 0) + 1
+        self.reply(204, headers=[("ETag", self.etag())])
+
+    def do_GET(self):
+        if self.count():
+            return
+        body = self.server.bodies.get(self.path)
+        if body is None:
+            body = b"x" * self.server.sizes.get(self.path, 0)
+        status = 200
+        headers = [("ETag", self.etag())]
+        if self.headers.get("If-None-Match") == self.etag():
+            with self.server.stats_lock:
+                self.server.not_modified += 1
+            self.reply(304, headers=headers)
+            return
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if match and (if_range is None or if_range == self.etag()):
+            start = int(match.group(1))
+            if start >= len(body):
+                self.reply(416, headers=[("Content-Range", "bytes */%d" % len(body))])
+                return
+            status = 206
+            headers.append(
+                ("Content-Range", "bytes %d-%d/%d" % (start, len(body) - 1, len(body)))
+            )
+            body = body[start:]
+        with self.server.stats_lock:
+            cutoff = None
+            if self.command == "GET":
+                cutoffs = self.server.cutoffs.get(self.path)
+                if cutoffs:
+                    cutoff = cutoffs.pop(0)
+                self.server.served += len(body[:cutoff])
+        if cutoff is None:
+            self.reply(status, body, headers)
+            return
+        # Promise the whole body, send part of it and hang up
+        self.send_response(status)
+        for header, value in headers:
+            self.send_header(header, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:cutoff])
+        self.close_connection = True
+
+    do_HEAD = do_GET
+
+
+class DAVServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, error_rate=0.0):
+        ThreadingHTTPServer.__init__(self, address, DAVHandler)
+        self.latency = latency
+        self.error_rate = error_rate  # fraction of requests answered with a 503
+        self.delays = {}  # path -> latency overriding the default
+        self.faults = {}  # path -> statuses to answer the next requests with
+        self.stats_lock = threading.Lock()
+        self.connections = 0
+        self.requests = {}
+        self.locks = {}  # path -> (token, monotonic expiry time or None)
+        self.max_timeout = 3600
+        self.expired = 0
+        self.sizes = {}
+        self.versions = {}  # path -> version number, used as the ETag
+        self.bodies = {}  # path -> what GET serves, rather than x's
+        self.cutoffs = {}  # path -> body bytes to send the next GETs before hanging up
+        self.served = 0  # body bytes sent for GETs
+        self.not_modified = 0  # GETs answered with a 304
+
+    @property
+    def host(self):
+        return "%s:%d" % self.server_address[:2]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=0, help="default: any free one")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    options = parser.parse_args()
+    server = DAVServer(("127.0.0.1", options.port), options.latency, options.error_rate)
+    print(server.host, flush=True)  # For whoever started us, to connect to
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#
+#  replay_trace.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Replay a trace of the sync traffic against the stand-in server.
+
+Traces are recorded with the record_trace preference, or python -m zem
+--trace, to zopeeditmanager-trace.jsonl in the temporary directory.  A
+trace that was rotated is read with its older parts (.3, .2, .1) first.
+Events are replayed with the timing they were recorded with, or with
+--fast as soon as the ones before them allow.
+
+  requests  (the default) sends the recorded requests themselves, with
+            as many bytes as they had and their headers less the lock
+            conditional ones, which the stand-in server would refuse.
+            Masked lock tokens are filled in with those the replayed
+            LOCKs got.  Requests for one object go in the recorded order,
+            those for different objects concurrently.  Shows how the
+            traffic as it was fares against a server with --latency.
+  changes   writes the recorded changes to the content files of a real
+            EditManager, which makes its own requests.  Replays the
+            workload through the sync loop as it is now, to compare a
+            fix against the traffic that was recorded.
+
+Reports the requests per method, recorded and replayed, with their
+median and 99th percentile seconds and errors, and how long the replay
+took against the span of the trace.
+
+    python benchmarks/replay_trace.py /tmp/zopeeditmanager-trace.jsonl
+    python benchmarks/replay_trace.py --mode changes --fast trace.jsonl
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import support
+from bench_pipeline import writeZem
+from zem.daemon import Daemon
+from zem.document import extractLockToken
+from zem.pool import pool
+from zem.sync import SyncEngine
+from zem.trace import trace
+from zem.ui import UI
+
+# Headers not sent again: the stand-in server does not have the
+# versions they name
+REPLAY_SKIPS = (
+    "content-length",
+    "if-match",
+    "if-modified-since",
+    "if-none-match",
+    "if-range",
+    "if-unmodified-since",
+)
+
+
+def traceFiles(filename):
+    """filename and the parts rotated out of it, oldest first"""
+    older = []
+    while os.path.exists("%s.%d" % (filename, len(older) + 1)):
+        older.append("%s.%d" % (filename, len(older) + 1))
+    return older[::-1] + [filename]
+
+
+def readTrace(filename):
+    records = []
+    for part in traceFiles(filename):
+        with open(part, encoding="utf8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass  # Cut short by a crash
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+class Clock:
+    """Waits for the time of each recorded event, unless fast"""
+
+    def __init__(self, records, fast):
+        self.fast = fast
+        self.first = records[0]["t"] if records else 0.0
+        self.start = time.monotonic()
+
+    def wait(self, t):
+        if not self.fast:
+            delay = self.start + (t - self.first) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def replayRequests(records, host, fast, workers):
+    """Send the recorded requests again; returns what was sent as records"""
+    engine = SyncEngine(workers)
+    replayed = []
+    tokens = {}  # path -> the token of the lock the replay holds on it
+    lock = threading.Lock()
+
+    def send(record):
+        path = record["doc"]
+        token = tokens.get(path, "")
+        headers = []
+        for name, value in record["h"].items():
+            if name.lower() == "if":
+                value = "<%s> (<%s>)" % (path, token)
+            elif name.lower() == "lock-token":
+                value = "<%s>" % token
+            elif name.lower() in REPLAY_SKIPS:
+                continue
+            headers.append((name, value))
+        body = b"x" * record["sent"]
+        headers.append(("Content-Length", str(len(body))))
+        start = time.monotonic()
+        try:
+            response = pool.request(host, False, record["m"], path, headers, body)
+            status = response.status
+            if record["m"] == "LOCK" and status == 200:
+                tokens[path] = (extractLockToken(response.read()) or b"").decode()
+        except Exception:
+            status = 0
+        with lock:
+            replayed.append(
+                {"m": record["m"], "s": status, "d": time.monotonic() - start}
+            )
+
+    clock = Clock(records, fast)
+    for record in records:
+        if record["ev"] == "req":
+            clock.wait(record["t"])
+            engine.submit(record["doc"], lambda record=record: send(record))
+    engine.shutdown()
+    return replayed
+
+
+class QuietUI(UI):
+    def log(self, message):
+        pass
+
+
+def replayChanges(records, host, fast, temp_dir, quiet_window=None):
+    """
+    Make the recorded changes to the content files of a real EditManager,
+    which traces its own requests.  Returns those as records.
+    """
+    overrides = dict(
+        temp_dir=temp_dir,
+        cleanup_files=True,
+        use_locks=any(record.get("m") == "LOCK" for record in records),
+        record_trace=True,
+    )
+    if quiet_window is not None:
+        overrides["quiet_window"] = quiet_window
+    daemon = Daemon(support.settings(**overrides), ui=QuietUI())
+    loop = threading.Thread(target=daemon.run, name="Daemon", daemon=True)
+    loop.start()
+
+    def call(fn, *args):
+        """Run fn on the daemon's loop, as the app would, and wait for it"""
+        done = threading.Event()
+        result = []
+
+        def run():
+            try:
+                result.append(fn(*args))
+            finally:
+                done.set()
+
+        daemon.post(run)
+        done.wait()
+        return result[0]
+
+    def openDocument(record):
+        filename = os.path.join(temp_dir, "doc%d.zem" % len(docs))
+        url = "http://%s%s" % (host, record["doc"])
+        writeZem(
+            filename,
+            url,
+            record.get("size", 0),
+            content_type=record.get("type", "text/html"),
+        )
+        docs[record["doc"]] = call(daemon.open, [filename])[0]
+
+    def settle():
+        """Wait for the sync loop to upload the changes made so far"""
+        time.sleep(0.1)  # For the watcher to see them
+        call(lambda: None)
+        time.sleep(daemon.manager.coalescer.quiet)
+        while call(lambda: daemon.manager.uploads_in_flight):
+            time.sleep(0.1)
+
+    def close(doc):
+        doc.unlock(interactive=0)
+        daemon.manager.closeDocument(doc)
+
+    docs = {}
+    saves = 0
+    clock = Clock(records, fast)
+    for record in records:
+        if record["ev"] not in ("open", "change", "close"):
+            continue
+        clock.wait(record["t"])
+        if record["ev"] == "open" or record["doc"] not in docs:
+            # Opened before the oldest part of the trace we still have
+            openDocument(record)
+            if record["ev"] == "open":
+                continue
+        if record["ev"] == "close":
+            # Closing drops saves still settling, which had gone out by now
+            settle()
+            call(close, docs.pop(record["doc"]))
+            continue
+        saves += 1
+        body = b"<p>save %d</p>\n" % saves
+        content_file = docs[record["doc"]].getContentFile()
+        with open(content_file, "wb") as f:
+            f.write((body * (record["size"] // len(body) + 1))[: record["size"]])
+        # Saves replayed faster than the file system's clock ticks would
+        # otherwise look like one
+        os.utime(content_file, (record["t"], record["t"]))
+
+    settle()
+    daemon.stop()
+    loop.join()
+    daemon.shutdown()
+    trace.stop()
+    docs.clear()
+    del daemon
+    return readTrace(os.path.join(temp_dir, "zopeeditmanager-trace.jsonl"))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def summary(records):
+    """method -> (requests, seconds taken, errors)"""
+    methods = {}
+    for record in records:
+        if "m" not in record:
+            continue
+        method = methods.setdefault(record["m"], [0, [], 0])
+        method[0] += 1
+        method[1].append(record["d"])
+        if record["s"] == 0 or record["s"] >= 400:
+            method[2] += 1
+    return methods
+
+
+def report(recorded, replayed):
+    recorded, replayed = summary(recorded), summary(replayed)
+    print(
+        "%-8s %9s %9s %8s %8s %8s %8s %7s %7s"
+        % (
+            "method",
+            "recorded",
+            "replayed",
+            "rec p50",
+            "now p50",
+            "rec p99",
+            "now p99",
+            "rec err",
+            "now err",
+        )
+    )
+    for method in sorted(set(recorded) | set(replayed)):
+        before = recorded.get(method, [0, [], 0])
+        after = replayed.get(method, [0, [], 0])
+        print(
+            "%-8s %9d %9d %8.3f %8.3f %8.3f %8.3f %7d %7d"
+            % (
+                method,
+                before[0],
+                after[0],
+                percentile(before[1], 0.5),
+                percentile(after[1], 0.5),
+                percentile(before[1], 0.99),
+                percentile(after[1], 0.99),
+                before[2],
+                after[2],
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("trace", help="zopeeditmanager-trace.jsonl")
+    parser.add_argument("--mode", choices=("requests", "changes"), default="requests")
+    parser.add_argument("--fast", action="store_true", help="do not keep the timing")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--quiet-window", type=float)
+    options = parser.parse_args()
+
+    records = readTrace(options.trace)
+    if not records:
+        parser.error("%s has nothing to replay" % options.trace)
+    server, host = support.startServer(options.latency, options.error_rate)
+    temp_dir = tempfile.mkdtemp("-zem-replay")
+    try:
+        start = time.monotonic()
+        if options.mode == "requests":
+            replayed = replayRequests(records, host, options.fast, options.workers)
+        else:
+            replayed = replayChanges(
+                records, host, options.fast, temp_dir, options.quiet_window
+            )
+        took = time.monotonic() - start
+        report(records, replayed)
+        print(
+            "%d events spanning %.1fs, replayed in %.1fs"
+            % (len(records), records[-1]["t"] - records[0]["t"], took)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
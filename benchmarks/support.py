@@ -0,0 +1,47 @@
+#
+#  support.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Shared setup for the benchmarks: makes the zem core importable from a
+checkout and builds settings like the app's defaults, without AppKit.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from zem.settings import DictSettings  # noqa: E402
+
+
+def settings(**overrides):
+    """The bundled default preferences, with overrides applied"""
+    return DictSettings.fromPlist(**overrides)
+
+
+def startServer(latency=0.0, error_rate=0.0):
+    """
+    Run the stand-in server in a process of its own, so that its work
+    does not count against what is being measured.  Returns the process
+    and the host to connect to; terminate() the process when done.
+    """
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "davserver.py"),
+            "--latency",
+            str(latency),
+            "--error-rate",
+            str(error_rate),
+        ],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    return process, process.stdout.readline().strip()
@@ -0,0 +1,14 @@
+#
+#  __init__.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+The AppKit-free core of ZopeEditManager: .zem parsing, helper-app
+resolution, WebDAV locking and the sync loop.  The Cocoa application
+and the headless daemon (python -m zem) are both built on it.
+"""
+
+__version__ = "0.9"
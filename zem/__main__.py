@@ -0,0 +1,12 @@
+#
+#  __main__.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+import sys
+
+from zem.daemon import main
+
+sys.exit(main())
@@ -0,0 +1,214 @@
+#
+#  daemon.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Keep .zem documents synced to Zope without the Cocoa application.
+
+    python -m zem [options] [file.zem ...]
+
+Every .zem file given on the command line is opened and locked, and
+saves to its content file are uploaded until the daemon is stopped
+with SIGINT or SIGTERM, which unlocks everything.  With --drop-dir, .zem
+files that appear in that directory are picked up as well.  Documents
+still open when the daemon was last killed, or with saves Zope never
+got, are picked up again from the journal in the temporary directory.
+SIGHUP reads the preferences file again, SIGUSR1 switches profiling
+the sync loop on and off.
+"""
+
+from zem.locks import RELEASE_DEADLINE
+from zem.manager import EditManager
+from zem.profiling import MODES, profiler
+from zem.settings import DEFAULTS_PLIST, DictSettings, LiveSettings
+from zem.ui import UI
+
+import argparse
+import os
+import queue
+import signal
+import time
+
+
+class DaemonUI(UI):
+    def documentSynced(self, doc, result):
+        if result == "failed":
+            self.log("%s: %s" % (doc.getContentFile(), doc.sync_error))
+        else:
+            self.log("%s: %s" % (doc.getContentFile(), result))
+
+    def bodyFetched(self, doc):
+        self.log("Editing %s" % doc.getContentFile())
+
+
+class Daemon:
+    def __init__(self, settings, drop_dir=None, ui=None):
+        self.settings = settings
+        self.drop_dir = drop_dir
+        self.calls = queue.Queue()
+        self.manager = EditManager(settings, ui or DaemonUI(), post=self.post)
+        self.seen = set()
+        self.running = 0
+        self.next_tick = 0.0  # When run() calls tick() next
+
+    def post(self, fn, *args):
+        """Run fn on the daemon's own loop, like the app's main thread"""
+        self.calls.put((fn, args))
+
+    def open(self, filenames):
+        """Open, lock and start syncing a batch of .zem files"""
+        docs = self.manager.openDocuments(filenames)
+        for doc in docs:
+            if doc.bodyPending():
+                self.manager.fetchBody(doc)
+            else:
+                self.manager.ui.log("Editing %s" % doc.getContentFile())
+        return docs
+
+    def scanDropDirectory(self):
+        """Open .zem files that appeared in the drop directory"""
+        names = set(name for name in os.listdir(self.drop_dir) if name.endswith(".zem"))
+        self.seen &= names  # forget files that were removed
+        new = sorted(names - self.seen)
+        self.seen.update(new)
+        if new:
+            self.open([os.path.join(self.drop_dir, name) for name in new])
+
+    def run(self, poll_interval=1.0):
+        self.running = 1
+        self.manager.startWatching()
+        self.next_tick = next_scan = time.monotonic()
+        while self.running:
+            try:
+                fn, args = self.calls.get(timeout=poll_interval)
+                fn(*args)
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if now >= self.next_tick:
+                self.manager.tick()
+                self.next_tick = now + self.manager.saveInterval()
+            if self.drop_dir and now >= next_scan:
+                self.scanDropDirectory()
+                next_scan = now + poll_interval
+
+    def reload(self, options):
+        """Swap in the preferences as they are in the file now"""
+        try:
+            self.settings.reload(readSettings(options))
+        except Exception as e:
+            self.manager.ui.log("Could not read %s: %s" % (options.preferences, e))
+        else:
+            self.manager.ui.log("Read %s again" % options.preferences)
+            self.manager.settingsChanged()
+            self.next_tick = time.monotonic()  # At the new save_interval
+
+    def toggleProfiler(self):
+        """Start profiling as the preferences say, or sampling stacks; or stop"""
+        if profiler.mode is None:
+            mode = self.settings.getString("profile") or "stacks"
+        else:
+            mode = None
+        self.manager.configureProfiler(mode)
+
+    def stop(self, *args):
+        self.running = 0
+
+    def shutdown(self, deadline=RELEASE_DEADLINE):
+        """
+        Finish pending uploads, then unlock and forget every document,
+        within deadline seconds as EditManager.shutdown does
+        """
+        give_up = time.monotonic() + deadline
+        self.manager.finishUploads(deadline / 2)
+        while not self.calls.empty():
+            fn, args = self.calls.get()
+            fn(*args)
+        self.manager.logUploadCounts()
+        self.manager.releaseAll(max(0.0, give_up - time.monotonic()))
+        profiler.stop()
+
+
+def readSettings(options):
+    """The preferences file, with the command line options applied"""
+    settings = DictSettings.fromPlist(options.preferences)
+    if options.temp_dir:
+        settings.setObject("temp_dir", options.temp_dir)
+    if options.save_interval:
+        settings.setObject("save_interval", options.save_interval)
+    if options.quiet_window is not None:
+        settings.setObject("quiet_window", options.quiet_window)
+    if options.no_locks:
+        settings.setObject("use_locks", False)
+    if options.lock_timeout:
+        settings.setObject("lock_timeout", options.lock_timeout)
+    if options.poll_interval is not None:
+        settings.setObject("poll_interval", options.poll_interval)
+    if options.trace:
+        settings.setObject("record_trace", True)
+    if options.profile:
+        settings.setObject("profile", options.profile)
+    return settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m zem", description=__doc__.strip().split("\n\n")[0]
+    )
+    parser.add_argument("files", nargs="*", help=".zem files to edit")
+    parser.add_argument(
+        "--preferences",
+        default=DEFAULTS_PLIST,
+        help="preferences plist (default: the one bundled with the app)",
+    )
+    parser.add_argument("--drop-dir", help="also open .zem files saved here")
+    parser.add_argument("--temp-dir", help="where to keep content files")
+    parser.add_argument("--save-interval", type=float, help="seconds between polls")
+    parser.add_argument(
+        "--quiet-window",
+        type=float,
+        help="seconds saves have to settle for before uploading",
+    )
+    parser.add_argument("--no-locks", action="store_true", help="do not lock objects")
+    parser.add_argument(
+        "--lock-timeout", type=int, help="seconds locks last unless refreshed"
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        help="seconds between checks for changes made in Zope (0: never)",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="record the sync traffic to zopeeditmanager-trace.jsonl",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=MODES,
+        help="profile the sync loop to the temporary directory (SIGUSR1 toggles)",
+    )
+    options = parser.parse_args(argv)
+
+    settings = LiveSettings(readSettings(options))
+    daemon = Daemon(settings, options.drop_dir)
+    restored = daemon.manager.restoreSession()
+    if not options.files and not options.drop_dir and not restored:
+        parser.error("give some .zem files or a --drop-dir")
+    for doc in restored:
+        daemon.manager.ui.log("Still editing %s" % doc.getContentFile())
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *args: daemon.post(daemon.reload, options))
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *args: daemon.post(daemon.toggleProfiler))
+    daemon.open(options.files)
+    try:
+        daemon.run()
+    finally:
+        daemon.shutdown()
+    return 0
@@ -0,0 +1,849 @@
+#
+#  document.py
+#  ZopeEditManager
+#
+#  Created by Zachery Bir on 2003-08-20.
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+from tempfile import gettempdir
+from urllib.parse import urlparse
+
+from zem import __version__
+from zem.helpers import helperIndex
+from zem.metrics import metrics
+from zem.pool import BodyChanged, pool
+from zem.profiling import profiled
+from zem.retry import breakers, policy
+from zem.trace import trace
+from zem.ui import UI
+
+import hashlib
+import os
+import re
+import shutil
+import sys
+import time
+
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+# Seconds a lock lasts unless refreshed, when lock_timeout is not set.
+# Short enough that a crash does not leave objects locked for long.
+LOCK_TIMEOUT = 600
+
+
+def fileDigest(filename, chunk_size=DIGEST_CHUNK_SIZE):
+    """
+    Return the md5 hex digest of a file, reading it in chunks.  filename
+    may also be a file already open for binary reading.
+    """
+    md5 = hashlib.md5()
+    if hasattr(filename, "read"):
+        in_f = filename
+    else:
+        in_f = open(filename, "rb")
+    try:
+        while 1:
+            chunk = in_f.read(chunk_size)
+            if not chunk:
+                break
+            md5.update(chunk)
+    finally:
+        if in_f is not filename:
+            in_f.close()
+    return md5.hexdigest()
+
+
+def parseTimeout(value):
+    """Seconds from a WebDAV timeout ("Second-600"), None for Infinite"""
+    match = re.match(rb"\s*Second-(\d+)", value, re.I)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def extractTimeout(reply):
+    """Find the granted timeout in the body of a LOCK response"""
+    match = re.search(rb"<(?:\w+:)?timeout>([^<]*)<", reply, re.I)
+    if match:
+        return match.group(1)
+    return None
+
+
+def extractLockToken(reply):
+    """Find the opaquelocktoken in the body of a LOCK response"""
+    token_start = reply.find(b">opaquelocktoken:")
+    token_end = reply.find(b"<", token_start)
+    if token_start > 0 and token_end > 0:
+        return reply[token_start + 1 : token_end]
+    return None
+
+
+class NullResponse:
+    """Stands in for a response when there was none"""
+
+    status = 0
+
+    def __init__(self, message="(No Response From Server)", reason=None):
+        self.message = message.encode("utf8")
+        self.reason = reason or message
+
+    def getheader(self, name, default=None):
+        return default
+
+    def read(self):
+        return self.message
+
+
+def zemObject(filename):
+    """(host, path) of the object a .zem file is for, from its headers"""
+    with open(filename, "rb") as in_f:
+        metadata = ZopeDocument.getMetadata(in_f)
+    scheme, host, path = urlparse(metadata["url"])[:3]
+    return host, path
+
+
+class ZopeDocument:
+    # Hundreds of these can be open at once, and none of them keep the
+    # object body around; it only ever lives in the content file
+    __slots__ = (
+        "filename",
+        "lock_token",
+        "metadata",
+        "settings",
+        "ui",
+        "options",
+        "host",
+        "path",
+        "ssl",
+        "content_file",
+        "last_mtime",
+        "last_digest",
+        "last_size",
+        "saved",
+        "did_lock",
+        "lock_timeout",
+        "lock_expires",
+        "uploads_performed",
+        "uploads_skipped",
+        "sync_error",
+        "etag",
+        "last_modified",
+        "conflict",
+        "unreachable",
+    )
+
+    @profiled
+    def __init__(self, filename, settings, ui=None):
+        self.filename = filename
+        self.settings = settings
+        self.ui = ui or UI()
+        self.lock_token = None
+        in_f = open(filename, "rb")
+        try:
+            self.metadata = self.getMetadata(in_f)
+            # Validators for the version we are about to edit, if Zope sent them
+            self.etag = self.metadata.get("etag")
+            self.last_modified = self.metadata.get("last-modified")
+            self.initOptions()
+            self.content_file = self.generateContentFile(in_f)
+        finally:
+            in_f.close()
+
+        self.last_mtime = os.path.getmtime(self.content_file)
+
+        if self.ssl:
+            # See if ssl is available
+            try:
+                import ssl
+            except ImportError:
+                self.ui.fatal(
+                    "SSL support is not available on this system. "
+                    "Make sure openssl is installed "
+                    "and reinstall Python."
+                )
+
+        self.saved = 1
+        self.did_lock = 0
+        self.lock_timeout = None
+        self.lock_expires = None
+        self.uploads_performed = 0
+        self.uploads_skipped = 0
+        self.sync_error = None
+        self.conflict = 0
+        self.unreachable = 0
+
+    @classmethod
+    def restore(cls, entry, settings, ui=None):
+        """
+        Rebuild a document from its journal entry, without needing the
+        .zem file (long gone) or touching its content file
+        """
+        self = cls.__new__(cls)
+        self.filename = entry["filename"]
+        self.settings = settings
+        self.ui = ui or UI()
+        self.metadata = entry["metadata"]
+        self.initOptions()
+        self.content_file = entry["content_file"]
+        self.lock_token = entry["lock_token"]
+        if self.lock_token is not None:
+            self.lock_token = self.lock_token.encode("utf8")
+        self.did_lock = entry["did_lock"]
+        # We cannot know how much of the lock is left, so have it
+        # refreshed straight away
+        self.lock_timeout = entry["lock_timeout"]
+        self.lock_expires = None
+        if self.lock_timeout is not None:
+            self.lock_expires = time.monotonic() + self.lock_timeout / 2.0
+        self.last_digest = entry["last_digest"]
+        self.last_size = entry["last_size"]
+        self.last_mtime = entry["last_mtime"]
+        self.etag = entry["etag"]
+        self.last_modified = entry["last_modified"]
+        self.saved = 1
+        self.uploads_performed = 0
+        self.uploads_skipped = 0
+        self.sync_error = None
+        self.conflict = 0
+        self.unreachable = 0
+        return self
+
+    def initOptions(self):
+        """Pick the helper app and work out where the object lives"""
+        scheme, self.host, self.path = urlparse(self.metadata["url"])[:3]
+        self.ssl = scheme == "https"
+
+        self.options = helperIndex(self.settings).resolve(
+            self.metadata.get("meta_type", None),
+            self.metadata.get("content_type", "text/plain"),
+            self.path,
+        )
+
+    def getEditor(self):
+        return self.options["editor"]
+
+    def getContentFile(self):
+        return self.content_file
+
+    def getContentFileName(self):
+        return os.path.split(self.content_file)[-1].split(",")[-1]
+
+    def getFilename(self):
+        return self.filename
+
+    def generateContentFile(self, in_f):
+        """
+        Copy the rest of the open .zem file into the content file in
+        chunks, hashing it on the way through
+        """
+        content_file = self.metadata.get("title", self.path.split("/")[-1])
+        md5 = hashlib.md5()
+        md5.update(self.host.encode("utf8"))
+        md5.update(self.path.encode("utf8"))
+        dir_name = md5.hexdigest()
+
+        extension = self.options.get("extension", None)
+
+        if extension and not content_file.endswith(extension):
+            content_file = content_file + extension
+
+        temp_dir = os.path.expanduser(
+            self.settings.getString("temp_dir") or gettempdir()
+        )
+
+        path = os.path.join(temp_dir, dir_name)
+        if not os.path.exists(path):
+            os.mkdir(path, 0o700)
+
+        content_file = os.path.join(path, content_file)
+
+        # Remember what Zope has now, so unchanged saves can be skipped
+        md5 = hashlib.md5()
+        size = 0
+        out_f = open(content_file, "wb")
+        try:
+            while 1:
+                chunk = in_f.read(DIGEST_CHUNK_SIZE)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                out_f.write(chunk)
+                size += len(chunk)
+        finally:
+            out_f.close()
+        self.last_digest = md5.hexdigest()
+        self.last_size = size
+
+        return content_file
+
+    @staticmethod
+    def getMetadata(in_f):
+        """Read the header block of an open .zem file into a dictionary"""
+        metadata = {}
+
+        while 1:
+            line = in_f.readline()[:-1]
+            if not line:
+                break
+            line = line.decode("utf8")
+            key, val = line.split(":", 1)
+            metadata[key] = val
+
+        return metadata
+
+    def removeFileIfNecessary(self, filename):
+        if self.settings.getBool("cleanup_files"):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass  # Sometimes we aren't allowed to delete it
+
+    def contentChanged(self):
+        """Does the content file differ from what was last sent to Zope?"""
+        size = os.path.getsize(self.content_file)
+        if size != self.last_size:
+            return 1
+        return fileDigest(self.content_file) != self.last_digest
+
+    @profiled
+    def putChanges(self, interactive=1):
+        """
+        Save changes to the file back to Zope.  When not interactive,
+        problems are left in sync_error for the caller to report instead
+        of being put in front of the user.
+        """
+        while 1:
+            self.sync_error = None
+            if self.settings.getBool("use_locks") and self.lock_token is None:
+                # We failed to get a lock initially, so try again before saving
+                if not self.lock(interactive):
+                    if not interactive:
+                        self.sync_error = "Could not acquire lock."
+                        return 0
+                    # Confirm save without lock
+                    if not self.ui.ask(
+                        "Lock Error",
+                        "Could not acquire lock. " "Attempt to save to Zope anyway?",
+                        "Yes",
+                        "No",
+                    ):
+                        return 0
+
+            headers = {"Content-Type": self.metadata.get("content_type", "text/plain")}
+
+            if self.lock_token is not None:
+                headers["If"] = "<%s> (<%s>)" % (
+                    self.path,
+                    self.lock_token.decode("utf8"),
+                )
+
+            # Only overwrite the version we started from
+            if self.etag:
+                headers["If-Match"] = self.etag
+            elif self.last_modified:
+                headers["If-Unmodified-Since"] = self.last_modified
+
+            # Stream the body from the file rather than reading it into memory,
+            # hashing the same open file first so the digest matches what we send
+            body = open(self.content_file, "rb")
+            try:
+                size = os.fstat(body.fileno()).st_size
+                digest = fileDigest(body)
+                body.seek(0)
+                response = self.zopeRequest("PUT", headers, body)
+            finally:
+                body.close()
+
+            if isinstance(getattr(response, "reason", None), BodyChanged):
+                continue  # Saved again while we were sending it, send that
+
+            if int(response.status / 100) == 2:
+                self.last_digest = digest
+                self.last_size = size
+                self.uploads_performed += 1
+                self.conflict = 0
+                if (self.etag or self.last_modified) and not self.updateValidators(
+                    response
+                ):
+                    # Zope did not say what the new version is, ask for it so the
+                    # next save is not refused for carrying our own old ETag
+                    validators = self.remoteValidators()
+                    if validators is not None:
+                        self.etag, self.last_modified = validators
+
+            elif response.status == 412:
+                # Someone else saved since we downloaded or last uploaded
+                self.conflict = 1
+                message = "The object was changed in Zope by someone else."
+                if not interactive:
+                    self.sync_error = message
+                    return 0
+                if self.ui.ask(
+                    "Conflict",
+                    message + " Overwrite their changes with yours?",
+                    "Overwrite",
+                    "Cancel",
+                ):
+                    self.forgetValidators()
+                    continue
+                return 0
+
+            if int(response.status / 100) != 2:
+                # Something went wrong
+                message = response.read().decode("utf8")
+                self.ui.log(message)
+                if not interactive:
+                    self.sync_error = message
+                    return 0
+                if self.ui.ask(
+                    message,
+                    "Could not save to Zope.\n" "Error occurred during HTTP put",
+                    "Retry",
+                    "Cancel",
+                ):
+                    continue
+                else:
+                    return 0
+            return 1
+
+    def bodyPending(self):
+        """
+        True until the body of an object whose .zem file came without
+        one (with a fetch_body header) has been downloaded
+        """
+        return "fetch_body" in self.metadata
+
+    def partialFile(self):
+        """Where the body is downloaded to before it becomes the content file"""
+        return self.content_file + ".part"
+
+    def fetchBody(self):
+        """
+        Download the body of the object into the content file, streaming
+        it to disk rather than holding it in memory.  The download goes
+        to partialFile() and only replaces the content file once it is
+        complete, so neither the editor nor the sync loop ever see half
+        of it.  An interrupted download is resumed where it stopped with
+        a Range request, as long as the object has not changed in the
+        meantime (If-Range), both on retries and after a restart.
+
+        Returns 1 once the content file holds the body.  On failure
+        sync_error says why and unreachable is set if Zope could not be
+        reached at all.
+        """
+        if not self.bodyPending():
+            return 1
+        part = self.partialFile()
+        opened = []
+        streamed = []
+        offset = 0
+
+        def rangeHeaders():
+            # Before every attempt, so a retry resumes from what the last got
+            nonlocal offset
+            while opened:
+                opened.pop().close()
+            del streamed[:]
+            headers = {}
+            offset = 0
+            if os.path.exists(part):
+                offset = os.path.getsize(part)
+            if offset and (self.etag or self.last_modified):
+                headers["Range"] = "bytes=%d-" % offset
+                headers["If-Range"] = self.etag or self.last_modified
+            return headers
+
+        def sink(response):
+            if response.status == 200:
+                out_f = open(part, "wb")
+            elif response.status == 206:
+                # Pick up at the offset Zope is sending from
+                match = re.match(
+                    r"bytes (\d+)-", response.getheader("Content-Range", "")
+                )
+                if not match or int(match.group(1)) > os.path.getsize(part):
+                    return None
+                out_f = open(part, "r+b")
+                out_f.truncate(int(match.group(1)))
+                out_f.seek(int(match.group(1)))
+            else:
+                return None
+            opened.append(out_f)
+            streamed.append(response.status)
+            self.updateValidators(response)  # What we are resuming
+            return out_f
+
+        while 1:
+            self.sync_error = None
+            try:
+                response = self.zopeRequest("GET", rangeHeaders, sink=sink)
+            finally:
+                while opened:
+                    opened.pop().close()
+            status = response.status
+
+            if status in (200, 206) and streamed:
+                break
+            if status in (206, 416) and offset:
+                os.remove(part)  # Not a range we can resume from, start over
+                continue
+            self.sync_error = response.read().decode("utf8", "replace")
+            return 0
+
+        self.last_digest = fileDigest(part)
+        self.last_size = os.path.getsize(part)
+        os.replace(part, self.content_file)
+        self.last_mtime = os.path.getmtime(self.content_file)
+        # Replaced rather than changed, the journal may be reading it
+        self.metadata = dict(
+            (key, value) for key, value in self.metadata.items() if key != "fetch_body"
+        )
+        return 1
+
+    def updateValidators(self, response):
+        """Remember the ETag and Last-Modified of a response, if it has any"""
+        etag = response.getheader("ETag")
+        last_modified = response.getheader("Last-Modified")
+        if etag:
+            self.etag = etag
+        if last_modified:
+            self.last_modified = last_modified
+        return etag or last_modified
+
+    def forgetValidators(self):
+        """Make the next PUT unconditional"""
+        self.etag = self.last_modified = None
+        self.conflict = 0
+
+    def remoteValidators(self):
+        """
+        Ask Zope for the current ETag and Last-Modified of the object with
+        a HEAD request, without downloading it.  None if the request fails.
+        """
+        response = self.zopeRequest("HEAD")
+        if int(response.status / 100) != 2:
+            return None
+        return (response.getheader("ETag"), response.getheader("Last-Modified"))
+
+    def remoteFile(self):
+        """Where a newer version found in Zope is downloaded to"""
+        return self.content_file + ".remote"
+
+    def pollRemote(self):
+        """
+        Ask Zope whether the object changed since the version we know
+        about, with a GET conditional on our ETag (or Last-Modified) so
+        that an unchanged object costs a 304 and no body.  A newer
+        version is streamed to remoteFile(); whether it may replace the
+        content file is for the caller to decide.
+
+        Returns "unchanged", the (digest, size, etag, last_modified) of
+        the version in remoteFile(), or None when the object cannot be
+        polled: no validators to poll with, a body still to download, or
+        Zope not answering.
+        """
+        if self.bodyPending() or not (self.etag or self.last_modified):
+            return None
+        if self.etag:
+            headers = {"If-None-Match": self.etag}
+        else:
+            headers = {"If-Modified-Since": self.last_modified}
+        remote = self.remoteFile()
+        opened = []
+
+        def sink(response):
+            while opened:
+                opened.pop().close()  # From an attempt that failed midway
+            if response.status != 200:
+                return None
+            opened.append(open(remote, "wb"))
+            return opened[0]
+
+        try:
+            response = self.zopeRequest("GET", headers, sink=sink)
+        finally:
+            while opened:
+                opened.pop().close()
+        status = response.status
+
+        if status == 304:
+            return "unchanged"
+        if status != 200 or not os.path.exists(remote):
+            try:
+                os.remove(remote)
+            except OSError:
+                pass  # Nothing was downloaded
+            return None
+        etag = response.getheader("ETag")
+        if etag and etag == self.etag:
+            os.remove(remote)  # The server ignored If-None-Match
+            return "unchanged"
+        return (
+            fileDigest(remote),
+            os.path.getsize(remote),
+            etag,
+            response.getheader("Last-Modified"),
+        )
+
+    def lock(self, interactive=1):
+        """Apply a webdav lock to the object in Zope"""
+        if self.lock_token is not None:
+            return 0  # Already have a lock token
+
+        headers = {
+            "Content-Type": 'text/xml; charset="utf-8"',
+            "Timeout": self.timeoutHeader(),
+            "Depth": "infinity",
+        }
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<d:lockinfo xmlns:d="DAV:">\n'
+            "  <d:lockscope><d:exclusive/></d:lockscope>\n"
+            "  <d:locktype><d:write/></d:locktype>\n"
+            "  <d:depth>infinity</d:depth>\n"
+            "  <d:owner>\n"
+            "  <d:href>Zope External Editor</d:href>\n"
+            "  </d:owner>\n"
+            "</d:lockinfo>"
+        )
+
+        while 1:
+            response = self.zopeRequest("LOCK", headers, body)
+
+            if response.status / 100 == 2:
+                # We got our lock, extract the lock token and return it
+                token = extractLockToken(response.read())
+                if token is not None:
+                    self.lock_token = token
+                    self.did_lock = 1
+                    self.lockGranted(response)
+                break
+
+            # We can't lock her sir!
+            if response.status == 423:
+                message = "(object already locked)"
+            else:
+                message = ""
+
+            if not interactive or not self.ui.ask(
+                response.read().decode("utf8", "replace"),
+                "Lock request failed %s" % message,
+                "Retry",
+                "Cancel",
+            ):
+                self.did_lock = 0
+                break
+        return self.did_lock
+
+    def timeoutHeader(self):
+        """
+        The Timeout we ask for: lock_timeout seconds (LOCK_TIMEOUT if
+        unset), or an infinite lock if it is negative.
+        """
+        timeout = self.settings.getInt("lock_timeout") or LOCK_TIMEOUT
+        if timeout < 0:
+            return "Infinite"
+        return "Second-%d" % timeout
+
+    def lockGranted(self, response):
+        """Note when the lock Zope just gave or refreshed runs out"""
+        granted = response.getheader("Timeout") or extractTimeout(response.read())
+        if granted is None:
+            granted = self.timeoutHeader()
+        if isinstance(granted, str):
+            granted = granted.encode("latin-1")
+        self.lock_timeout = parseTimeout(granted)
+        if self.lock_timeout is None:
+            self.lock_expires = None
+        else:
+            self.lock_expires = time.monotonic() + self.lock_timeout
+
+    def refreshLock(self):
+        """
+        Extend our lock before it times out.  If Zope no longer knows
+        the token, try to take a fresh lock instead.  True if we hold a
+        lock with a new expiry time afterwards.
+        """
+        if not self.did_lock or self.lock_token is None:
+            return 0
+
+        headers = {
+            "If": "(<%s>)" % self.lock_token.decode("utf8"),
+            "Timeout": self.timeoutHeader(),
+        }
+        response = self.zopeRequest("LOCK", headers)
+
+        if response.status // 100 == 2:
+            self.lockGranted(response)
+            return 1
+        if response.status // 100 == 4:
+            # The lock expired or was removed behind our back
+            self.ui.log(
+                "Lock on %s was lost (%s), locking again"
+                % (self.getContentFileName(), response.status)
+            )
+            self.lock_token = None
+            self.did_lock = 0
+            return self.lock(interactive=0)
+        return 0  # No answer, the caller tries again later
+
+    def unlock(self, interactive=1):
+        """
+        Remove webdav lock from edited zope object.  Without interactive,
+        the lock is forgotten either way, and the result is whether Zope
+        released it.
+        """
+        if not self.did_lock or self.lock_token is None:
+            return 0  # nothing to do
+
+        headers = {"Lock-Token": self.lock_token}
+        while 1:
+            response = self.zopeRequest("UNLOCK", headers)
+
+            if not interactive or response.status / 100 == 2:
+                self.did_lock = 1
+                self.lock_token = None
+                if not interactive:
+                    return response.status // 100 == 2
+                break
+
+            # Captain, she's still locked!
+            if not self.ui.ask(
+                response.read().decode("utf8", "replace"),
+                "Unlock request failed",
+                "Retry",
+                "Cancel",
+            ):
+                self.did_lock = 0
+                break
+        return self.did_lock
+
+    def zopeRequest(self, method, headers={}, body="", sink=None):
+        """
+        Send a request back to Zope.  body may be a string, bytes, a file
+        opened for binary reading, or an iterable of bytes when headers
+        carries its Content-Length.  headers may also be a function
+        returning them, called before each attempt.  sink streams the
+        response body, as for sendRequest.
+
+        Failures worth retrying are retried with backoff according to
+        the retry policy, while the host's circuit breaker lets them
+        through; the last response is returned once the policy gives up.
+        unreachable is left set if Zope could not be reached at all.
+        """
+        breaker = breakers.get(self.host)
+        self.unreachable = 0
+        rewind = None
+        if hasattr(body, "seek"):
+            rewind = body.tell()
+        attempt = 0
+        while 1:
+            if not breaker.allow():
+                self.unreachable = 1
+                return NullResponse(
+                    "(%s is not responding, not trying again yet)" % self.host
+                )
+            response = self.sendRequest(
+                method,
+                headers() if callable(headers) else headers,
+                body,
+                sink,
+                attempt,
+            )
+            if isinstance(getattr(response, "reason", None), BodyChanged):
+                # Zope was there, the file moved under us: settle a probe
+                # out on this request, then let the caller send it again
+                breaker.record(1)
+                return response
+            status = response.status
+            self.unreachable = status == 0
+            breaker.record(status != 0 and status // 100 != 5)
+
+            attempt += 1
+            if not policy.retryable(status) or attempt >= policy.attempts:
+                return response
+            if rewind is not None:
+                body.seek(rewind)
+            elif not isinstance(body, (str, bytes)):
+                return response  # An iterable we cannot send twice
+            policy.sleep(policy.delay(attempt - 1, response.getheader("Retry-After")))
+
+    def sendRequest(self, method, headers={}, body="", sink=None, attempt=0):
+        """
+        Make one attempt at a request, recording its metrics (and a
+        trace, if one is being recorded).  sink is handed to the
+        connection pool, to stream the response body.  attempt counts
+        the tries before this one, which make it a retry.
+        """
+        start = time.monotonic()
+        sent = 0
+        request_headers = []
+        try:
+            if isinstance(body, str):
+                body = body.encode("utf8")
+
+            request_headers = [
+                ("User-Agent", "Zope External Editor/%s" % __version__),
+            ]
+            request_headers.extend(headers.items())
+            if "Content-Length" not in headers:
+                if isinstance(body, bytes):
+                    length = len(body)
+                else:
+                    length = os.fstat(body.fileno()).st_size - body.tell()
+                request_headers.append(("Content-Length", str(length)))
+                sent = length
+            else:
+                sent = int(headers["Content-Length"])
+
+            if self.metadata.get("auth", "").startswith("Basic"):
+                request_headers.append(("Authorization", self.metadata["auth"]))
+
+            if self.metadata.get("cookie"):
+                request_headers.append(("Cookie", self.metadata["cookie"]))
+
+            response = pool.request(
+                self.host, self.ssl, method, self.path, request_headers, body, sink
+            )
+        except:
+            # On error return a null response with error info
+            response = NullResponse(reason=sys.exc_info()[1])
+
+            if isinstance(response.reason, OSError):
+                pass  # Refused, reset or timed out: no status, just errno
+            else:
+                try:
+                    response.status, response.reason = response.reason
+                except (TypeError, ValueError):
+                    response.status = 0
+
+            if response.reason == "EOF occurred in violation of protocol":
+                # Ignore this protocol error as a workaround for
+                # broken ssl server implementations
+                response.status = 200
+
+        seconds = time.monotonic() - start
+        received = len(response.read()) + getattr(response, "streamed", 0)
+        retries = getattr(response, "retries", 0) + (attempt > 0)
+        metrics.observeRequest(
+            method, self.host, seconds, sent, received, response.status, retries
+        )
+        trace.request(
+            self.path,
+            method,
+            request_headers,
+            sent,
+            received,
+            response.status,
+            seconds,
+            retries,
+        )
+        return response
+
+    def removeFiles(self):
+        """
+        Remove the directory holding the content file, along with any
+        download left unfinished and whatever the editor kept next to it
+        """
+        shutil.rmtree(os.path.dirname(self.getContentFile()), ignore_errors=True)
@@ -0,0 +1,177 @@
+#
+#  helpers.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Which helper app edits which Zope object.
+
+The keys of the helper_apps preference are matched against the object
+being opened, most specific kind first:
+
+  1. URL path prefixes, keys starting with "/" ("/intranet/skins"
+     matches everything at or below that path; the longest one wins)
+  2. exact meta_types ("Page Template")
+  3. meta_type globs ("DTML *")
+  4. exact MIME types ("text/css")
+  5. MIME type globs ("application/*+xml"), the one with the most
+     literal characters first
+  6. major MIME types ("image/*")
+
+Keys with a "/" are MIME types, keys without one are meta_types.
+"""
+
+import fnmatch
+import re
+
+GLOB_CHARS = re.compile(r"[*?\[]")
+
+# Distinct (meta_type, content_type) pairs an index remembers the answer for
+CACHE_SIZE = 1024
+
+
+def compileGlobs(patterns):
+    """
+    One regular expression trying patterns in order, or None.  Which
+    pattern matched is the match's lastindex - 1.
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join("(%s)" % fnmatch.translate(p) for p in patterns))
+
+
+def specificity(pattern):
+    return len(GLOB_CHARS.sub("", pattern))
+
+
+class HelperIndex:
+    """
+    helper_apps compiled for lookups: exact keys go into dictionaries,
+    and the globs into one regular expression for meta_types and one
+    per major MIME type.  The answer for each pair of types is then
+    remembered, so documents of a type seen before cost a dictionary
+    lookup (plus one per path segment when there are path prefixes),
+    however many mappings there are.
+    """
+
+    def __init__(self, helper_apps):
+        self.prefixes = {}
+        self.meta_types = {}
+        self.mime_types = {}
+        self.majors = {}
+        meta_globs = []
+        mime_globs = []
+        for key, options in helper_apps.items():
+            key = str(key)
+            if key.startswith("/"):
+                self.prefixes[key.rstrip("/") or "/"] = options
+            elif "/" not in key:
+                if GLOB_CHARS.search(key):
+                    meta_globs.append((key, options))
+                else:
+                    self.meta_types[key] = options
+            elif key.endswith("/*") and not GLOB_CHARS.search(key[:-2]):
+                self.majors[key[:-2]] = options
+            elif GLOB_CHARS.search(key):
+                mime_globs.append((key, options))
+            else:
+                self.mime_types[key] = options
+
+        self.meta_globs = self.compile(meta_globs)
+        # Globs for one major type only ever see content types of it;
+        # those like "*/xml" are tried along with every major's own
+        by_major = {}
+        any_major = []
+        for key, options in mime_globs:
+            major = key.split("/")[0]
+            if GLOB_CHARS.search(major):
+                any_major.append((key, options))
+            else:
+                by_major.setdefault(major, []).append((key, options))
+        self.mime_globs = {}
+        for major, globs in by_major.items():
+            self.mime_globs[major] = self.compile(globs + any_major)
+        self.any_major_globs = self.compile(any_major)
+        self.cache = {}
+
+    def compile(self, globs):
+        """
+        (regular expression, options) for a list of (glob, options), the
+        globs with the most literal characters tried first
+        """
+        # sorted() is stable, equally specific globs keep their key order
+        globs = sorted(globs, key=lambda item: -specificity(item[0]))
+        pattern = compileGlobs([key for key, options in globs])
+        return pattern, [options for key, options in globs]
+
+    def match(self, globs, name):
+        pattern, options = globs
+        match = pattern and pattern.match(name)
+        if match:
+            return options[match.lastindex - 1]
+        return None
+
+    def resolve(self, meta_type=None, content_type="text/plain", path=""):
+        """The options of the helper app for an object, or None"""
+        if self.prefixes and path:
+            prefix = path.rstrip("/")
+            while prefix:
+                options = self.prefixes.get(prefix)
+                if options is not None:
+                    return options
+                prefix = prefix[: prefix.rfind("/")]
+            options = self.prefixes.get("/")
+            if options is not None:
+                return options
+
+        key = (meta_type, content_type)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        options = self.resolveType(meta_type, content_type)
+        if len(self.cache) >= CACHE_SIZE:
+            self.cache.clear()
+        self.cache[key] = options
+        return options
+
+    def resolveType(self, meta_type, content_type):
+        if meta_type:
+            options = self.meta_types.get(meta_type)
+            if options is None:
+                options = self.match(self.meta_globs, meta_type)
+            if options is not None:
+                return options
+
+        options = self.mime_types.get(content_type)
+        if options is not None:
+            return options
+        # Without parameters such as "; charset=utf-8"
+        content_type = content_type.split(";", 1)[0].strip()
+        options = self.mime_types.get(content_type)
+        if options is not None:
+            return options
+        major = re.split(r"[/_]", content_type, 1)[0]
+        options = self.match(
+            self.mime_globs.get(major, self.any_major_globs), content_type
+        )
+        if options is not None:
+            return options
+        return self.majors.get(major)
+
+
+def helperIndex(settings):
+    """
+    The compiled helper_apps of settings.  A Snapshot compiles its own
+    when it is taken; other settings get one built on first use, which
+    DictSettings drops when helper_apps is set.
+    """
+    index = getattr(settings, "helper_index", None)
+    if index is None:
+        index = getattr(settings, "_helper_index", None)
+    if index is None:
+        index = HelperIndex(settings.getDict("helper_apps"))
+        settings._helper_index = index
+    return index
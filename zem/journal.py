@@ -0,0 +1,127 @@
+#
+#  journal.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    content_file TEXT PRIMARY KEY,
+    filename TEXT,
+    metadata TEXT NOT NULL,
+    lock_token TEXT,
+    did_lock INTEGER NOT NULL DEFAULT 0,
+    lock_timeout INTEGER,
+    last_digest TEXT,
+    last_size INTEGER,
+    last_mtime REAL,
+    etag TEXT,
+    last_modified TEXT,
+    pending INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+COLUMNS = (
+    "content_file",
+    "filename",
+    "metadata",
+    "lock_token",
+    "did_lock",
+    "lock_timeout",
+    "last_digest",
+    "last_size",
+    "last_mtime",
+    "etag",
+    "last_modified",
+    "pending",
+)
+
+
+class Journal:
+    """
+    What we are editing, kept in SQLite next to the content files so a
+    session survives a crash or restart: each document's .zem metadata,
+    its lock token, what Zope was last sent, and whether a save is still
+    waiting to be uploaded.
+
+    There is one row per content file, so the pending flag doubles as
+    an offline queue that coalesces by itself: however often a document
+    is saved while Zope is unreachable, only its latest content, which
+    is in the content file, is ever replayed.
+
+    The metadata includes the credentials from the .zem file, so the
+    journal is only readable by its owner.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        os.close(os.open(filename, os.O_RDWR | os.O_CREAT, 0o600))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            filename, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(SCHEMA)
+
+    def record(self, doc, pending=0):
+        """Write down doc as it is now"""
+        lock_token = doc.lock_token
+        if lock_token is not None:
+            lock_token = lock_token.decode("utf8")
+        row = (
+            doc.content_file,
+            doc.filename,
+            json.dumps(doc.metadata),
+            lock_token,
+            doc.did_lock,
+            doc.lock_timeout,
+            doc.last_digest,
+            doc.last_size,
+            doc.last_mtime,
+            doc.etag,
+            doc.last_modified,
+            pending,
+        )
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (%s) VALUES (%s)"
+                % (", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))),
+                row,
+            )
+
+    def forget(self, content_file):
+        self.forgetAll([content_file])
+
+    def forgetAll(self, content_files):
+        """Drop the rows of content_files in one transaction"""
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "DELETE FROM documents WHERE content_file = ?",
+                    [(content_file,) for content_file in content_files],
+                )
+
+    def entries(self):
+        """Every recorded document, as dictionaries"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT %s FROM documents" % ", ".join(COLUMNS)
+            ).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(zip(COLUMNS, row))
+            entry["metadata"] = json.loads(entry["metadata"])
+            entries.append(entry)
+        return entries
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,139 @@
+#
+#  locks.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+from zem.sync import DueScheduler
+
+import threading
+import time
+
+# Refresh a lock once this much of its timeout has gone by
+REFRESH_FRACTION = 0.5
+
+# Seconds quitting waits for Zope to release our locks
+RELEASE_DEADLINE = 10.0
+
+
+class LockRefresher(DueScheduler):
+    """
+    Keep every finite WebDAV lock we hold alive from one thread.
+
+    Locks are scheduled by when they fall due for refresh, and all
+    locks due within `window` seconds of a wakeup are refreshed in that
+    wakeup, so hundreds of locks taken at about the same time cost a
+    handful of wakeups.  The refreshes of one wakeup run on a few
+    workers through the shared connection pool, so those going to the
+    same host reuse its keep-alive connections.
+
+    A refresh that gets no answer is tried again after retry_delay, or
+    halfway to the lock's expiry if that is sooner; a lock that could
+    neither be refreshed nor taken again is dropped and logged.
+    """
+
+    def __init__(self, window=30.0, retry_delay=30.0, workers=4):
+        DueScheduler.__init__(self, "LockRefresher", window, workers)
+        self.retry_delay = retry_delay
+        self.refreshes = 0
+        self._docs = set()
+
+    def add(self, doc):
+        """Start refreshing doc's lock, if it holds one that expires"""
+        if doc.lock_expires is None or doc.lock_token is None:
+            return
+        with self._cond:
+            self._docs.add(doc)
+            self._schedule(doc, self.dueTime(doc))
+            self._start()
+
+    def remove(self, doc):
+        """Stop refreshing doc's lock, e.g. because it is being unlocked"""
+        with self._cond:
+            self._docs.discard(doc)
+            self._unschedule(doc)
+
+    def held(self):
+        with self._cond:
+            return len(self._docs)
+
+    def dueTime(self, doc):
+        return doc.lock_expires - doc.lock_timeout * (1 - REFRESH_FRACTION)
+
+    def refresh(self, doc):
+        try:
+            return doc.refreshLock()
+        except Exception as e:
+            doc.ui.log(
+                "Could not refresh lock on %s: %s" % (doc.getContentFileName(), e)
+            )
+            return 0
+
+    def process(self, batch):
+        results = list(self.pool().map(self.refresh, batch))
+        now = time.monotonic()
+        with self._cond:
+            self.refreshes += len(batch)
+            for doc, refreshed in zip(batch, results):
+                if doc not in self._docs:
+                    continue  # Removed while we were refreshing it
+                if refreshed:
+                    if doc.lock_expires is not None:
+                        self._schedule(doc, self.dueTime(doc))
+                    else:
+                        self._docs.discard(doc)  # Zope made it infinite
+                elif doc.lock_token is not None and doc.lock_expires > now:
+                    # Try again well before it runs out
+                    retry = min(self.retry_delay, (doc.lock_expires - now) / 2)
+                    self._schedule(doc, now + retry)
+                else:
+                    self._docs.discard(doc)
+                    doc.ui.log("Gave up on the lock on %s" % doc.getContentFileName())
+
+
+def releaseLocks(docs, per_host=4, deadline=RELEASE_DEADLINE):
+    """
+    UNLOCK every lock docs hold at once, at most per_host at a time to
+    any one server, and give up on those still going after deadline
+    seconds.  Returns the docs whose locks were not released.
+
+    The requests run on daemon threads, so one stuck on a server that
+    stopped answering does not keep the process from exiting.
+    """
+    locked = [doc for doc in docs if doc.did_lock and doc.lock_token is not None]
+    by_host = {}
+    for doc in locked:
+        by_host.setdefault(doc.host, []).append(doc)
+    lock = threading.Lock()
+    released = set()
+
+    def unlock(queue):
+        while 1:
+            with lock:
+                if not queue:
+                    return
+                doc = queue.pop()
+            if doc.unlock(interactive=0):
+                with lock:
+                    released.add(doc)
+
+    threads = []
+    for host, queue in by_host.items():
+        for _ in range(min(per_host, len(queue))):
+            thread = threading.Thread(
+                target=unlock, args=(queue,), name="Unlock %s" % host, daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+    give_up = time.monotonic() + deadline
+    for thread in threads:
+        thread.join(max(0.0, give_up - time.monotonic()))
+    with lock:
+        for queue in by_host.values():
+            # Not started by the deadline: forget the lock, it is left
+            # to time out
+            for doc in queue:
+                doc.lock_token = None
+            del queue[:]
+        return [doc for doc in locked if doc not in released]
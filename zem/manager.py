@@ -0,0 +1,710 @@
+#
+#  manager.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+from tempfile import gettempdir
+
+from zem.document import ZopeDocument, zemObject
+from zem.journal import Journal
+from zem.locks import RELEASE_DEADLINE, LockRefresher, releaseLocks
+from zem.metrics import metrics
+from zem.poller import RemotePoller
+from zem.profiling import MODES, profiled, profiler
+from zem.pool import pool
+from zem.registry import DocumentRegistry
+from zem.sync import SUPERSEDED, Coalescer, SyncEngine, WorkerPool
+from zem.trace import trace
+from zem.ui import UI
+from zem.watcher import createWatcher
+
+import os
+import threading
+import time
+
+# Seconds saves to a document have to stop for before it is uploaded
+QUIET_WINDOW = 1.0
+
+# Seconds between attempts to upload saves made while Zope was unreachable
+REPLAY_INTERVAL = 30.0
+
+
+def callDirectly(fn, *args):
+    fn(*args)
+
+
+class EditManager:
+    """
+    The sync loop shared by the app and the headless daemon: the open
+    documents, the file watcher, and the worker pool that uploads saves.
+
+    Work that has to happen on the caller's main thread (UI updates and
+    questions to the user) is handed to post(fn, *args); the app posts
+    to the Cocoa main thread, the daemon to its own run loop.
+    """
+
+    def __init__(self, settings, ui=None, post=callDirectly, workers=4):
+        self.settings = settings
+        self.ui = ui or UI()
+        self.post = post
+        self.documents = DocumentRegistry(self.ui)
+        self.watcher = None
+        # Documents the watcher could not watch, checked by tick() instead
+        self.unwatched = set()
+        self.sync_engine = SyncEngine(workers)
+        self.lock_refresher = LockRefresher()
+        # Objects changed in Zope while we edit them, when poll_interval is
+        # set; settingsChanged() sets this and the quiet window below
+        self.poller = RemotePoller(
+            self.pollDocument,
+            lambda doc, result: self.post(self.pollFinished, doc, result),
+            0,
+        )
+        # Uploads wait for saves to a document to settle for quiet_window
+        self.coalescer = Coalescer(
+            lambda doc: self.post(self.queueUpload, doc), QUIET_WINDOW
+        )
+        # Saves Zope could not be reached for, waiting to be replayed
+        self.offline = set()
+        self.replayer = Coalescer(
+            lambda doc: self.post(self.replayUpload, doc), REPLAY_INTERVAL
+        )
+        # Documents finished with, waiting for Zope to get their last save
+        self.finish_pending = set()
+        # Set once finishUploads has queued the last uploads
+        self.finishing = 0
+        self.journal = Journal(
+            os.path.join(self.tempDir(), "zopeeditmanager-journal.sqlite")
+        )
+        self.settingsChanged()
+        self.uploads_in_flight = 0
+        self.upload_counts = {
+            "performed": 0,
+            "skipped": 0,
+            "superseded": 0,
+            "bytes_uploaded": 0,
+            "bytes_skipped": 0,
+        }
+
+    def startWatching(self):
+        """
+        Start pushing saves from a file watcher.  Returns false when the
+        platform has none, and the caller has to call tick() itself every
+        save_interval seconds.
+        """
+        self.watcher = createWatcher(
+            lambda path: self.post(self.contentFileChanged, path)
+        )
+        if self.watcher is None:
+            return 0
+        for doc in self.documents:
+            self.watchDocument(doc)
+        return 1
+
+    def watchDocument(self, doc):
+        """Watch doc's content file, or leave it to tick() if we cannot"""
+        try:
+            self.watcher.watch(doc.getContentFile())
+        except OSError as e:
+            # Most likely out of file descriptors, which kqueue needs two
+            # of per document
+            self.ui.log(
+                "Checking %s every save_interval, it cannot be watched: %s"
+                % (doc.getContentFile(), e)
+            )
+            self.unwatched.add(doc)
+
+    def tempDir(self):
+        return os.path.expanduser(self.settings.getString("temp_dir") or gettempdir())
+
+    def settingsChanged(self):
+        """
+        Apply the preferences that take effect without a restart; the
+        rest are read whenever they are needed
+        """
+        quiet = QUIET_WINDOW
+        if self.settings.getObject("quiet_window") is not None:
+            quiet = self.settings.getFloat("quiet_window")
+        self.coalescer.quiet = quiet
+        interval = 0
+        if self.settings.getObject("poll_interval") is not None:
+            interval = self.settings.getFloat("poll_interval")
+        self.poller.setInterval(interval, list(self.documents))
+        self.configureTrace(self.settings.getBool("record_trace"))
+        self.configureProfiler(
+            self.settings.getString("profile") or os.environ.get("ZEM_PROFILE") or None
+        )
+
+    def saveInterval(self):
+        """Seconds between tick()s"""
+        return self.settings.getFloat("save_interval") or 20.0
+
+    def configureTrace(self, record):
+        """Start or stop recording the sync traffic"""
+        filename = os.path.join(self.tempDir(), "zopeeditmanager-trace.jsonl")
+        if record and (not trace.enabled or trace.filename != filename):
+            trace.start(filename)
+            self.ui.log("Recording a trace to %s" % filename)
+        elif not record and trace.enabled:
+            trace.stop()
+            self.ui.log("Stopped recording a trace")
+
+    def configureProfiler(self, mode):
+        """Profile the sync loop in mode, "calls" or "stacks", or stop (None)"""
+        if mode is not None and mode not in MODES:
+            self.ui.log("Unknown profile mode %r, not profiling" % mode)
+            mode = None
+        changed = mode != profiler.mode
+        profiler.configure(mode, self.tempDir())
+        if not changed:
+            return
+        if mode == "calls":
+            self.ui.log("Profiling slow calls to %s" % profiler.profilesDirectory())
+        elif mode == "stacks":
+            self.ui.log("Sampling stacks to %s" % profiler.stacksFile())
+        else:
+            self.ui.log("Stopped profiling")
+
+    @profiled
+    def openDocument(self, filename):
+        """
+        Start tracking the object described by a .zem file.  Opening an
+        object we already edit returns its document, content file and
+        lock as they are, rather than a second one racing its uploads.
+        """
+        existing = self.documents.get(*zemObject(filename))
+        if existing is not None:
+            self.ui.log("Already editing %s" % existing.getContentFile())
+            existing.removeFileIfNecessary(filename)
+            return existing
+        doc = ZopeDocument(filename, self.settings, self.ui)
+        doc.removeFileIfNecessary(filename)
+        self.trackDocument(doc)
+        self.journal.record(doc)
+        return doc
+
+    def trackDocument(self, doc):
+        """Track doc, false if its object was already tracked"""
+        if self.documents.add(doc) is not doc:
+            return 0
+        if self.watcher is not None:
+            self.watchDocument(doc)
+        self.poller.add(doc)
+        if trace.enabled:
+            trace.document("open", doc, os.path.getsize(doc.getContentFile()))
+        return 1
+
+    def restoreSession(self):
+        """
+        Pick up the documents the journal says we were editing when we
+        last stopped, without their .zem files.  Locks are refreshed in
+        the background, and uploads are queued for documents that were
+        saved since Zope last got them.  Returns the restored documents.
+        """
+        docs = []
+        for entry in self.journal.entries():
+            if not os.path.exists(entry["content_file"]):
+                self.journal.forget(entry["content_file"])
+                continue
+            doc = ZopeDocument.restore(entry, self.settings, self.ui)
+            if not self.trackDocument(doc):
+                continue
+            self.lock_refresher.add(doc)
+            if doc.bodyPending():
+                self.fetchBody(doc)  # Resuming the download if we can
+                docs.append(doc)
+                continue
+            mtime = os.path.getmtime(doc.getContentFile())
+            if entry["pending"] or mtime != doc.last_mtime:
+                doc.last_mtime = mtime
+                self.coalescer.touch(doc)
+            docs.append(doc)
+        return docs
+
+    @profiled
+    def openDocuments(self, filenames, per_host=None):
+        """
+        Open and lock a batch of .zem files at once.  Borrowed locks are
+        confirmed up front, then the LOCK requests go out concurrently,
+        at most per_host at a time to any one server (the pool never
+        opens more than max_per_host connections to one anyway).
+        Returns the documents ready for editing; files that could not be
+        read or whose lock the user declined to borrow are left out.
+        """
+        docs = []
+        for filename in filenames:
+            try:
+                doc = self.openDocument(filename)
+            except Exception as e:
+                self.ui.log("Could not open %s: %s" % (filename, e))
+                continue
+            if doc not in docs:
+                docs.append(doc)
+
+        ready = []
+        for doc in docs:
+            if self.borrowLock(doc):
+                ready.append(doc)
+            else:
+                self.closeDocument(doc)
+        if self.settings.getBool("use_locks"):
+            self.lockDocuments(ready, per_host or pool.max_per_host)
+        return ready
+
+    def lockDocuments(self, docs, per_host):
+        """
+        LOCK docs in parallel.  Any that failed are tried once more one
+        by one on the caller's thread, where the usual Retry prompt can
+        be shown.
+        """
+        slots = {}
+        for doc in docs:
+            if doc.host not in slots:
+                slots[doc.host] = threading.Semaphore(per_host)
+
+        def lock(doc):
+            with slots[doc.host]:
+                doc.lock(interactive=0)
+
+        if docs:
+            workers = min(len(docs), per_host * len(slots))
+            with WorkerPool(workers, "LockDocuments") as executor:
+                list(executor.map(lock, docs))
+        for doc in docs:
+            if doc.lock_token is None:
+                doc.lock()
+            self.lock_refresher.add(doc)
+            self.journal.record(doc)
+
+    def borrowLock(self, doc):
+        """
+        Take over the lock the .zem file says we already hold, if the
+        user agrees.  False if they declined.
+        """
+        if not self.settings.getBool("use_locks"):
+            return 1
+        if doc.metadata.get("lock-token") and doc.lock_token is None:
+            if (
+                self.settings.getBool("always_borrow_locks")
+                or doc.metadata.get("borrow_lock")
+                or self.ui.ask(
+                    "Borrow Lock?",
+                    "This object is already locked by"
+                    " you in another session. Do you want"
+                    " to borrow this lock and continue?",
+                    "Yes",
+                    "Cancel",
+                )
+            ):
+                doc.lock_token = (
+                    "opaquelocktoken:%s" % doc.metadata["lock-token"]
+                ).encode("utf8")
+            else:
+                return 0
+        return 1
+
+    def lockDocument(self, doc):
+        """
+        Lock doc in Zope if we use locks, borrowing a lock the .zem file
+        says we already hold.  False if the user declined to borrow it.
+        """
+        if not self.borrowLock(doc):
+            return 0
+        if self.settings.getBool("use_locks"):
+            doc.lock()
+            self.lock_refresher.add(doc)
+            self.journal.record(doc)
+        return 1
+
+    def closeDocument(self, doc):
+        """Stop tracking doc"""
+        self.closeDocuments([doc])
+
+    def closeDocuments(self, docs):
+        """Stop tracking docs, removing them from the registry at once"""
+        for doc in docs:
+            self.lock_refresher.remove(doc)
+            self.poller.remove(doc)
+            self.coalescer.cancel(doc)
+            self.replayer.cancel(doc)
+            self.offline.discard(doc)
+            self.finish_pending.discard(doc)
+            self.unwatched.discard(doc)
+            if self.watcher is not None:
+                self.watcher.unwatch(doc.getContentFile())
+            trace.document("close", doc)
+        self.journal.forgetAll([doc.getContentFile() for doc in docs])
+        self.documents.removeAll(docs)
+
+    def hasUnsentSaves(self, doc):
+        """
+        Does doc have saves Zope has not got?  Saves waiting to be
+        uploaded count, and so does a content file that differs from the
+        last upload, however that upload went.
+        """
+        if doc.bodyPending():
+            return 0  # Nothing but the download to lose
+        if doc in self.offline or self.coalescer.pending(doc):
+            return 1
+        try:
+            return doc.contentChanged()
+        except OSError:
+            return 0  # The content file is gone
+
+    def releaseDocuments(self, docs, deadline=RELEASE_DEADLINE):
+        """
+        Stop tracking docs, unlock them and remove their local copies, as
+        unlockDocuments does.  Docs with saves Zope has not got are not
+        let go of yet: they are uploaded and released once Zope has them
+        or, when quitting, kept in the journal for next time.
+        """
+        finished = []
+        for doc in docs:
+            uploading = self.sync_engine.busy(doc) and not doc.bodyPending()
+            if uploading or self.hasUnsentSaves(doc):
+                self.finishAfterUpload(doc)
+            else:
+                finished.append(doc)
+        return self.unlockDocuments(finished, deadline)
+
+    def unlockDocuments(self, docs, deadline=RELEASE_DEADLINE):
+        """
+        Stop tracking docs, unlock them all at once and remove their local
+        copies.  Locks Zope has not released by the deadline are logged
+        and left to time out; returns the docs that held them.
+        """
+        start = time.monotonic()
+        self.closeDocuments(docs)
+        failed = releaseLocks(docs, pool.max_per_host, deadline)
+        for doc in docs:
+            doc.removeFiles()
+        for doc in failed:
+            self.ui.log("Could not release the lock on %s" % doc.path)
+        if docs:
+            self.ui.log(
+                "Released %d documents in %.1fs, %d locks left behind"
+                % (len(docs), time.monotonic() - start, len(failed))
+            )
+        return failed
+
+    def finishAfterUpload(self, doc):
+        """Release doc once its saves reach Zope, or keep it if quitting"""
+        if self.finishing:
+            # Zope never got the last save, pick it up next time
+            self.journal.record(doc, pending=1)
+            self.ui.log("Keeping %s for later" % doc.getContentFile())
+            return
+        self.ui.log("Finishing %s once Zope has its last save" % doc.getContentFile())
+        self.finish_pending.add(doc)
+        self.coalescer.cancel(doc)
+        self.replayer.cancel(doc)
+        self.replayUpload(doc)
+
+    def releaseAll(self, deadline=RELEASE_DEADLINE):
+        """Release every document but those with saves Zope never got"""
+        finished = []
+        for doc in self.documents:
+            if doc in self.offline:
+                # Zope never got the last save, pick it up next time
+                self.ui.log("Keeping %s for later" % doc.getContentFile())
+            else:
+                finished.append(doc)
+        return self.releaseDocuments(finished, deadline)
+
+    @profiled
+    def tick(self):
+        """
+        Check documents for changes every save_interval: all of them when
+        there is no watcher, otherwise the ones it could not watch
+        """
+        docs = self.documents
+        if self.watcher is not None:
+            docs = list(self.unwatched)
+        if docs:
+            start = time.monotonic()
+            for doc in docs:
+                self.syncDocument(doc)
+            metrics.observeTick(len(docs), time.monotonic() - start)
+        self.exportMetrics()
+
+    @profiled
+    def contentFileChanged(self, path):
+        """The file watcher saw path being saved"""
+        start = time.monotonic()
+        doc = self.documents.byContentFile(path)
+        if doc is not None:
+            self.syncDocument(doc)
+        metrics.observeTick(1, time.monotonic() - start)
+
+    def syncDocument(self, doc):
+        if doc.bodyPending():
+            return  # Nothing to upload but the placeholder
+        mtime = os.path.getmtime(doc.getContentFile())
+
+        if mtime != doc.last_mtime:
+            doc.last_mtime = mtime
+            if trace.enabled:
+                trace.document("change", doc, os.path.getsize(doc.getContentFile()))
+            self.poller.reset(doc)
+            self.coalescer.touch(doc)
+
+    def queueUpload(self, doc):
+        """
+        Hash and upload doc on a sync worker, off the main thread.  An
+        upload of doc still waiting for a worker is dropped, as this one
+        will send the newer content anyway.
+        """
+        if doc not in self.documents:
+            return  # Finished with while its saves were settling
+        if self.finishing:
+            return  # Too late, releaseAll keeps the save for next time
+
+        def upload():
+            if not doc.contentChanged():
+                # Touched or saved without changes, Zope is up to date
+                return "skipped"
+            if doc.putChanges(interactive=0):
+                return "uploaded"
+            return "failed"
+
+        def done(doc, result, error):
+            if error is not None:
+                doc.sync_error = str(error)
+                result = "failed"
+            self.post(self.uploadFinished, doc, result)
+
+        if not self.uploads_in_flight:
+            self.ui.uploadsStarted()
+        self.uploads_in_flight += 1
+        self.sync_engine.submit(doc, upload, done, replace=True)
+
+    def replayUpload(self, doc):
+        """
+        Try a save, or a body download, that Zope could not be reached
+        for again
+        """
+        self.offline.discard(doc)
+        if doc.bodyPending():
+            self.fetchBody(doc)
+        else:
+            self.queueUpload(doc)
+
+    def fetchBody(self, doc):
+        """
+        Download the body of a document whose .zem file came without one
+        on a sync worker.  The UI is told through bodyFetched once the
+        content file holds it, which is when the editor can be launched.
+        """
+
+        def done(doc, result, error):
+            if result == SUPERSEDED:
+                return  # Dropped for an upload, which skips pending bodies
+            if error is not None:
+                doc.sync_error = str(error)
+                result = 0
+            self.post(self.bodyFinished, doc, result)
+
+        self.sync_engine.submit(doc, doc.fetchBody, done)
+
+    def bodyFinished(self, doc, fetched):
+        """Called through post() once a body download has finished"""
+        if doc not in self.documents:
+            return  # Finished with while it was downloading
+        self.journal.record(doc)  # With what we learned for resuming
+        if self.finishing:
+            return  # Too late to launch the editor, or to retry
+        if fetched:
+            self.ui.bodyFetched(doc)
+        elif doc.unreachable:
+            self.offline.add(doc)
+            self.replayer.touch(doc)
+        elif self.ui.ask(
+            doc.sync_error or "(No Response From Server)",
+            "Could not download %s from Zope." % doc.getContentFileName(),
+            "Retry",
+            "Cancel",
+        ):
+            self.fetchBody(doc)
+
+    def pollDocument(self, doc):
+        """Called on a poller worker: has doc's object changed in Zope?"""
+        if doc.conflict or self.sync_engine.busy(doc):
+            # Zope already refused our version, or we are busy sending it
+            return None
+        return doc.pollRemote()
+
+    def pollFinished(self, doc, result):
+        """
+        Called through post() with what polling doc found.  A newer
+        version replaces the content file if it has no changes of ours
+        Zope does not have yet; otherwise both sides changed it, and the
+        user is asked whether to overwrite the one in Zope.
+        """
+        if not isinstance(result, tuple):
+            return  # Unchanged, or not polled
+        remote = doc.remoteFile()
+        if doc not in self.documents or self.sync_engine.busy(doc):
+            # Finished with, or an upload started: look again next time
+            os.remove(remote)
+            self.poller.reset(doc)
+            return
+        digest, size, etag, last_modified = result
+        self.poller.reset(doc)
+        if digest == doc.last_digest and size == doc.last_size:
+            # The same content, e.g. what we uploaded: only its version moved
+            os.remove(remote)
+        elif doc.contentChanged():
+            os.remove(remote)
+            doc.conflict = 1
+            self.ui.documentSynced(doc, "conflict")
+            if self.ui.ask(
+                "Conflict",
+                "%s was changed in Zope by someone else while you were "
+                "editing it. Overwrite their changes with yours?"
+                % doc.getContentFileName(),
+                "Overwrite",
+                "Cancel",
+            ):
+                doc.forgetValidators()
+                self.queueUpload(doc)
+            return
+        else:
+            os.replace(remote, doc.getContentFile())
+            doc.last_digest, doc.last_size = digest, size
+            # The watcher will see this, and find nothing to upload
+            doc.last_mtime = os.path.getmtime(doc.getContentFile())
+            self.ui.documentSynced(doc, "refreshed")
+        doc.etag, doc.last_modified = etag, last_modified
+        self.journal.record(doc)
+
+    def uploadFinished(self, doc, result):
+        """Called through post() once a queued upload has finished"""
+        self.uploads_in_flight -= 1
+        if not self.uploads_in_flight:
+            self.ui.uploadsFinished()
+        self.exportMetrics()
+
+        if result == SUPERSEDED:
+            self.upload_counts["superseded"] += 1
+        elif result == "skipped":
+            doc.uploads_skipped += 1
+            self.upload_counts["skipped"] += 1
+            self.upload_counts["bytes_skipped"] += doc.last_size
+            self.journal.record(doc)
+        elif result == "uploaded":
+            self.upload_counts["performed"] += 1
+            self.upload_counts["bytes_uploaded"] += doc.last_size
+            self.journal.record(doc)
+            if not self.finishing:
+                # The host is back, replay what it missed rather than waiting
+                for other in [d for d in self.offline if d.host == doc.host]:
+                    self.replayer.cancel(other)
+                    self.replayUpload(other)
+        elif doc not in self.documents:
+            pass  # Finished with while the upload was running
+        elif doc.unreachable or self.finishing:
+            # Keep the save, even across restarts, and try again later;
+            # when quitting there is nobody left to ask about it
+            self.journal.record(doc, pending=1)
+            self.offline.add(doc)
+            if not self.finishing:
+                self.replayer.touch(doc)
+        elif doc.conflict:
+            if self.ui.ask(
+                "Conflict",
+                "%s was changed in Zope by someone else. "
+                "Overwrite their changes with yours?" % doc.getContentFileName(),
+                "Overwrite",
+                "Cancel",
+            ):
+                doc.forgetValidators()
+                self.queueUpload(doc)
+        elif self.ui.ask(
+            doc.sync_error or "(No Response From Server)",
+            "Could not save %s to Zope." % doc.getContentFileName(),
+            "Retry",
+            "Cancel",
+        ):
+            self.queueUpload(doc)
+        self.ui.documentSynced(doc, result)
+
+        if doc in self.finish_pending and doc in self.documents:
+            if result in ("uploaded", "skipped"):
+                if not self.hasUnsentSaves(doc):
+                    self.unlockDocuments([doc])
+            elif result != SUPERSEDED:
+                self.finish_pending.discard(doc)
+                self.ui.log(
+                    "Not finishing %s, Zope does not have its last save"
+                    % doc.getContentFile()
+                )
+
+    def exportMetrics(self, force=False):
+        """Write the request metrics next to the content files"""
+        filename = os.path.join(self.tempDir(), "zopeeditmanager-metrics.prom")
+        try:
+            if force:
+                metrics.writeFile(filename)
+            else:
+                metrics.writeFileIfDue(filename)
+        except OSError:
+            pass  # Metrics are a diagnostic, never worth failing a sync
+
+    def finishUploads(self, deadline=None):
+        """
+        Stop watching and wait for queued uploads to finish, for at most
+        deadline seconds if given.  Their completions are run here rather
+        than posted, as a main thread that is quitting never gets to
+        them; saves that did not make it, or were still going at the
+        deadline, are kept for next time without asking anybody.
+        """
+        give_up = None if deadline is None else time.monotonic() + deadline
+
+        def left():
+            return None if give_up is None else max(0.0, give_up - time.monotonic())
+
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.lock_refresher.stop(left())
+        self.poller.stop(left())
+        for doc in self.coalescer.stop():
+            self.queueUpload(doc)  # Do not lose saves that were settling
+        self.replayer.stop()  # Still pending in the journal for next time
+        self.finishing = 1
+        completions = []
+        post = self.post
+        self.post = lambda fn, *args: completions.append((fn, args))
+        try:
+            unfinished = self.sync_engine.shutdown(left())
+        finally:
+            self.post = post
+        for fn, args in completions:
+            fn(*args)
+        for doc in unfinished:
+            if doc in self.documents:
+                # Zope may or may not get it, send it again next time
+                self.journal.record(doc, pending=1)
+                self.offline.add(doc)
+
+    def logUploadCounts(self):
+        self.exportMetrics(force=True)
+        self.ui.log(
+            "Uploads performed: %(performed)d (%(bytes_uploaded)d bytes), "
+            "skipped as unchanged: %(skipped)d (%(bytes_skipped)d bytes), "
+            "superseded: %(superseded)d, saves coalesced: %(coalesced)d"
+            % dict(self.upload_counts, coalesced=self.coalescer.coalesced)
+        )
+
+    def shutdown(self, deadline=RELEASE_DEADLINE):
+        """
+        Upload what is left and release every document, taking at most
+        about deadline seconds: uploads get half of it, and the locks of
+        hosts that do answer are released in what remains.
+        """
+        give_up = time.monotonic() + deadline
+        self.finishUploads(deadline / 2)
+        self.logUploadCounts()
+        self.releaseAll(max(0.0, give_up - time.monotonic()))
+        profiler.stop()
@@ -0,0 +1,230 @@
+#
+#  metrics.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+In-process counters and latency histograms for the sync traffic.
+
+zopeRequest records every request per method and host; the app delegate
+records each updateIfModified_ tick.  snapshot() returns everything as
+plain Python data, render() in the Prometheus text exposition format,
+which writeFile() and serve() make available outside the process.
+"""
+
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, count of observations <= bound) pairs"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def asDict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(self.cumulative()),
+        }
+
+
+def labels(**values):
+    return "{%s}" % ",".join(
+        '%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in sorted(values.items())
+    )
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}  # (method, host) -> Histogram
+            self.bytes_sent = {}  # (method, host) -> bytes
+            self.bytes_received = {}  # (method, host) -> bytes
+            self.statuses = {}  # (method, host, status) -> responses
+            self.retries = {}  # (method, host) -> resent requests
+            self.tick_duration = Histogram()
+            self.tick_documents = 0
+            self.last_tick_documents = 0
+            self.last_export = 0.0
+
+    def observeRequest(self, method, host, seconds, sent, received, status, retries=0):
+        key = (method, host)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            self.bytes_sent[key] = self.bytes_sent.get(key, 0) + sent
+            self.bytes_received[key] = self.bytes_received.get(key, 0) + received
+            status_key = (method, host, status)
+            self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+            if retries:
+                self.retries[key] = self.retries.get(key, 0) + retries
+
+    def observeTick(self, documents, seconds):
+        with self._lock:
+            self.tick_duration.observe(seconds)
+            self.tick_documents += documents
+            self.last_tick_documents = documents
+
+    def snapshot(self):
+        """Everything recorded so far, as plain dictionaries"""
+        with self._lock:
+            requests = {}
+            for (method, host), histogram in self.latency.items():
+                key = (method, host)
+                requests["%s %s" % key] = {
+                    "latency": histogram.asDict(),
+                    "bytes_sent": self.bytes_sent.get(key, 0),
+                    "bytes_received": self.bytes_received.get(key, 0),
+                    "retries": self.retries.get(key, 0),
+                    "statuses": dict(
+                        (status, count)
+                        for (m, h, status), count in self.statuses.items()
+                        if (m, h) == key
+                    ),
+                }
+            return {
+                "requests": requests,
+                "ticks": {
+                    "duration": self.tick_duration.asDict(),
+                    "documents_scanned": self.tick_documents,
+                    "last_documents_scanned": self.last_tick_documents,
+                },
+            }
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append("# TYPE zem_request_duration_seconds histogram")
+            for (method, host), histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(
+                        "zem_request_duration_seconds_bucket%s %d"
+                        % (labels(method=method, host=host, le=bound), count)
+                    )
+                lines.append(
+                    "zem_request_duration_seconds_bucket%s %d"
+                    % (labels(method=method, host=host, le="+Inf"), histogram.count)
+                )
+                lines.append(
+                    "zem_request_duration_seconds_sum%s %f"
+                    % (labels(method=method, host=host), histogram.sum)
+                )
+                lines.append(
+                    "zem_request_duration_seconds_count%s %d"
+                    % (labels(method=method, host=host), histogram.count)
+                )
+            for name, values in (
+                ("zem_request_sent_bytes_total", self.bytes_sent),
+                ("zem_request_received_bytes_total", self.bytes_received),
+                ("zem_request_retries_total", self.retries),
+            ):
+                lines.append("# TYPE %s counter" % name)
+                for (method, host), value in sorted(values.items()):
+                    lines.append(
+                        "%s%s %d" % (name, labels(method=method, host=host), value)
+                    )
+            lines.append("# TYPE zem_responses_total counter")
+            for (method, host, status), count in sorted(self.statuses.items()):
+                lines.append(
+                    "zem_responses_total%s %d"
+                    % (labels(method=method, host=host, status=status), count)
+                )
+            lines.append("# TYPE zem_sync_tick_duration_seconds histogram")
+            for bound, count in self.tick_duration.cumulative():
+                lines.append(
+                    "zem_sync_tick_duration_seconds_bucket%s %d"
+                    % (labels(le=bound), count)
+                )
+            lines.append(
+                'zem_sync_tick_duration_seconds_bucket{le="+Inf"} %d'
+                % self.tick_duration.count
+            )
+            lines.append(
+                "zem_sync_tick_duration_seconds_sum %f" % self.tick_duration.sum
+            )
+            lines.append(
+                "zem_sync_tick_duration_seconds_count %d" % self.tick_duration.count
+            )
+            lines.append("# TYPE zem_sync_tick_documents_total counter")
+            lines.append("zem_sync_tick_documents_total %d" % self.tick_documents)
+            lines.append("# TYPE zem_sync_tick_documents gauge")
+            lines.append("zem_sync_tick_documents %d" % self.last_tick_documents)
+        return "\n".join(lines) + "\n"
+
+    def writeFile(self, filename):
+        """Atomically replace filename with the rendered metrics"""
+        temp_name = filename + ".tmp"
+        out_f = open(temp_name, "w")
+        try:
+            out_f.write(self.render())
+        finally:
+            out_f.close()
+        os.replace(temp_name, filename)
+        self.last_export = time.monotonic()
+
+    def writeFileIfDue(self, filename, interval=10.0):
+        """writeFile, at most once every interval seconds"""
+        if time.monotonic() - self.last_export >= interval:
+            self.writeFile(filename)
+
+    def serve(self, port, address="127.0.0.1"):
+        """Serve the metrics over HTTP on a background thread"""
+        # Only imported here, it takes longer than the rest of startup
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer((address, port), MetricsHandler)
+        thread = threading.Thread(
+            target=server.serve_forever, name="Metrics", daemon=True
+        )
+        thread.start()
+        return server
+
+
+metrics = Metrics()
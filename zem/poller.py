@@ -0,0 +1,132 @@
+#
+#  poller.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+from zem.sync import DueScheduler
+
+import time
+
+# Documents that keep coming back unchanged are polled at most this many
+# times less often than the poll interval
+MAX_BACKOFF = 16
+
+
+class RemotePoller(DueScheduler):
+    """
+    Ask Zope now and then whether the objects being edited were changed
+    there, by someone else or a workflow script, from one thread.
+
+    poll(doc) is called on a worker and is expected to make a
+    conditional GET, so an unchanged object costs a 304; its result is
+    handed to report(doc, result) on the same worker.  A poll returning
+    "unchanged" (or failing, None) doubles the document's interval, up
+    to MAX_BACKOFF times the base interval, so idle documents are
+    polled less and less; reset(doc) brings it back to the base interval
+    once either side changed it.
+
+    Every document falling due within `window` seconds of a wakeup is
+    polled in that wakeup, and the polls for one host go one after
+    another on the same worker, over one keep-alive connection, instead
+    of each opening its own.
+    """
+
+    def __init__(self, poll, report, interval=60.0, window=None, workers=4):
+        DueScheduler.__init__(
+            self,
+            "RemotePoller",
+            interval / 4 if window is None else window,
+            workers,
+        )
+        self.poll = poll
+        self.report = report
+        self.interval = interval
+        self._window = window
+        self.polls = 0
+        self._backoff = {}  # doc -> multiple of interval until its next poll
+
+    def add(self, doc):
+        """Start polling doc, unless polling is turned off"""
+        if self.interval <= 0:
+            return
+        with self._cond:
+            if doc in self._backoff:
+                return
+            self._backoff[doc] = 1
+            self._schedule(doc, time.monotonic() + self.interval)
+            self._start()
+
+    def remove(self, doc):
+        with self._cond:
+            self._backoff.pop(doc, None)
+            self._unschedule(doc)
+
+    def reset(self, doc):
+        """doc changed: poll it again at the base interval"""
+        with self._cond:
+            if doc not in self._backoff:
+                return
+            self._backoff[doc] = 1
+            due = time.monotonic() + self.interval
+            entry = self._entries.get(doc)
+            if entry is None or entry[0] > due:
+                self._schedule(doc, due)
+
+    def setInterval(self, interval, docs):
+        """
+        Poll at a new base interval from now on, 0 to stop polling.  docs
+        are the documents being edited, which are polled afresh.
+        """
+        if interval == self.interval:
+            return
+        for doc in docs:
+            self.remove(doc)
+        with self._cond:
+            self.interval = interval
+            if self._window is None:
+                self.window = interval / 4
+        for doc in docs:
+            self.add(doc)
+
+    def polled(self):
+        with self._cond:
+            return len(self._backoff)
+
+    def pollHost(self, docs):
+        """Poll the due documents of one host, returning their results"""
+        results = []
+        for doc in docs:
+            try:
+                result = self.poll(doc)
+            except Exception as e:
+                doc.ui.log(
+                    "Could not check %s in Zope: %s" % (doc.getContentFileName(), e)
+                )
+                result = None
+            self.report(doc, result)
+            results.append(result)
+        return results
+
+    def process(self, batch):
+        by_host = {}
+        for doc in batch:
+            by_host.setdefault(doc.host, []).append(doc)
+        groups = list(by_host.values())
+        results = list(self.pool().map(self.pollHost, groups))
+        now = time.monotonic()
+        with self._cond:
+            self.polls += len(batch)
+            for docs, polled in zip(groups, results):
+                for doc, result in zip(docs, polled):
+                    if doc not in self._backoff:
+                        continue  # Removed while we were polling it
+                    if doc in self._entries:
+                        continue  # Reset while we were polling it
+                    if result in ("unchanged", None):
+                        backoff = min(self._backoff[doc] * 2, MAX_BACKOFF)
+                    else:
+                        backoff = 1
+                    self._backoff[doc] = backoff
+                    self._schedule(doc, now + self.interval * backoff)
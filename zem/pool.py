@@ -0,0 +1,238 @@
+#
+#  pool.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+from http.client import HTTPConnection, HTTPSConnection, HTTPException, IncompleteRead
+
+import threading
+import time
+
+# Bodies that are files are sent in chunks of this size when they cannot
+# be handed to socket.sendfile
+SEND_CHUNK_SIZE = 64 * 1024
+
+# Response bodies streamed to a file are read in chunks of this size
+RECEIVE_CHUNK_SIZE = 64 * 1024
+
+# Errors that mean a kept-alive socket was closed by the server while it
+# sat idle in the pool.  A request that fails this way on a reused
+# connection is safe to send again on a fresh one.
+STALE_ERRORS = (HTTPException, ConnectionError, BrokenPipeError)
+
+
+class BodyChanged(OSError):
+    """A file being sent was saved over while it was sent"""
+
+
+class PooledResponse:
+    """
+    A fully read response, so its connection can go back to the pool.
+    When sink returns a file for it, the body was written there as it
+    arrived instead of being kept, and streamed is its size.
+    """
+
+    def __init__(self, response, sink=None):
+        self.status = response.status
+        self.reason = response.reason
+        self.msg = response.msg
+        self.body = b""
+        self.streamed = 0
+        self.retries = 0
+        out_f = None
+        if sink is not None:
+            out_f = sink(response)
+        if out_f is None:
+            self.body = response.read()
+            return
+        while 1:
+            chunk = response.read(RECEIVE_CHUNK_SIZE)
+            if not chunk:
+                break
+            out_f.write(chunk)
+            self.streamed += len(chunk)
+        if response.length:
+            # http.client quietly stops at EOF, short of Content-Length
+            raise IncompleteRead(b"", response.length)
+
+    def getheader(self, name, default=None):
+        return self.msg.get(name, default)
+
+    def getheaders(self):
+        return self.msg.items()
+
+    def read(self):
+        return self.body
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections shared by every document that talks to
+    the same host.  Connections are keyed by (host, ssl), at most
+    max_per_host of them exist per key, and idle ones are closed once
+    they have been unused for idle_timeout seconds.
+    """
+
+    def __init__(self, max_per_host=4, idle_timeout=30.0, timeout=60.0):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = {}  # (host, ssl) -> [(connection, last_used), ...]
+        self._in_use = {}  # (host, ssl) -> number of checked out connections
+        self._cond = threading.Condition()
+
+    def newConnection(self, host, ssl):
+        if ssl:
+            return HTTPSConnection(host, timeout=self.timeout)
+        return HTTPConnection(host, timeout=self.timeout)
+
+    def evictIdle(self, now=None):
+        """Close connections that have been idle for too long"""
+        if now is None:
+            now = time.monotonic()
+        with self._cond:
+            for key, idle in list(self._idle.items()):
+                fresh = []
+                for conn, last_used in idle:
+                    if now - last_used > self.idle_timeout:
+                        conn.close()
+                    else:
+                        fresh.append((conn, last_used))
+                if fresh:
+                    self._idle[key] = fresh
+                else:
+                    del self._idle[key]
+
+    def acquire(self, host, ssl):
+        """
+        Check out a connection for (host, ssl), blocking while the host is
+        at its limit.  Returns (connection, reused).
+        """
+        key = (host, ssl)
+        self.evictIdle()
+        with self._cond:
+            while 1:
+                idle = self._idle.get(key)
+                if idle:
+                    conn = idle.pop()[0]  # most recently used is warmest
+                    if not idle:
+                        del self._idle[key]
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    return conn, 1
+                if self._in_use.get(key, 0) < self.max_per_host:
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                    break
+                self._cond.wait()
+        self.connections_opened += 1
+        return self.newConnection(host, ssl), 0
+
+    def release(self, host, ssl, conn, reusable=1):
+        """Return a connection to the pool, or close it"""
+        key = (host, ssl)
+        with self._cond:
+            self._in_use[key] -= 1
+            if reusable and conn.sock is not None:
+                self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            else:
+                conn.close()
+            self._cond.notify()
+
+    def sendBody(self, conn, ssl, body, length=None):
+        """
+        Send bytes as they are, and stream files and other iterables of
+        bytes in chunks.  Plain-HTTP file uploads go through sendfile so
+        the kernel copies straight from the file to the socket.
+
+        A file is sent up to length, its Content-Length; if it comes up
+        short, because it was truncated by a save while we were sending
+        it, BodyChanged is raised rather than leaving Zope waiting for
+        bytes that will never come.  A file that grew was still sent in
+        full, so Zope gets to answer; the save that grew it is uploaded
+        on its own.
+        """
+        if isinstance(body, bytes):
+            conn.send(body)
+        elif hasattr(body, "read"):
+            if not ssl and hasattr(body, "fileno"):
+                sent = conn.sock.sendfile(body, count=length)
+            else:
+                sent = 0
+                while length is None or sent < length:
+                    size = SEND_CHUNK_SIZE
+                    if length is not None:
+                        size = min(size, length - sent)
+                    chunk = body.read(size)
+                    if not chunk:
+                        break
+                    conn.send(chunk)
+                    sent += len(chunk)
+            if length is not None and sent < length:
+                raise BodyChanged("The file was saved over while it was sent")
+        else:
+            for chunk in body:
+                conn.send(chunk)
+
+    def request(self, host, ssl, method, path, headers=(), body=b"", sink=None):
+        """
+        Send one request over a pooled connection and return a
+        PooledResponse.  body may be bytes, a file opened for binary
+        reading or an iterable of bytes; the caller must send a
+        Content-Length header for it.  A request that fails on a reused
+        connection is retried once on a new one, as long as the body can
+        be rewound.
+
+        sink, if given, is called with each response once its status and
+        headers are in, and may return a file opened for binary writing
+        to stream the body into.
+        """
+        start = None
+        if hasattr(body, "seek"):
+            start = body.tell()
+        length = None
+        for header, value in headers:
+            if header.lower() == "content-length":
+                length = int(value)
+        retries = 0
+        while 1:
+            conn, reused = self.acquire(host, ssl)
+            response = None
+            try:
+                conn.putrequest(method, path)
+                for header, value in headers:
+                    conn.putheader(header, value)
+                conn.endheaders()
+                self.sendBody(conn, ssl, body, length)
+                response = conn.getresponse()
+                pooled = PooledResponse(response, sink)
+            except STALE_ERRORS:
+                self.release(host, ssl, conn, reusable=0)
+                if sink is not None and response is not None:
+                    raise  # Part of the body may be streamed, let the caller resume
+                if reused and isinstance(body, bytes):
+                    retries += 1
+                    continue
+                if reused and start is not None:
+                    body.seek(start)
+                    retries += 1
+                    continue
+                raise
+            except:
+                self.release(host, ssl, conn, reusable=0)
+                raise
+            self.release(host, ssl, conn, reusable=not response.will_close)
+            pooled.retries = retries
+            return pooled
+
+    def closeAll(self):
+        """Close every idle connection"""
+        with self._cond:
+            for idle in self._idle.values():
+                for conn, last_used in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+pool = ConnectionPool()
@@ -0,0 +1,234 @@
+#
+#  profiling.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+A profiler for the sync loop and the document open path that can be
+switched on and off while the app or daemon runs.
+
+The code worth looking at (opening documents, sync ticks, uploads) is
+wrapped in profiled() or profiler.section(), which cost an attribute
+lookup while profiling is off.  Switched on, the sections are recorded
+to the temporary directory in one of two modes:
+
+  calls   every section call slower than SLOW_CALL gets a cProfile
+          profile of its own, dumped to
+          zopeeditmanager-profiles/<section>-<time>-<n>.prof for pstats
+          or snakeviz
+  stacks  a thread samples the stacks of the threads inside a section
+          every SAMPLE_INTERVAL seconds and counts them, written to
+          zopeeditmanager-stacks.txt in the collapsed format that
+          flamegraph.pl and speedscope read.  Cheap enough to leave on
+          in a session with dozens of documents; time spent hashing,
+          in the PyObjC bridge or waiting on the network shows up under
+          the Python function making the call.
+"""
+
+from collections import Counter
+
+import contextlib
+import functools
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+
+MODES = ("calls", "stacks")
+
+# Calls quicker than this are not worth a profile of their own
+SLOW_CALL = 0.01
+
+SAMPLE_INTERVAL = 0.005
+
+# Seconds between rewrites of the stacks file while sampling
+DUMP_INTERVAL = 10.0
+
+
+class Profiler:
+    def __init__(self):
+        self.mode = None
+        self.directory = None
+        self.calls_dumped = 0
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sequence = itertools.count()
+        self._active = {}  # thread ident -> [section, nesting depth]
+        self._stacks = Counter()  # collapsed stack -> samples
+        self._labels = {}  # code object -> its frame in a collapsed stack
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def configure(self, mode, directory):
+        """Switch to mode (None for off), recording to directory"""
+        if mode is not None and mode not in MODES:
+            raise ValueError("unknown profile mode %r" % mode)
+        if mode == self.mode and directory == self.directory:
+            return
+        self.stop()
+        self.directory = directory
+        if mode == "stacks":
+            self._stacks.clear()
+            self._stop.clear()
+            self._sampler = threading.Thread(
+                target=self.run, name="Profiler", daemon=True
+            )
+            self._sampler.start()
+        self.mode = mode
+
+    def stop(self):
+        """Stop profiling, writing out what was sampled"""
+        self.mode = None
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+
+    def stacksFile(self):
+        return os.path.join(self.directory, "zopeeditmanager-stacks.txt")
+
+    def profilesDirectory(self):
+        return os.path.join(self.directory, "zopeeditmanager-profiles")
+
+    def enter(self, name):
+        """Start recording a section on this thread; returns a token for exit()"""
+        mode = self.mode
+        if mode == "calls":
+            if getattr(self._local, "profile", None) is not None:
+                return None  # Inside another section, whose profile has this
+            import cProfile
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                return None  # Another thread is being profiled (Python 3.12)
+            self._local.profile = profile
+            return (mode, name, profile, time.perf_counter())
+        if mode == "stacks":
+            ident = threading.get_ident()
+            with self._lock:
+                entry = self._active.setdefault(ident, [name, 0])
+                entry[1] += 1
+            return (mode, name, ident, None)
+        return None
+
+    def exit(self, token):
+        if token is None:
+            return
+        mode, name, detail, start = token
+        if mode == "calls":
+            detail.disable()
+            self._local.profile = None
+            if time.perf_counter() - start >= SLOW_CALL:
+                self.dumpCall(name, detail)
+        else:
+            with self._lock:
+                entry = self._active.get(detail)
+                if entry is not None:
+                    entry[1] -= 1
+                    if not entry[1]:
+                        del self._active[detail]
+
+    @contextlib.contextmanager
+    def section(self, name):
+        token = self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit(token)
+
+    def dumpCall(self, name, profile):
+        directory = self.profilesDirectory()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            profile.dump_stats(
+                os.path.join(
+                    directory,
+                    "%s-%s-%d.prof"
+                    % (
+                        re.sub(r"[^\w.]+", "_", name),
+                        time.strftime("%Y%m%d-%H%M%S"),
+                        next(self._sequence),
+                    ),
+                )
+            )
+            self.calls_dumped += 1
+        except OSError:
+            pass  # A diagnostic, never worth failing a sync
+
+    def label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = "%s (%s:%d)" % (
+                code.co_name,
+                os.path.basename(code.co_filename),
+                code.co_firstlineno,
+            )
+        return label
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            active = [(ident, entry[0]) for ident, entry in self._active.items()]
+        for ident, name in active:
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                stack.append(name)
+                self._stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def dumpStacks(self):
+        """Write the stacks sampled so far, replacing the last ones"""
+        if not self._stacks:
+            return
+        filename = self.stacksFile()
+        try:
+            with open(filename + ".new", "w", encoding="utf8") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write("%s %d\n" % (stack, count))
+            os.replace(filename + ".new", filename)
+        except OSError:
+            pass
+
+    def run(self):
+        dumped = self.samples
+        next_dump = time.monotonic() + DUMP_INTERVAL
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            if self._active:
+                self.sample()
+            if time.monotonic() >= next_dump:
+                if self.samples != dumped:
+                    self.dumpStacks()
+                    dumped = self.samples
+                next_dump = time.monotonic() + DUMP_INTERVAL
+        self.dumpStacks()
+
+
+profiler = Profiler()
+
+
+def profiled(fn):
+    """Record calls to fn as a section named after it, while profiling"""
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kw):
+        if profiler.mode is None:
+            return fn(*args, **kw)
+        token = profiler.enter(name)
+        try:
+            return fn(*args, **kw)
+        finally:
+            profiler.exit(token)
+
+    return wrapper
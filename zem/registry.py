@@ -0,0 +1,96 @@
+#
+#  registry.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+from zem.ui import UI
+
+
+class DocumentRegistry:
+    """
+    The documents being edited, in the order they were opened, which is
+    also the order of the rows in the app's table.
+
+    There is at most one document per Zope object, looked up by (host,
+    path) or by content file in constant time.  The table's cell values
+    are worked out once per document, and the UI is told which rows came
+    and went instead of reloading everything, so thousands of tracked
+    objects stay cheap to draw.
+    """
+
+    def __init__(self, ui=None):
+        self.ui = ui or UI()
+        self._docs = []
+        self._rows = {}  # doc -> its row
+        self._by_object = {}  # (host, path) -> doc
+        self._by_content_file = {}
+        self._values = {}  # doc -> {column identifier: cell value}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __iter__(self):
+        # Over a copy, as documents are often closed while iterating
+        return iter(list(self._docs))
+
+    def __contains__(self, doc):
+        return doc in self._rows
+
+    def __getitem__(self, row):
+        return self._docs[row]
+
+    def get(self, host, path):
+        """The document for the object at host and path, or None"""
+        return self._by_object.get((host, path))
+
+    def byContentFile(self, content_file):
+        return self._by_content_file.get(content_file)
+
+    def row(self, doc):
+        return self._rows[doc]
+
+    def value(self, row, column):
+        """The table cell for doc's column, e.g. "Editor" for getEditor()"""
+        values = self._values[self._docs[row]]
+        if column not in values:
+            values[column] = getattr(self._docs[row], "get" + column)()
+        return values[column]
+
+    def add(self, doc):
+        """
+        Track doc, unless we already edit its object.  Returns the
+        document that is tracked: doc, or the one that was there first.
+        """
+        existing = self._by_object.get((doc.host, doc.path))
+        if existing is not None:
+            return existing
+        self._rows[doc] = len(self._docs)
+        self._docs.append(doc)
+        self._by_object[(doc.host, doc.path)] = doc
+        self._by_content_file[doc.getContentFile()] = doc
+        self._values[doc] = {}
+        self.ui.documentsAdded([self._rows[doc]])
+        return doc
+
+    def remove(self, doc):
+        self.removeAll([doc])
+
+    def removeAll(self, docs):
+        """Stop tracking docs, in one pass however many there are"""
+        gone = set(doc for doc in docs if doc in self._rows)
+        if not gone:
+            return
+        rows = sorted(self._rows[doc] for doc in gone)
+        for doc in gone:
+            del self._rows[doc]
+            del self._values[doc]
+            if self._by_object.get((doc.host, doc.path)) is doc:
+                del self._by_object[(doc.host, doc.path)]
+            if self._by_content_file.get(doc.getContentFile()) is doc:
+                del self._by_content_file[doc.getContentFile()]
+        self._docs = [doc for doc in self._docs if doc not in gone]
+        for row in range(rows[0], len(self._docs)):
+            self._rows[self._docs[row]] = row
+        self.ui.documentsRemoved(rows)
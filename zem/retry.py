@@ -0,0 +1,113 @@
+#
+#  retry.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+import random
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class RetryPolicy:
+    """
+    How often and how patiently a failed request is tried again.
+
+    Connection failures (status 0), 408, 423 (locked by someone else for
+    the moment), 429 and server errors other than 501 and 505 are worth
+    another attempt; anything else is final.  Attempts are spaced with
+    exponential backoff and full jitter, so documents that failed
+    together do not retry in lockstep.
+    """
+
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=8.0, sleep=time.sleep):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    def retryable(self, status):
+        if status == 0 or status in (408, 423, 429):
+            return 1
+        return 500 <= status < 600 and status not in (501, 505)
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (0 based)"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass  # An HTTP date, not worth parsing
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a host that keeps failing.
+
+    After threshold consecutive failures the breaker opens and every
+    request is refused without touching the network.  Once
+    reset_timeout seconds have passed a single probe request is let
+    through: if it succeeds the breaker closes again, if not it stays
+    open for another reset_timeout.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a request may go out now"""
+        with self._lock:
+            if self.state == CLOSED:
+                return 1
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return 0
+                self.state = HALF_OPEN
+                return 1  # The caller is the probe
+            return 0  # A probe is already out
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state = CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class Breakers:
+    """One CircuitBreaker per Zope host"""
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(self.threshold, self.reset_timeout)
+                self._breakers[host] = breaker
+            return breaker
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+
+
+policy = RetryPolicy()
+breakers = Breakers()
@@ -0,0 +1,157 @@
+#
+#  settings.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Where the core reads its preferences from.
+
+The app wraps NSUserDefaults in a Settings subclass; headless tools use
+DictSettings, usually seeded from the preferences plist the app ships
+with.  The key names are the ones documented in the README.
+
+Both are read through a LiveSettings, which hands out an immutable
+Snapshot of the preferences taken when they last changed, so hot paths
+never go back to NSUserDefaults.
+"""
+
+from types import MappingProxyType
+
+from zem.helpers import HelperIndex
+
+import os
+import plistlib
+
+DEFAULTS_PLIST = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "Resources",
+    "com.urbanape.zopeeditmanager.plist",
+)
+
+
+class Settings:
+    """The interface the core expects; subclasses implement getObject"""
+
+    def getObject(self, key):
+        raise NotImplementedError
+
+    def getBool(self, key):
+        return bool(self.getObject(key))
+
+    def getString(self, key):
+        value = self.getObject(key)
+        if isinstance(value, str):
+            return value
+        return None
+
+    def getFloat(self, key):
+        return float(self.getObject(key) or 0.0)
+
+    def getInt(self, key):
+        return int(self.getObject(key) or 0)
+
+    def getDict(self, key):
+        return self.getObject(key) or {}
+
+
+# The preferences a Snapshot copies, and the getter that types each one
+PREFERENCES = {
+    "always_borrow_locks": "getBool",
+    "cleanup_files": "getBool",
+    "confirm_on_finish": "getBool",
+    "helper_apps": "getDict",
+    "lock_timeout": "getInt",
+    "metrics_port": "getInt",
+    "poll_interval": "getFloat",
+    "profile": "getString",
+    "quiet_window": "getFloat",
+    "record_trace": "getBool",
+    "save_interval": "getFloat",
+    "temp_dir": "getString",
+    "use_locks": "getBool",
+}
+
+
+class Snapshot(Settings):
+    """
+    The preferences as they were when it was taken from another
+    Settings, already typed and read-only: reading one is a dictionary
+    lookup, and the helper_apps index is compiled once with it.
+    Preferences that were not set read as None, as getObject would have
+    returned; getters of other keys return their empty value.
+    """
+
+    __slots__ = ("values", "helper_index")
+
+    def __init__(self, source):
+        values = {}
+        for key, getter in PREFERENCES.items():
+            if source.getObject(key) is not None:
+                values[key] = getattr(source, getter)(key)
+        if "helper_apps" in values:
+            values["helper_apps"] = MappingProxyType(
+                {
+                    str(key): MappingProxyType(dict(options))
+                    for key, options in values["helper_apps"].items()
+                }
+            )
+        object.__setattr__(self, "values", MappingProxyType(values))
+        object.__setattr__(
+            self, "helper_index", HelperIndex(values.get("helper_apps", {}))
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("settings snapshots are read-only")
+
+    def getObject(self, key):
+        return self.values.get(key)
+
+
+class LiveSettings(Settings):
+    """
+    Settings shared by the sync loop and every document, reading the
+    current Snapshot of source.  reload() takes a new snapshot and
+    swaps it in with a single assignment, so a reader on any thread
+    sees either the old preferences or the new ones, never a mixture
+    of both within one lookup.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.snapshot = Snapshot(source)
+
+    def reload(self, source=None):
+        """Take a new snapshot, of source from now on if given"""
+        if source is not None:
+            self.source = source
+        self.snapshot = Snapshot(self.source)
+        return self.snapshot
+
+    @property
+    def helper_index(self):
+        return self.snapshot.helper_index
+
+    def getObject(self, key):
+        return self.snapshot.values.get(key)
+
+
+class DictSettings(Settings):
+    def __init__(self, values=None, **overrides):
+        self.values = dict(values or {})
+        self.values.update(overrides)
+
+    @classmethod
+    def fromPlist(cls, filename=DEFAULTS_PLIST, **overrides):
+        """Settings read from a preferences plist, the bundled one by default"""
+        with open(filename, "rb") as f:
+            return cls(plistlib.load(f), **overrides)
+
+    def getObject(self, key):
+        return self.values.get(key)
+
+    def setObject(self, key, value):
+        self.values[key] = value
+        if key == "helper_apps":
+            self.__dict__.pop("_helper_index", None)
@@ -0,0 +1,365 @@
+#
+#  sync.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+from collections import deque
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+SUPERSEDED = "superseded"
+
+
+class WorkerPool:
+    """
+    Run calls on up to `workers` threads, started as they are needed.
+
+    The part of ThreadPoolExecutor we use, on daemon threads: the
+    interpreter waits for the executor's threads before it exits, so a
+    request stuck on a server that stopped answering would hold up
+    quitting however little we waited for it ourselves.
+    """
+
+    def __init__(self, workers, name):
+        self.workers = workers
+        self.name = name
+        self._queue = queue.SimpleQueue()  # (fn, args), None to stop a worker
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._shutdown = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("%s is shut down" % self.name)
+            self._queue.put((fn, args))
+            if self._idle.acquire(timeout=0):
+                return  # A worker is waiting for it
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work,
+                    name="%s_%d" % (self.name, len(self._threads)),
+                    daemon=True,
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def map(self, fn, items):
+        """fn(item) for each of items on the workers, as a list in order"""
+        items = list(items)
+        results = [None] * len(items)
+        errors = []
+        left = [len(items)]
+        finished = threading.Event()
+
+        def call(index, item):
+            try:
+                results[index] = fn(item)
+            except Exception as e:
+                errors.append(e)
+            with self._lock:
+                left[0] -= 1
+                if not left[0]:
+                    finished.set()
+
+        if not items:
+            return results
+        for index, item in enumerate(items):
+            self.submit(call, index, item)
+        finished.wait()
+        if errors:
+            raise errors[0]
+        return results
+
+    def _work(self):
+        while 1:
+            work = self._queue.get()
+            if work is None:
+                return
+            fn, args = work
+            fn(*args)
+            self._idle.release()
+
+    def shutdown(self, wait=True):
+        """
+        Stop the workers once they have run what was submitted, waiting
+        for them unless wait is false
+        """
+        with self._lock:
+            self._shutdown = 1
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+class SyncEngine:
+    """
+    Run uploads on a bounded pool of worker threads.
+
+    Jobs are queued per key (one key per document): jobs for different
+    keys run concurrently, jobs for the same key run one at a time in
+    the order they were submitted.  done(key, result, error) is called
+    on the worker thread once each job finishes; callers that need the
+    main thread have to hop over to it themselves.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._executor = None  # Started with the first job
+        self._lock = threading.Condition()
+        self._jobs = {}  # key -> deque of (job, done)
+
+    def submit(self, key, job, done=None, replace=False):
+        """
+        Queue job for key.  With replace, jobs for key that have not
+        started yet are dropped in favour of this one, and their done is
+        called straight away with the result SUPERSEDED.
+        """
+        dropped = ()
+        with self._lock:
+            jobs = self._jobs.get(key)
+            if jobs is not None:
+                # A worker is already draining this key, it will get to it
+                if replace:
+                    dropped = list(jobs)
+                    jobs.clear()
+                jobs.append((job, done))
+            else:
+                self._jobs[key] = deque([(job, done)])
+                if self._executor is None:
+                    self._executor = WorkerPool(self.workers, "SyncEngine")
+        for job, done in dropped:
+            if done is not None:
+                done(key, SUPERSEDED, None)
+        if jobs is None:
+            self._executor.submit(self._drain, key)
+
+    def busy(self, key):
+        with self._lock:
+            return key in self._jobs
+
+    def _drain(self, key):
+        while 1:
+            with self._lock:
+                jobs = self._jobs[key]
+                if not jobs:
+                    del self._jobs[key]
+                    self._lock.notify_all()
+                    return
+                job, done = jobs.popleft()
+            result = error = None
+            try:
+                result = job()
+            except Exception as e:
+                error = e
+            if done is not None:
+                done(key, result, error)
+
+    def shutdown(self, timeout=None):
+        """
+        Wait for the queued jobs to finish, at most timeout seconds if
+        given, and stop the workers.  Jobs that have not started by then
+        are dropped without calling their done, and those still running
+        are left to finish on their own.  Returns the keys whose jobs did
+        not all finish.
+        """
+        with self._lock:
+            self._lock.wait_for(lambda: not self._jobs, timeout)
+            unfinished = list(self._jobs)
+            for key in unfinished:
+                self._jobs[key].clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=not unfinished)
+        return unfinished
+
+
+class Coalescer:
+    """
+    Collapse bursts of events per key into one.
+
+    fire(key) is called on the coalescer's own thread once quiet seconds
+    have passed without another touch(key), so a burst of saves becomes
+    a single call after the last of them.  With a quiet window of 0,
+    fire is called straight from touch().
+    """
+
+    def __init__(self, fire, quiet=1.0):
+        self.fire = fire
+        self.quiet = quiet
+        self.coalesced = 0
+        self._cond = threading.Condition()
+        self._deadlines = {}  # key -> when it may fire
+        self._thread = None
+        self._running = 0
+
+    def touch(self, key):
+        if self.quiet <= 0:
+            self.fire(key)
+            return
+        with self._cond:
+            if key in self._deadlines:
+                self.coalesced += 1
+            self._deadlines[key] = time.monotonic() + self.quiet
+            if self._thread is None:
+                self._running = 1
+                self._thread = threading.Thread(
+                    target=self.run, name="Coalescer", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._deadlines.pop(key, None)
+
+    def pending(self, key):
+        """True while key is waiting to fire"""
+        with self._cond:
+            return key in self._deadlines
+
+    def run(self):
+        while 1:
+            with self._cond:
+                while self._running:
+                    now = time.monotonic()
+                    due = [k for k, t in self._deadlines.items() if t <= now]
+                    if due:
+                        for key in due:
+                            del self._deadlines[key]
+                        break
+                    if self._deadlines:
+                        self._cond.wait(min(self._deadlines.values()) - now)
+                    else:
+                        self._cond.wait()
+                else:
+                    return
+            for key in due:
+                self.fire(key)
+
+    def stop(self):
+        """Stop waiting, and return the keys that had not fired yet"""
+        with self._cond:
+            self._running = 0
+            pending = list(self._deadlines)
+            self._deadlines.clear()
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return pending
+
+
+class DueScheduler:
+    """
+    Hand out keys from one thread as they fall due.
+
+    Keys sit in a heap ordered by when they are due.  The thread sleeps
+    until the earliest one is due and then passes every key due within
+    the next `window` seconds to process(batch) in the same wakeup, so
+    keys scheduled at about the same time cost a handful of wakeups
+    rather than a timer each.  Subclasses implement process() and run
+    the batch on pool(), a few workers started with the first batch.
+    """
+
+    def __init__(self, name, window, workers=4):
+        self.name = name
+        self.window = window
+        self.wakeups = 0
+        self.workers = workers
+        self._executor = None  # Started with the first batch
+        self._cond = threading.Condition()
+        self._heap = []  # [due, sequence, key], key is None once removed
+        self._entries = {}  # key -> its live heap entry
+        self._sequence = itertools.count()
+        self._thread = None
+        self._running = 0
+
+    def _start(self):
+        """Start the thread if it is not running, with _cond held"""
+        if self._thread is None:
+            self._running = 1
+            self._thread = threading.Thread(
+                target=self.run, name=self.name, daemon=True
+            )
+            self._thread.start()
+
+    def _schedule(self, key, due):
+        self._unschedule(key)
+        entry = [due, next(self._sequence), key]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        self._cond.notify()
+
+    def _unschedule(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def _takeDue(self):
+        """Wait for keys to fall due and pop them, [] when stopped"""
+        with self._cond:
+            while self._running:
+                while self._heap and self._heap[0][-1] is None:
+                    heapq.heappop(self._heap)
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            else:
+                return []
+
+            self.wakeups += 1
+            batch = []
+            horizon = time.monotonic() + self.window
+            while self._heap and self._heap[0][0] <= horizon:
+                entry = heapq.heappop(self._heap)
+                key = entry[-1]
+                if key is not None:
+                    del self._entries[key]
+                    batch.append(key)
+            return batch
+
+    def pool(self):
+        if self._executor is None:
+            self._executor = WorkerPool(self.workers, self.name)
+        return self._executor
+
+    def process(self, batch):
+        raise NotImplementedError
+
+    def run(self):
+        while 1:
+            batch = self._takeDue()
+            if not batch:
+                return
+            self.process(batch)
+
+    def stop(self, timeout=None):
+        """
+        Stop the thread, waiting at most timeout seconds if given for the
+        batch it is working on
+        """
+        with self._cond:
+            self._running = 0
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
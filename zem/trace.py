@@ -0,0 +1,137 @@
+#
+#  trace.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+An opt-in recording of the sync traffic, to find out afterwards why
+syncing was slow for someone, and to replay it offline.
+
+While started, every document opened and closed, every change to a
+content file the sync loop noticed, and every request made to Zope
+(method, path, headers, bytes each way, status, seconds taken and
+retries) is written as one line of JSON to a file that is rotated once
+it grows past max_bytes.  Credentials never make it into the trace:
+Authorization and Cookie headers are left out and lock tokens masked.
+benchmarks/replay_trace.py re-drives a trace against the stand-in server.
+"""
+
+import json
+import os
+import threading
+import time
+
+# Rotate the trace once it is this big, keeping this many old ones as
+# trace.1 (the newest) to trace.N
+MAX_BYTES = 8 * 1024 * 1024
+BACKUPS = 3
+
+SECRET_HEADERS = ("authorization", "cookie")
+TOKEN_HEADERS = ("if", "lock-token")
+
+
+def cleanHeaders(headers):
+    """headers, (name, value) pairs, as a dict fit for writing down"""
+    cleaned = {}
+    for name, value in headers:
+        if name.lower() in SECRET_HEADERS:
+            continue
+        if name.lower() in TOKEN_HEADERS:
+            value = "<token>"
+        cleaned[name] = value
+    return cleaned
+
+
+class Tracer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self.filename = None
+        self.max_bytes = MAX_BYTES
+        self.backups = BACKUPS
+
+    @property
+    def enabled(self):
+        return self._file is not None
+
+    def start(self, filename, max_bytes=MAX_BYTES, backups=BACKUPS):
+        """Start appending to filename, which only we can read"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.filename = filename
+            self.max_bytes = max_bytes
+            self.backups = backups
+            self._file = self.open()
+
+    def open(self):
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        # Line buffered, so a crash loses nothing written so far
+        return os.fdopen(fd, "a", buffering=1, encoding="utf8")
+
+    def stop(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+
+    def rotate(self):
+        self._file.close()
+        for n in range(self.backups - 1, 0, -1):
+            older = "%s.%d" % (self.filename, n)
+            if os.path.exists(older):
+                os.replace(older, "%s.%d" % (self.filename, n + 1))
+        if self.backups:
+            os.replace(self.filename, self.filename + ".1")
+        else:
+            os.remove(self.filename)
+        self._file = self.open()
+
+    def write(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                return  # Stopped since the caller looked
+            try:
+                if self._file.closed:
+                    self._file = self.open()  # The last rotation failed
+                if self._file.tell() + len(line) > self.max_bytes:
+                    self.rotate()
+                self._file.write(line)
+            except OSError:
+                pass  # A full disk loses the record, never the request
+
+    def document(self, event, doc, size=None):
+        """Record doc being opened, changed (its content file) or closed"""
+        if self._file is None:
+            return
+        record = {"t": round(time.time(), 3), "ev": event, "doc": doc.path}
+        if size is not None:
+            record["size"] = size
+        if event == "open":
+            record["type"] = doc.metadata.get("content_type", "text/plain")
+        self.write(record)
+
+    def request(self, path, method, headers, sent, received, status, seconds, retries):
+        """Record a request made to Zope, as it went out and came back"""
+        if self._file is None:
+            return
+        self.write(
+            {
+                "t": round(time.time() - seconds, 3),
+                "ev": "req",
+                "doc": path,
+                "m": method,
+                "h": cleanHeaders(headers),
+                "sent": sent,
+                "recv": received,
+                "s": status,
+                "d": round(seconds, 4),
+                "r": retries,
+            }
+        )
+
+
+trace = Tracer()
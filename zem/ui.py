@@ -0,0 +1,50 @@
+#
+#  ui.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+import sys
+
+
+class UI:
+    """
+    What the core asks of a user interface.  This base class is the
+    headless one: it logs to stderr and answers every question with the
+    alternate (cancelling) button, so nothing ever waits for a person.
+    """
+
+    def log(self, message):
+        sys.stderr.write("%s\n" % message)
+
+    def ask(self, title, message, default="OK", alternate=None):
+        """Put a question to the user; true if they chose default"""
+        self.log("%s: %s" % (title, message))
+        return 0
+
+    def fatal(self, message):
+        """Report an error we cannot carry on from, and exit"""
+        self.log("Fatal Error: %s" % message)
+        sys.exit(1)
+
+    def uploadsStarted(self):
+        """The first of a batch of uploads was queued"""
+
+    def uploadsFinished(self):
+        """The last queued upload finished"""
+
+    def documentSynced(self, doc, result):
+        """
+        doc finished syncing; result is uploaded, skipped or failed, or
+        refreshed or conflict when polling found it changed in Zope
+        """
+
+    def bodyFetched(self, doc):
+        """The body of doc, whose .zem file came without it, has arrived"""
+
+    def documentsAdded(self, rows):
+        """Documents were added to the registry at rows"""
+
+    def documentsRemoved(self, rows):
+        """The documents at rows (before removal) left the registry"""
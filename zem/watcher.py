@@ -0,0 +1,311 @@
+#
+#  watcher.py
+#  ZopeEditManager
+#
+#  Copyright (c) 2004 Zope Foundation and Contributors.
+#
+
+"""
+Push notifications for changes to the content files being edited.
+
+A watcher runs on its own thread and calls callback(path) whenever one
+of the watched files is written.  The directory holding each file is
+watched as well, so editors that save by writing a new file and renaming
+it over the old one are noticed too.  createWatcher() picks the best
+backend for the platform, or returns None when there is none, in which
+case the caller has to fall back to polling.
+"""
+
+import ctypes
+import os
+import select
+import struct
+import sys
+import threading
+
+
+class Watcher:
+    """Bookkeeping shared by the backends: which files live in which dirs"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._dirs = {}  # directory -> set of watched file names
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._thread = None
+
+    def watch(self, path):
+        """
+        Start watching path.  Raises OSError, watching nothing new, when
+        the backend runs out of file descriptors or watches.
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        with self._lock:
+            names = self._dirs.get(directory)
+            if names is None:
+                self.addDirectory(directory)
+                names = self._dirs[directory] = set()
+            try:
+                self.addFile(os.path.join(directory, name))
+            except OSError:
+                if not names:
+                    del self._dirs[directory]
+                    self.removeDirectory(directory)
+                raise
+            names.add(name)
+
+    def unwatch(self, path):
+        directory, name = os.path.split(os.path.abspath(path))
+        with self._lock:
+            names = self._dirs.get(directory)
+            if names is None or name not in names:
+                return
+            names.discard(name)
+            self.removeFile(os.path.join(directory, name))
+            if not names:
+                del self._dirs[directory]
+                self.removeDirectory(directory)
+
+    def watched(self, directory, name=None):
+        """Watched paths in directory, optionally only the named one"""
+        with self._lock:
+            names = self._dirs.get(directory, ())
+            if name is not None:
+                names = name in names and [name] or []
+            return [os.path.join(directory, n) for n in names]
+
+    def allWatched(self):
+        with self._lock:
+            return [
+                os.path.join(directory, name)
+                for directory, names in self._dirs.items()
+                for name in names
+            ]
+
+    def notify(self, paths):
+        for path in paths:
+            self.callback(path)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name=self.__class__.__name__, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        os.write(self._wakeup_w, b"x")
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def addDirectory(self, directory):
+        pass
+
+    def removeDirectory(self, directory):
+        pass
+
+    def addFile(self, path):
+        pass
+
+    def removeFile(self, path):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher(Watcher):
+    """Linux backend, one inotify watch per content file directory"""
+
+    available = sys.platform.startswith("linux")
+
+    def __init__(self, callback):
+        Watcher.__init__(self, callback)
+        # The C library the interpreter is linked against; looking it up
+        # with ctypes.util.find_library would run ldconfig
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wds = {}  # watch descriptor -> directory
+        self._dir_wds = {}  # directory -> watch descriptor
+
+    def addDirectory(self, directory):
+        wd = self._libc.inotify_add_watch(
+            self._fd,
+            os.fsencode(directory),
+            IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR,
+        )
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", directory)
+        self._wds[wd] = directory
+        self._dir_wds[directory] = wd
+
+    def removeDirectory(self, directory):
+        wd = self._dir_wds.pop(directory, None)
+        if wd is not None:
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def run(self):
+        while 1:
+            readable = select.select([self._fd, self._wakeup_r], [], [])[0]
+            if self._wakeup_r in readable:
+                break
+            data = os.read(self._fd, 65536)
+            changed = []
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped, so anything may have changed
+                    changed.extend(self.allWatched())
+                elif not mask & IN_IGNORED and wd in self._wds:
+                    changed.extend(self.watched(self._wds[wd], os.fsdecode(name)))
+            self.notify(sorted(set(changed)))
+        os.close(self._fd)
+
+
+class KqueueWatcher(Watcher):
+    """
+    macOS/BSD backend.  Each file is watched for writes; its directory is
+    watched for entries being added or renamed, which is how an atomic
+    save shows up.
+    """
+
+    available = hasattr(select, "kqueue")
+
+    def __init__(self, callback):
+        Watcher.__init__(self, callback)
+        self._kq = select.kqueue()
+        self._idents = {}  # fd -> (directory, name), name is None for dirs
+        self._dir_fds = {}  # directory -> fd
+        self._file_fds = {}  # path -> (fd, inode)
+        self.register(self._wakeup_r, select.KQ_FILTER_READ, 0)
+
+    def register(self, fd, kq_filter, fflags):
+        self._kq.control(
+            [
+                select.kevent(
+                    fd,
+                    filter=kq_filter,
+                    flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                    fflags=fflags,
+                )
+            ],
+            0,
+        )
+
+    def openEvents(self, path):
+        return os.open(path, getattr(os, "O_EVTONLY", os.O_RDONLY))
+
+    def addDirectory(self, directory):
+        fd = self.openEvents(directory)
+        self._dir_fds[directory] = fd
+        self._idents[fd] = (directory, None)
+        self.register(fd, select.KQ_FILTER_VNODE, select.KQ_NOTE_WRITE)
+
+    def removeDirectory(self, directory):
+        fd = self._dir_fds.pop(directory, None)
+        if fd is not None:
+            del self._idents[fd]
+            os.close(fd)
+
+    def addFile(self, path):
+        if path in self._file_fds:
+            return
+        try:
+            fd = self.openEvents(path)
+        except FileNotFoundError:
+            return  # Mid-rename, the directory event will pick it up
+        self._file_fds[path] = (fd, os.fstat(fd).st_ino)
+        self._idents[fd] = os.path.split(path)
+        self.register(
+            fd,
+            select.KQ_FILTER_VNODE,
+            select.KQ_NOTE_WRITE
+            | select.KQ_NOTE_EXTEND
+            | select.KQ_NOTE_DELETE
+            | select.KQ_NOTE_RENAME,
+        )
+
+    def removeFile(self, path):
+        fd = self._file_fds.pop(path, (None, None))[0]
+        if fd is not None:
+            del self._idents[fd]
+            os.close(fd)
+
+    def replaced(self, path):
+        """Reopen path if another file was renamed over it"""
+        fd, inode = self._file_fds.get(path, (None, None))
+        try:
+            current = os.stat(path).st_ino
+        except OSError:
+            current = None
+        if current == inode:
+            return 0
+        self.removeFile(path)
+        try:
+            self.addFile(path)
+        except OSError:
+            pass  # Out of descriptors, its directory still tells us
+        return current is not None
+
+    def run(self):
+        while 1:
+            events = self._kq.control(None, 64, None)
+            changed = set()
+            stop = 0
+            with self._lock:
+                for event in events:
+                    if event.ident == self._wakeup_r:
+                        stop = 1
+                        continue
+                    directory, name = self._idents.get(event.ident, (None, None))
+                    if directory is None:
+                        continue
+                    if name is None:
+                        for path in self._watchedLocked(directory):
+                            if self.replaced(path):
+                                changed.add(path)
+                        continue
+                    path = os.path.join(directory, name)
+                    if event.fflags & (select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME):
+                        if self.replaced(path):
+                            changed.add(path)
+                    else:
+                        changed.add(path)
+            if stop:
+                break
+            self.notify(sorted(changed))
+        self._kq.close()
+
+    def _watchedLocked(self, directory):
+        names = self._dirs.get(directory, ())
+        return [os.path.join(directory, name) for name in names]
+
+
+BACKENDS = [InotifyWatcher, KqueueWatcher]
+
+
+def createWatcher(callback):
+    """Start and return the best available watcher, or None"""
+    for backend in BACKENDS:
+        if backend.available:
+            try:
+                return backend(callback).start()
+            except OSError:
+                continue
+    return None